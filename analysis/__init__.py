@@ -1,11 +1,15 @@
 # Analysis modülü
-from .inventory_analysis import analyze_inventory, is_balanced
+from .inventory_analysis import (analyze_inventory, compact_frame, is_balanced, balanced_mask, prepare_detection_frame,
+                                 insert_store_column, count_flagged_products, code_key, code_text,
+                                 build_code_index)
 from .internal_theft import detect_internal_theft
-from .chronic_analysis import detect_chronic_products, detect_chronic_fire
-from .cigarette_analysis import detect_cigarette_shortage
+from .chronic_analysis import (detect_chronic_products, detect_chronic_fire, detect_chronic_history,
+                               chronic_mask, chronic_fire_mask)
+from .cigarette_analysis import detect_cigarette_shortage, detect_cigarette_shortage_by_store, sigara_net_by_store
 from .family_analysis import find_product_families
-from .fire_manipulation import detect_fire_manipulation
-from .external_theft import detect_external_theft
-from .kasa_activity import check_kasa_activity_products, load_kasa_activity_codes
-from .region_analysis import analyze_region, generate_executive_summary
-from .risk_calculator import calculate_store_risk, create_top_20_risky
+from .fire_manipulation import detect_fire_manipulation, fire_manipulation_mask
+from .external_theft import detect_external_theft, external_theft_mask
+from .kasa_activity import check_kasa_activity_products, load_kasa_activity_codes, KASA_KOD_INDEX
+from .detector_engine import run_detectors
+from .region_analysis import analyze_region, generate_executive_summary, add_period_deltas
+from .risk_calculator import calculate_store_risk, create_top_20_risky, score_store_risk, get_risk_level
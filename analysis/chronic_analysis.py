@@ -1,67 +1,168 @@
 # ==================== CHRONIC ANALYSIS ====================
 # Kronik açık ve kronik fire tespiti
 
+import numpy as np
 import pandas as pd
-from .inventory_analysis import is_balanced
+from config import KRONIK_THRESHOLD
+from .inventory_analysis import insert_store_column
+from .detector_engine import dedektor, run_detectors
+
+
+def chronic_mask(df):
+    """Kronik açık maskesi (hazırlanmış frame): her iki dönemde Fark < 0 VE dengelenmemiş"""
+    return ~df['_dengeli'] & (df['Önceki Fark Miktarı'] < 0) & (df['Fark Miktarı'] < 0)
+
+
+def chronic_fire_mask(df):
+    """Kronik fire maskesi (hazırlanmış frame): her iki dönemde fire var VE dengelenmemiş"""
+    onceki_fire = df['Önceki Fire Miktarı'] if 'Önceki Fire Miktarı' in df.columns else 0
+    onceki_fark = df['Önceki Fark Miktarı'] if 'Önceki Fark Miktarı' in df.columns else 0
+    return (onceki_fire != 0) & (df['Fire Miktarı'] != 0) & ~((onceki_fark + df['Fark Miktarı']).abs() <= 0.01)
 
 
 def detect_chronic_products(df):
-    """Kronik açık - her iki dönemde de Fark < 0"""
-    results = []
-    
-    for idx, row in df.iterrows():
-        if is_balanced(row):
-            continue
-        
-        if row['Önceki Fark Miktarı'] < 0 and row['Fark Miktarı'] < 0:
-            results.append({
-                'Malzeme Kodu': row.get('Malzeme Kodu', ''),
-                'Malzeme Adı': row.get('Malzeme Adı', ''),
-                'Ürün Grubu': row.get('Mal Grubu Tanımı', row.get('Ürün Grubu', '')),
-                'Bu Dönem Fark': row['Fark Miktarı'],
-                'Bu Dönem Tutar': row['Fark Tutarı'],
-                'Önceki Fark': row['Önceki Fark Miktarı'],
-                'Önceki Tutar': row['Önceki Fark Tutarı'],
-                'Toplam Tutar': row['Fark Tutarı'] + row['Önceki Fark Tutarı']
-            })
-    
-    result_df = pd.DataFrame(results)
-    if len(result_df) > 0:
-        result_df = result_df.drop_duplicates(subset=['Malzeme Kodu'], keep='first')
-        result_df = result_df.sort_values('Bu Dönem Tutar', ascending=True)
+    """Kronik açık tablosu - run_detectors sarmalayıcısı (bkz. chronic_table)"""
+    return run_detectors(df, sadece=['kronik'])['kronik']
+
+
+def detect_chronic_fire(df):
+    """Kronik fire tablosu - run_detectors sarmalayıcısı (bkz. chronic_fire_table)"""
+    return run_detectors(df, sadece=['kronik_fire'])['kronik_fire']
+
+
+@dedektor('kronik')
+def chronic_table(df):
+    """
+    Kronik açık (hazırlanmış frame) - her iki dönemde de Fark < 0
+    Çok mağazalı frame'de 'Mağaza Kodu' ilk kolon olur, duplicate temizliği mağaza bazında.
+    """
+    if len(df) == 0:
+        return pd.DataFrame()
+    
+    mask = chronic_mask(df)
+    if not mask.any():
+        return pd.DataFrame()
+    
+    result_df = pd.DataFrame({
+        'Malzeme Kodu': df.loc[mask, 'Malzeme Kodu'] if 'Malzeme Kodu' in df.columns else '',
+        'Malzeme Adı': df.loc[mask, 'Malzeme Adı'] if 'Malzeme Adı' in df.columns else '',
+        'Ürün Grubu': df.loc[mask, '_urun_grubu'],
+        'Bu Dönem Fark': df.loc[mask, 'Fark Miktarı'],
+        'Bu Dönem Tutar': df.loc[mask, 'Fark Tutarı'],
+        'Önceki Fark': df.loc[mask, 'Önceki Fark Miktarı'],
+        'Önceki Tutar': df.loc[mask, 'Önceki Fark Tutarı'],
+        'Toplam Tutar': df.loc[mask, 'Fark Tutarı'] + df.loc[mask, 'Önceki Fark Tutarı']
+    }, index=df.index[mask])
+    
+    result_df, dup_key = insert_store_column(result_df, df, mask)
+    result_df = result_df.reset_index(drop=True)
+    result_df = result_df.drop_duplicates(subset=dup_key, keep='first')
+    result_df = result_df.sort_values('Bu Dönem Tutar', ascending=True)
     
     return result_df
 
 
-def detect_chronic_fire(df):
-    """Kronik Fire - her iki dönemde de fire var VE dengelenmemiş"""
-    results = []
-    
-    for idx, row in df.iterrows():
-        onceki_fire = row.get('Önceki Fire Miktarı', 0) or 0
-        bu_fire = row['Fire Miktarı']
-        
-        if onceki_fire != 0 and bu_fire != 0:
-            onceki_fark = row.get('Önceki Fark Miktarı', 0) or 0
-            bu_fark = row['Fark Miktarı']
-            
-            if abs(onceki_fark + bu_fark) <= 0.01:
-                continue
-            
-            results.append({
-                'Malzeme Kodu': row.get('Malzeme Kodu', ''),
-                'Malzeme Adı': row.get('Malzeme Adı', ''),
-                'Ürün Grubu': row.get('Mal Grubu Tanımı', row.get('Ürün Grubu', '')),
-                'Bu Dönem Fire': bu_fire,
-                'Bu Dönem Fire Tutarı': row['Fire Tutarı'],
-                'Önceki Fire': onceki_fire,
-                'Önceki Fire Tutarı': row.get('Önceki Fire Tutarı', 0),
-                'Toplam Fire Tutarı': row['Fire Tutarı'] + row.get('Önceki Fire Tutarı', 0)
-            })
-    
-    result_df = pd.DataFrame(results)
-    if len(result_df) > 0:
-        result_df = result_df.drop_duplicates(subset=['Malzeme Kodu'], keep='first')
-        result_df = result_df.sort_values('Bu Dönem Fire Tutarı', ascending=True)
+@dedektor('kronik_fire')
+def chronic_fire_table(df):
+    """
+    Kronik Fire (hazırlanmış frame) - her iki dönemde de fire var VE dengelenmemiş
+    Çok mağazalı frame'de 'Mağaza Kodu' ilk kolon olur, duplicate temizliği mağaza bazında.
+    """
+    if len(df) == 0:
+        return pd.DataFrame()
+    
+    onceki_fire = df['Önceki Fire Miktarı'] if 'Önceki Fire Miktarı' in df.columns else pd.Series(0, index=df.index)
+    onceki_fire_tutari = df['Önceki Fire Tutarı'] if 'Önceki Fire Tutarı' in df.columns else pd.Series(0, index=df.index)
+    
+    mask = chronic_fire_mask(df)
+    if not mask.any():
+        return pd.DataFrame()
+    
+    result_df = pd.DataFrame({
+        'Malzeme Kodu': df.loc[mask, 'Malzeme Kodu'] if 'Malzeme Kodu' in df.columns else '',
+        'Malzeme Adı': df.loc[mask, 'Malzeme Adı'] if 'Malzeme Adı' in df.columns else '',
+        'Ürün Grubu': df.loc[mask, '_urun_grubu'],
+        'Bu Dönem Fire': df.loc[mask, 'Fire Miktarı'],
+        'Bu Dönem Fire Tutarı': df.loc[mask, 'Fire Tutarı'],
+        'Önceki Fire': onceki_fire[mask],
+        'Önceki Fire Tutarı': onceki_fire_tutari[mask],
+        'Toplam Fire Tutarı': df.loc[mask, 'Fire Tutarı'] + onceki_fire_tutari[mask]
+    }, index=df.index[mask])
+    
+    result_df, dup_key = insert_store_column(result_df, df, mask)
+    result_df = result_df.reset_index(drop=True)
+    result_df = result_df.drop_duplicates(subset=dup_key, keep='first')
+    result_df = result_df.sort_values('Bu Dönem Fire Tutarı', ascending=True)
     
     return result_df
+
+
+def negative_run_lengths(negatif):
+    """
+    Ürün × dönem bool matrisinde (dönemler eskiden yeniye) ardışık True serileri
+    Dönüş: (son dönemde devam eden seri uzunluğu, en uzun seri) - satır başına
+    
+    Vektörel: kümülatif toplam, her False'ta o noktadaki değerle sıfırlanır
+    (maximum.accumulate ile son sıfırlama noktası taşınır).
+    """
+    negatif = np.asarray(negatif, dtype=bool)
+    if negatif.size == 0:
+        bos = np.zeros(negatif.shape[0], dtype=np.int32)
+        return bos, bos
+    
+    cum = np.cumsum(negatif, axis=1, dtype=np.int32)
+    reset = np.where(negatif, 0, cum)
+    run = cum - np.maximum.accumulate(reset, axis=1)
+    
+    return run[:, -1], run.max(axis=1)
+
+
+def detect_chronic_history(history, threshold=None, value_col='Fark Miktarı'):
+    """
+    N dönemlik geçmişten kronik açık tespiti (KRONIK_THRESHOLD dönem üst üste açık)
+    
+    history: birden fazla dönemin satırları - 'Envanter Dönemi', 'Malzeme Kodu', value_col
+             ('Mağaza Kodu' varsa mağaza×ürün bazında)
+    Ürün × dönem matrisi numpy ile kurulur (bincount); ürün başına Python döngüsü yok.
+    Aynı ürünün dönem içindeki satırları toplanır; sayılmayan dönem seriyi keser.
+    """
+    threshold = KRONIK_THRESHOLD if threshold is None else threshold
+    if len(history) == 0 or 'Envanter Dönemi' not in history.columns:
+        return pd.DataFrame()
+    
+    keys = [c for c in ['Mağaza Kodu', 'Malzeme Kodu'] if c in history.columns]
+    
+    urun_kodu = history.groupby(keys, sort=False, observed=True).ngroup().to_numpy()
+    donem_kodu, donemler = pd.factorize(history['Envanter Dönemi'].astype(str), sort=True)
+    n_urun, n_donem = urun_kodu.max() + 1, len(donemler)
+    
+    # Ürün × dönem matrisleri (düz index üzerinden bincount)
+    hucre = urun_kodu.astype(np.int64) * n_donem + donem_kodu
+    deger = pd.to_numeric(history[value_col], errors='coerce').fillna(0).to_numpy(dtype=float)
+    toplam = np.bincount(hucre, weights=deger, minlength=n_urun * n_donem).reshape(n_urun, n_donem)
+    negatif = toplam < 0
+    
+    devam, en_uzun = negative_run_lengths(negatif)
+    kronik = en_uzun >= threshold
+    if not kronik.any():
+        return pd.DataFrame()
+    
+    # Ürün bilgisi: her ürünün son görülen satırı
+    son_satir = np.zeros(n_urun, dtype=np.int64)
+    np.maximum.at(son_satir, urun_kodu, np.arange(len(urun_kodu)))
+    bilgi_cols = [c for c in ['Malzeme Adı', 'Ürün Grubu'] if c in history.columns]
+    sonuc = history.iloc[son_satir[kronik]][keys + bilgi_cols].reset_index(drop=True)
+    
+    sonuc['Ardışık Açık (Son)'] = devam[kronik]
+    sonuc['En Uzun Seri'] = en_uzun[kronik]
+    sonuc['Açık Dönem Sayısı'] = negatif[kronik].sum(axis=1)
+    sonuc['Dönem Sayısı'] = n_donem
+    sonuc['Toplam Fark'] = toplam[kronik].sum(axis=1)
+    
+    if 'Fark Tutarı' in history.columns:
+        tutar = pd.to_numeric(history['Fark Tutarı'], errors='coerce').fillna(0).to_numpy(dtype=float)
+        sonuc['Toplam Tutar'] = np.bincount(urun_kodu, weights=tutar, minlength=n_urun)[kronik]
+    
+    sonuc = sonuc.sort_values(['Ardışık Açık (Son)', 'En Uzun Seri', 'Toplam Fark'],
+                              ascending=[False, False, True]).reset_index(drop=True)
+    return sonuc
@@ -2,78 +2,91 @@
 # Sigara açığı tespiti
 
 import pandas as pd
+from .inventory_analysis import prepare_detection_frame
+from .detector_engine import dedektor, run_detectors
+
+
+def _sigara_rows(df):
+    """Hazırlanmış frame'den sigara satırları: Fark / Kısmi / Önceki / Ürün Toplam kolonlarıyla"""
+    sigara_df = df[df['_sigara']]
+    
+    fark = sigara_df['Fark Miktarı'].fillna(0)
+    kismi = sigara_df['Kısmi Envanter Miktarı'].fillna(0)
+    onceki = sigara_df['Önceki Fark Miktarı'].fillna(0)
+    
+    rows = pd.DataFrame({
+        'Malzeme Kodu': sigara_df['Malzeme Kodu'] if 'Malzeme Kodu' in sigara_df.columns else '',
+        'Malzeme Adı': sigara_df['Malzeme Adı'] if 'Malzeme Adı' in sigara_df.columns else '',
+        'Fark': fark,
+        'Kısmi': kismi,
+        'Önceki': onceki,
+        'Ürün Toplam': fark + kismi + onceki,
+        'Risk': 'SİGARA'
+    }, index=sigara_df.index)
+    
+    if 'Mağaza Kodu' in sigara_df.columns:
+        rows.insert(0, 'Mağaza Kodu', sigara_df['Mağaza Kodu'])
+    return rows
+
+
+def sigara_net_by_store(df, keys=None):
+    """
+    Sigara Fark / Kısmi / Önceki / Net toplamları - mağaza (veya keys, örn. mağaza×dönem) bazında
+    Dönüş: index=keys, kolonlar Fark, Kısmi, Önceki, Net
+    """
+    keys = keys or ['Mağaza Kodu']
+    df = prepare_detection_frame(df)
+    if not all(k in df.columns for k in keys):
+        return pd.DataFrame(columns=['Fark', 'Kısmi', 'Önceki', 'Net'])
+    
+    rows = _sigara_rows(df)
+    for k in keys:
+        if k not in rows.columns:
+            rows[k] = df.loc[rows.index, k]
+    
+    net = rows.groupby(keys, observed=True)[['Fark', 'Kısmi', 'Önceki']].sum()
+    net['Net'] = net['Fark'] + net['Kısmi'] + net['Önceki']
+    return net
 
 
 def detect_cigarette_shortage(df):
+    """Sigara açığı tablosu - run_detectors sarmalayıcısı (bkz. cigarette_table)"""
+    return run_detectors(df, sadece=['sigara'])['sigara']
+
+
+@dedektor('sigara')
+def cigarette_table(df):
     """
-    Sigara açığı - Tüm sigaraların TOPLAM (Fark + Kısmi + Önceki) değerine bakılır
+    Sigara açığı (hazırlanmış frame) - Tüm sigaraların TOPLAM (Fark + Kısmi + Önceki) değerine bakılır
     Eğer toplam < 0 ise sigara açığı var demektir
     
     NET = Fark Miktarı + Kısmi Envanter Miktarı + Önceki Fark Miktarı
     """
-    
-    check_cols = []
-    for col in ['Mal Grubu Tanımı', 'Ürün Grubu', 'Ana Grup']:
-        if col in df.columns:
-            check_cols.append(col)
-    
-    if not check_cols:
+    if len(df) == 0:
         return pd.DataFrame()
     
-    # Sigara mask oluştur
-    sigara_mask = pd.Series([False] * len(df), index=df.index)
-    
-    for col in check_cols:
-        col_values = df[col].fillna('').astype(str).str.upper()
-        col_values = col_values.str.replace('İ', 'I', regex=False)
-        col_values = col_values.str.replace('Ş', 'S', regex=False)
-        col_values = col_values.str.replace('Ğ', 'G', regex=False)
-        col_values = col_values.str.replace('Ü', 'U', regex=False)
-        col_values = col_values.str.replace('Ö', 'O', regex=False)
-        col_values = col_values.str.replace('Ç', 'C', regex=False)
-        col_values = col_values.str.replace('ı', 'I', regex=False)
-        
-        mask = col_values.str.contains('SIGARA|TUTUN', case=False, na=False, regex=True)
-        sigara_mask = sigara_mask | mask
-    
-    sigara_df = df[sigara_mask].copy()
-    
-    if len(sigara_df) == 0:
+    rows = _sigara_rows(df).drop(columns=['Mağaza Kodu'], errors='ignore')
+    
+    if len(rows) == 0:
         return pd.DataFrame()
     
     # Net hesapla
-    toplam_fark = sigara_df['Fark Miktarı'].fillna(0).sum()
-    toplam_kismi = sigara_df['Kısmi Envanter Miktarı'].fillna(0).sum()
-    toplam_onceki = sigara_df['Önceki Fark Miktarı'].fillna(0).sum()
+    toplam_fark = rows['Fark'].sum()
+    toplam_kismi = rows['Kısmi'].sum()
+    toplam_onceki = rows['Önceki'].sum()
     net_toplam = toplam_fark + toplam_kismi + toplam_onceki
     
     if net_toplam >= 0:
         return pd.DataFrame()
     
     # Açık varsa detay göster
-    results = []
-    for idx, row in sigara_df.iterrows():
-        fark = row['Fark Miktarı'] if pd.notna(row['Fark Miktarı']) else 0
-        kismi = row['Kısmi Envanter Miktarı'] if pd.notna(row['Kısmi Envanter Miktarı']) else 0
-        onceki = row['Önceki Fark Miktarı'] if pd.notna(row['Önceki Fark Miktarı']) else 0
-        urun_net = fark + kismi + onceki
-        
-        if fark != 0 or kismi != 0 or onceki != 0:
-            results.append({
-                'Malzeme Kodu': row.get('Malzeme Kodu', ''),
-                'Malzeme Adı': row.get('Malzeme Adı', ''),
-                'Fark': fark,
-                'Kısmi': kismi,
-                'Önceki': onceki,
-                'Ürün Toplam': urun_net,
-                'Risk': 'SİGARA'
-            })
-    
-    result_df = pd.DataFrame(results)
+    hareketli = (rows['Fark'] != 0) | (rows['Kısmi'] != 0) | (rows['Önceki'] != 0)
+    result_df = rows[hareketli].reset_index(drop=True)
+    
     if len(result_df) > 0:
         result_df = result_df.drop_duplicates(subset=['Malzeme Kodu'], keep='first')
         result_df = result_df.sort_values('Ürün Toplam', ascending=True)
-        
+    
         # Toplam satırı ekle
         toplam_row = pd.DataFrame([{
             'Malzeme Kodu': '*** TOPLAM ***',
@@ -87,3 +100,48 @@ def detect_cigarette_shortage(df):
         result_df = pd.concat([result_df, toplam_row], ignore_index=True)
     
     return result_df
+
+
+def detect_cigarette_shortage_by_store(df):
+    """
+    Çok mağazalı sigara açığı - tek çağrıda
+    Dönüş: (detay, net)
+        detay: açığı olan her mağaza için detect_cigarette_shortage satırları
+               + mağaza başına TOPLAM satırı ('Mağaza Kodu' ilk kolon)
+        net: mağaza bazında Fark / Kısmi / Önceki / Net toplamları (tüm mağazalar)
+    """
+    if len(df) == 0 or 'Mağaza Kodu' not in df.columns:
+        return pd.DataFrame(), pd.DataFrame(columns=['Fark', 'Kısmi', 'Önceki', 'Net'])
+    
+    df = prepare_detection_frame(df)
+    rows = _sigara_rows(df)
+    
+    net = rows.groupby('Mağaza Kodu', observed=True)[['Fark', 'Kısmi', 'Önceki']].sum()
+    net['Net'] = net['Fark'] + net['Kısmi'] + net['Önceki']
+    
+    acik = net[net['Net'] < 0]
+    if len(acik) == 0:
+        return pd.DataFrame(), net
+    
+    hareketli = (rows['Fark'] != 0) | (rows['Kısmi'] != 0) | (rows['Önceki'] != 0)
+    detay = rows[hareketli & rows['Mağaza Kodu'].isin(acik.index)]
+    detay = detay.drop_duplicates(subset=['Mağaza Kodu', 'Malzeme Kodu'], keep='first')
+    
+    # Mağaza başına toplam satırı (sadece detayı olan mağazalar)
+    toplam = acik[acik.index.isin(detay['Mağaza Kodu'])]
+    toplam_rows = pd.DataFrame({
+        'Mağaza Kodu': toplam.index,
+        'Malzeme Kodu': '*** TOPLAM ***',
+        'Malzeme Adı': ('SİGARA AÇIĞI: ' + toplam['Net'].abs().map('{:.0f}'.format) + ' adet').to_numpy(),
+        'Fark': toplam['Fark'].to_numpy(),
+        'Kısmi': toplam['Kısmi'].to_numpy(),
+        'Önceki': toplam['Önceki'].to_numpy(),
+        'Ürün Toplam': toplam['Net'].to_numpy(),
+        'Risk': '⚠️ AÇIK VAR'
+    })
+    
+    detay = pd.concat([detay.assign(_sira=0), toplam_rows.assign(_sira=1)], ignore_index=True)
+    detay = detay.sort_values(['Mağaza Kodu', '_sira', 'Ürün Toplam'], kind='stable')
+    detay = detay.drop('_sira', axis=1).reset_index(drop=True)
+    
+    return detay, net
@@ -0,0 +1,53 @@
+# ==================== DETECTOR ENGINE ====================
+# Parçalı envanter dedektörlerini tek hazırlanmış frame üzerinden çalıştırır
+
+from .inventory_analysis import prepare_detection_frame
+
+# Dedektör adı → tablo fonksiyonu (hazırlanmış frame alır). Modüller @dedektor ile kaydolur.
+DEDEKTORLER = {}
+
+
+def dedektor(ad):
+    """Tablo fonksiyonunu motora kaydet"""
+    def kaydet(fonksiyon):
+        DEDEKTORLER[ad] = fonksiyon
+        return fonksiyon
+    return kaydet
+
+
+def run_detectors(df, kasa_kodlari=None, sadece=None):
+    """
+    Tüm parçalı envanter tespitlerini tek seferde çalıştır.
+    Ortak türetilmiş kolonlar (toplam, dengeli, fiyat, ürün grubu, sigara, kasa)
+    bir kez hesaplanır; her dedektör bu frame üzerinde sadece maske uygular.
+    detect_* fonksiyonları bu motorun ince sarmalayıcılarıdır (sadece=[ad]).
+    
+    Dönüş: her tablo + 'kasa_ozet' + sayım özetini ('ozet', sadece tam çalıştırmada) içeren dict
+    """
+    adlar = list(DEDEKTORLER) if sadece is None else list(sadece)
+    if kasa_kodlari is None and sadece is None:
+        adlar.remove('kasa')
+    
+    prepared = prepare_detection_frame(df, kasa_kodlari) if len(df) > 0 else df
+    
+    sonuc = {ad: DEDEKTORLER[ad](prepared) for ad in adlar}
+    if 'kasa' in sonuc:
+        sonuc['kasa'], sonuc['kasa_ozet'] = sonuc['kasa']
+    
+    if sadece is not None:
+        return sonuc
+    
+    sigara_df = sonuc['sigara']
+    kasa_ozet = sonuc.get('kasa_ozet', {})
+    sonuc['ozet'] = {
+        'ic_hirsizlik': len(sonuc['ic_hirsizlik']),
+        'kronik': len(sonuc['kronik']),
+        'kronik_fire': len(sonuc['kronik_fire']),
+        'sigara': len(sigara_df) - 1 if len(sigara_df) > 0 else 0,
+        'aile': len(sonuc['aile']),
+        'fire_manipulasyon': len(sonuc['fire_manipulasyon']),
+        'dis_hirsizlik': len(sonuc['dis_hirsizlik']),
+        'kasa_sorunlu': kasa_ozet.get('sorunlu_urun', 0),
+    }
+    
+    return sonuc
@@ -2,31 +2,52 @@
 # Dış hırsızlık tespiti
 
 import pandas as pd
-from .inventory_analysis import is_balanced
+from .inventory_analysis import insert_store_column
+from .detector_engine import dedektor, run_detectors
+
+
+def external_theft_mask(df):
+    """Dış hırsızlık maskesi (hazırlanmış frame): açık var, fire/iptal yok, |Fark Tutarı| > 50"""
+    return (
+        ~df['_dengeli'] &
+        (df['Fark Miktarı'] < 0) &
+        (df['Fire Miktarı'] == 0) &
+        (df['İptal Satır Miktarı'] == 0) &
+        (df['Fark Tutarı'].abs() > 50)
+    )
 
 
 def detect_external_theft(df):
-    """Dış hırsızlık - açık var ama fire/iptal yok"""
-    results = []
+    """Dış hırsızlık tablosu - run_detectors sarmalayıcısı (bkz. external_theft_table)"""
+    return run_detectors(df, sadece=['dis_hirsizlik'])['dis_hirsizlik']
+
+
+@dedektor('dis_hirsizlik')
+def external_theft_table(df):
+    """
+    Dış hırsızlık (hazırlanmış frame) - açık var ama fire/iptal yok
+    Çok mağazalı frame'de 'Mağaza Kodu' ilk kolon olur.
+    """
+    if len(df) == 0:
+        return pd.DataFrame()
+    
+    mask = external_theft_mask(df)
+    if not mask.any():
+        return pd.DataFrame()
+    
+    result_df = pd.DataFrame({
+        'Malzeme Kodu': df.loc[mask, 'Malzeme Kodu'] if 'Malzeme Kodu' in df.columns else '',
+        'Malzeme Adı': df.loc[mask, 'Malzeme Adı'] if 'Malzeme Adı' in df.columns else '',
+        'Ürün Grubu': df.loc[mask, 'Ürün Grubu'] if 'Ürün Grubu' in df.columns else '',
+        'Fark Miktarı': df.loc[mask, 'Fark Miktarı'],
+        'Fark Tutarı': df.loc[mask, 'Fark Tutarı'],
+        'Önceki Fark': df.loc[mask, 'Önceki Fark Miktarı'],
+        'Risk': 'DIŞ HIRSIZLIK / SAYIM HATASI'
+    }, index=df.index[mask])
     
-    for idx, row in df.iterrows():
-        if is_balanced(row):
-            continue
-        
-        if row['Fark Miktarı'] < 0 and row['Fire Miktarı'] == 0 and row['İptal Satır Miktarı'] == 0:
-            if abs(row['Fark Tutarı']) > 50:
-                results.append({
-                    'Malzeme Kodu': row.get('Malzeme Kodu', ''),
-                    'Malzeme Adı': row.get('Malzeme Adı', ''),
-                    'Ürün Grubu': row.get('Ürün Grubu', ''),
-                    'Fark Miktarı': row['Fark Miktarı'],
-                    'Fark Tutarı': row['Fark Tutarı'],
-                    'Önceki Fark': row['Önceki Fark Miktarı'],
-                    'Risk': 'DIŞ HIRSIZLIK / SAYIM HATASI'
-                })
+    result_df, _ = insert_store_column(result_df, df, mask)
+    result_df = result_df.reset_index(drop=True)
     
-    result_df = pd.DataFrame(results)
-    if len(result_df) > 0:
-        result_df = result_df.sort_values('Fark Tutarı', ascending=True)
+    result_df = result_df.sort_values('Fark Tutarı', ascending=True)
     
     return result_df
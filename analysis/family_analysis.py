@@ -1,8 +1,10 @@
 # ==================== FAMILY ANALYSIS ====================
 # Ürün ailesi analizi
 
+import numpy as np
 import pandas as pd
 import re
+from .detector_engine import dedektor
 
 
 def get_first_two_words(text):
@@ -84,89 +86,158 @@ def is_quantity_similar(qty1, unit1, qty2, unit2, tolerance=0.30):
     return cat1 == cat2
 
 
+# Gramaj/ML pattern'i - extract_quantity ile aynı, vektörel str.extract için derlenmiş
+QUANTITY_PATTERN = re.compile(r'(\d+[.,]?\d*)\s*(ML|LT|L|G|GR|KG|MG)\b')
+
+
+def extract_quantities(names):
+    """
+    Vektörel extract_quantity: Series → (Gramaj, GramajBirim)
+    LT/L → ML (x1000), KG → G (x1000), GR → G
+    """
+    text = names.astype(str).str.upper().where(names.notna())
+    parts = text.str.extract(QUANTITY_PATTERN)
+    
+    value = pd.to_numeric(parts[0].str.replace(',', '.', regex=False), errors='coerce')
+    unit = parts[1]
+    
+    x1000 = unit.isin(['LT', 'L', 'KG'])
+    value = value.where(~x1000, value * 1000)
+    unit = unit.mask(unit.isin(['LT', 'L']), 'ML').mask(unit.isin(['KG', 'GR']), 'G')
+    
+    return value, unit
+
+
+def _size_category(qty, unit):
+    """Vektörel gramaj boy kategorisi: 0=S, 1=M, 2=L (bilinmeyen birim = M)"""
+    ml = unit == 'ML'
+    g = unit == 'G'
+    return np.select(
+        [ml & (qty <= 400), ml & (qty <= 1000), ml,
+         g & (qty <= 100), g & (qty <= 400), g],
+        [0, 1, 2, 0, 1, 2],
+        1
+    )
+
+
+def _similar_to_anchor(a, qty, unit_code, cat):
+    """
+    is_quantity_similar(anchor, üye) - grup içindeki tüm üyeler için tek seferde.
+    Gramajı (birimi) olmayan ürünler hiçbir aileye girmez: eski taramada boş birim NaN idi
+    ve NaN != NaN olduğundan kendisiyle bile eşleşmiyordu.
+    """
+    if unit_code[a] < 0:
+        return np.zeros(len(unit_code), dtype=bool)
+    same_unit = unit_code == unit_code[a]
+    
+    q_a = qty[a]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.maximum(qty, q_a) / np.minimum(qty, q_a)
+    zero = (qty == 0) | (q_a == 0)
+    
+    return same_unit & (zero | ((ratio <= 3) & (cat == cat[a])))
+
+
+@dedektor('aile')
 def find_product_families(df):
     """
     Benzer ürün ailesi analizi
     Kural: İlk 2 kelime + Son kelime (marka) + Mal Grubu + Gramaj (±%30) aynıysa = AİLE
+    
+    Aile anahtarı (İlk2Kelime, Marka, Ürün Grubu) tek groupby ile gruplanır;
+    gramaj kümelemesi yalnızca grup içinde, numpy dizileri üzerinde yapılır.
     """
-    df_copy = df.copy()
-    df_copy['İlk2Kelime'] = df_copy['Malzeme Adı'].apply(get_first_two_words)
-    df_copy['Marka'] = df_copy['Malzeme Adı'].apply(get_last_word)
-    df_copy['Gramaj'] = df_copy['Malzeme Adı'].apply(lambda x: extract_quantity(x)[0])
-    df_copy['GramajBirim'] = df_copy['Malzeme Adı'].apply(lambda x: extract_quantity(x)[1])
+    if len(df) == 0:
+        return pd.DataFrame()
     
-    families = []
-    processed_indices = set()
+    names = df['Malzeme Adı']
+    words = names.astype(str).str.strip().str.split()
+    n_words = words.str.len()
     
-    for idx, row in df_copy.iterrows():
-        if idx in processed_indices:
-            continue
-        
-        ilk2 = row['İlk2Kelime']
-        marka = row['Marka']
-        urun_grubu = row['Ürün Grubu']
-        gramaj = row['Gramaj']
-        birim = row['GramajBirim']
-        
-        if not ilk2 or not marka:
-            continue
-        
-        family_mask = (
-            (df_copy['İlk2Kelime'] == ilk2) & 
-            (df_copy['Marka'] == marka) & 
-            (df_copy['Ürün Grubu'] == urun_grubu)
-        )
-        
-        potential_family = df_copy[family_mask]
-        
-        if len(potential_family) <= 1:
-            continue
-        
-        family_members = []
-        for fam_idx, fam_row in potential_family.iterrows():
-            if is_quantity_similar(gramaj, birim, fam_row['Gramaj'], fam_row['GramajBirim']):
-                family_members.append(fam_idx)
-                processed_indices.add(fam_idx)
-        
-        if len(family_members) <= 1:
+    ilk2 = words.str[:2].str.join(' ').str.upper().where(n_words >= 2, names.astype(str).str.upper())
+    marka = words.str[-1].str.upper().where(n_words > 0, '')
+    ilk2 = ilk2.where(names.notna(), '')
+    marka = marka.where(names.notna(), '')
+    
+    gramaj, birim = extract_quantities(names)
+    
+    keys = pd.DataFrame({
+        'İlk2Kelime': ilk2,
+        'Marka': marka,
+        'Ürün Grubu': df['Ürün Grubu'],
+        '_pos': np.arange(len(df)),
+    })
+    keys = keys[(keys['İlk2Kelime'] != '') & (keys['Marka'] != '')]
+    
+    qty_all = gramaj.to_numpy(dtype=float)
+    unit_all = pd.factorize(birim, use_na_sentinel=True)[0]
+    cat_all = _size_category(qty_all, birim.to_numpy(dtype=object))
+    
+    fark_all = df['Fark Miktarı'].to_numpy()
+    kismi_all = df['Kısmi Envanter Miktarı'].to_numpy()
+    onceki_all = df['Önceki Fark Miktarı'].to_numpy()
+    
+    families = []
+    for (ilk2_val, marka_val, urun_grubu), pos in keys.groupby(
+            ['İlk2Kelime', 'Marka', 'Ürün Grubu'], sort=False, observed=True)['_pos']:
+        if len(pos) <= 1:
             continue
         
-        family_df = df_copy.loc[family_members]
-        
-        toplam_fark = family_df['Fark Miktarı'].sum()
-        toplam_kismi = family_df['Kısmi Envanter Miktarı'].sum()
-        toplam_onceki = family_df['Önceki Fark Miktarı'].sum()
-        aile_toplami = toplam_fark + toplam_kismi + toplam_onceki
+        pos = np.sort(pos.to_numpy())
+        qty = qty_all[pos]
+        unit_code = unit_all[pos]
+        cat = cat_all[pos]
+        processed = np.zeros(len(pos), dtype=bool)
         
-        if family_df['Fark Miktarı'].abs().sum() > 0:
-            if abs(aile_toplami) <= 2:
-                sonuc = "KOD KARIŞIKLIĞI - HIRSIZLIK DEĞİL"
-                risk = "DÜŞÜK"
-            elif aile_toplami < -2:
-                sonuc = "AİLEDE NET AÇIK VAR"
-                risk = "ORTA"
-            else:
-                sonuc = "AİLEDE FAZLA VAR"
-                risk = "DÜŞÜK"
+        for a in range(len(pos)):
+            if processed[a]:
+                continue
             
-            urunler = family_df['Malzeme Adı'].tolist()
-            farklar = family_df['Fark Miktarı'].tolist()
+            members = _similar_to_anchor(a, qty, unit_code, cat)
+            processed |= members
             
-            families.append({
-                'Mal Grubu': urun_grubu,
-                'İlk 2 Kelime': ilk2,
-                'Marka': marka,
-                'Ürün Sayısı': len(family_members),
-                'Toplam Fark': toplam_fark,
-                'Toplam Kısmi': toplam_kismi,
-                'Toplam Önceki': toplam_onceki,
-                'AİLE TOPLAMI': aile_toplami,
-                'Sonuç': sonuc,
-                'Risk': risk,
-                'Ürünler': ' | '.join([f"{u[:25]}({f})" for u, f in zip(urunler[:5], farklar[:5])])
-            })
-    
-    result_df = pd.DataFrame(families)
+            if members.sum() <= 1:
+                continue
+            
+            member_pos = pos[members]
+            
+            toplam_fark = fark_all[member_pos].sum()
+            toplam_kismi = kismi_all[member_pos].sum()
+            toplam_onceki = onceki_all[member_pos].sum()
+            aile_toplami = toplam_fark + toplam_kismi + toplam_onceki
+            
+            if np.abs(fark_all[member_pos]).sum() > 0:
+                if abs(aile_toplami) <= 2:
+                    sonuc = "KOD KARIŞIKLIĞI - HIRSIZLIK DEĞİL"
+                    risk = "DÜŞÜK"
+                elif aile_toplami < -2:
+                    sonuc = "AİLEDE NET AÇIK VAR"
+                    risk = "ORTA"
+                else:
+                    sonuc = "AİLEDE FAZLA VAR"
+                    risk = "DÜŞÜK"
+                
+                urunler = names.iloc[member_pos[:5]].tolist()
+                farklar = df['Fark Miktarı'].iloc[member_pos[:5]].tolist()
+                
+                families.append((pos[a], {
+                    'Mal Grubu': urun_grubu,
+                    'İlk 2 Kelime': ilk2_val,
+                    'Marka': marka_val,
+                    'Ürün Sayısı': int(members.sum()),
+                    'Toplam Fark': toplam_fark,
+                    'Toplam Kısmi': toplam_kismi,
+                    'Toplam Önceki': toplam_onceki,
+                    'AİLE TOPLAMI': aile_toplami,
+                    'Sonuç': sonuc,
+                    'Risk': risk,
+                    'Ürünler': ' | '.join([f"{u[:25]}({f})" for u, f in zip(urunler, farklar)])
+                }))
+    
+    # Orijinal tarama sırasını koru (anchor pozisyonu)
+    families.sort(key=lambda x: x[0])
+    
+    result_df = pd.DataFrame([f for _, f in families])
     if len(result_df) > 0:
         result_df = result_df.sort_values('AİLE TOPLAMI', ascending=True)
     
@@ -2,41 +2,58 @@
 # Fire manipülasyonu tespiti
 
 import pandas as pd
-from .inventory_analysis import is_balanced
+from .inventory_analysis import insert_store_column
+from .detector_engine import dedektor, run_detectors
+
+
+def fire_manipulation_mask(df):
+    """Fire manipülasyonu maskesi (hazırlanmış frame): fire var, Fark+Kısmi > 0, dengelenmemiş"""
+    onceki_fark = df['Önceki Fark Miktarı'] if 'Önceki Fark Miktarı' in df.columns else 0
+    fark = df['Fark Miktarı']
+    return ~((onceki_fark + fark).abs() <= 0.01) & (df['Fire Miktarı'] < 0) & ((fark + df['Kısmi Envanter Miktarı']) > 0)
 
 
 def detect_fire_manipulation(df):
-    """Fire manipülasyonu: Fire var AMA Fark+Kısmi > 0 VE dengelenmemiş"""
-    results = []
+    """Fire manipülasyonu tablosu - run_detectors sarmalayıcısı (bkz. fire_manipulation_table)"""
+    return run_detectors(df, sadece=['fire_manipulasyon'])['fire_manipulasyon']
+
+
+@dedektor('fire_manipulasyon')
+def fire_manipulation_table(df):
+    """
+    Fire manipülasyonu (hazırlanmış frame): Fire var AMA Fark+Kısmi > 0 VE dengelenmemiş
+    Çok mağazalı frame'de 'Mağaza Kodu' ilk kolon olur, duplicate temizliği mağaza bazında.
+    """
+    if len(df) == 0:
+        return pd.DataFrame()
+    
+    fark = df['Fark Miktarı']
+    kismi = df['Kısmi Envanter Miktarı']
+    onceki_fark = df['Önceki Fark Miktarı'] if 'Önceki Fark Miktarı' in df.columns else pd.Series(0, index=df.index)
+    fire = df['Fire Miktarı']
+    
+    fark_kismi = fark + kismi
+    
+    mask = fire_manipulation_mask(df)
+    if not mask.any():
+        return pd.DataFrame()
     
-    for idx, row in df.iterrows():
-        fark = row['Fark Miktarı']
-        kismi = row['Kısmi Envanter Miktarı']
-        onceki_fark = row.get('Önceki Fark Miktarı', 0) or 0
-        fire = row['Fire Miktarı']
-        
-        fark_kismi = fark + kismi
-        
-        if abs(onceki_fark + fark) <= 0.01:
-            continue
-        
-        if fire < 0 and fark_kismi > 0:
-            results.append({
-                'Malzeme Kodu': row.get('Malzeme Kodu', ''),
-                'Malzeme Adı': row.get('Malzeme Adı', ''),
-                'Ürün Grubu': row.get('Mal Grubu Tanımı', row.get('Ürün Grubu', '')),
-                'Fark Miktarı': fark,
-                'Kısmi Env.': kismi,
-                'Önceki Fark': onceki_fark,
-                'Fark + Kısmi': fark_kismi,
-                'Fire Miktarı': fire,
-                'Fire Tutarı': row['Fire Tutarı'],
-                'Sonuç': 'FAZLA FİRE GİRİLMİŞ'
-            })
+    result_df = pd.DataFrame({
+        'Malzeme Kodu': df.loc[mask, 'Malzeme Kodu'] if 'Malzeme Kodu' in df.columns else '',
+        'Malzeme Adı': df.loc[mask, 'Malzeme Adı'] if 'Malzeme Adı' in df.columns else '',
+        'Ürün Grubu': df.loc[mask, '_urun_grubu'],
+        'Fark Miktarı': fark[mask],
+        'Kısmi Env.': kismi[mask],
+        'Önceki Fark': onceki_fark[mask],
+        'Fark + Kısmi': fark_kismi[mask],
+        'Fire Miktarı': fire[mask],
+        'Fire Tutarı': df.loc[mask, 'Fire Tutarı'],
+        'Sonuç': 'FAZLA FİRE GİRİLMİŞ'
+    }, index=df.index[mask])
     
-    result_df = pd.DataFrame(results)
-    if len(result_df) > 0:
-        result_df = result_df.drop_duplicates(subset=['Malzeme Kodu'], keep='first')
-        result_df = result_df.sort_values('Fire Tutarı', ascending=True)
+    result_df, dup_key = insert_store_column(result_df, df, mask)
+    result_df = result_df.reset_index(drop=True)
+    result_df = result_df.drop_duplicates(subset=dup_key, keep='first')
+    result_df = result_df.sort_values('Fire Tutarı', ascending=True)
     
     return result_df
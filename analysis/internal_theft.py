@@ -1,81 +1,76 @@
 # ==================== INTERNAL THEFT ====================
 # İç hırsızlık tespiti
 
+import numpy as np
 import pandas as pd
-from .inventory_analysis import is_balanced
+from .inventory_analysis import insert_store_column
+from .detector_engine import dedektor, run_detectors
+
+RISK_SIRASI = {'ÇOK YÜKSEK': 0, 'YÜKSEK': 1, 'ORTA': 2, 'DÜŞÜK-ORTA': 3}
 
 
 def detect_internal_theft(df):
+    """İç hırsızlık tablosu - run_detectors sarmalayıcısı (bkz. internal_theft_table)"""
+    return run_detectors(df, sadece=['ic_hirsizlik'])['ic_hirsizlik']
+
+
+@dedektor('ic_hirsizlik')
+def internal_theft_table(df):
     """
-    İÇ HIRSIZLIK TESPİTİ:
+    İÇ HIRSIZLIK TESPİTİ (hazırlanmış frame):
     - Satış Fiyatı >= 100 TL
     - Dengelenmemiş (Fark + Kısmi + Önceki ≠ 0)
     - |Toplam| ≈ İptal Satır, fark büyüdükçe risk AZALIR
+    
+    Çok mağazalı DataFrame de kabul eder; 'Mağaza Kodu' varsa sonuçta ilk kolon olur
+    ve duplicate temizliği mağaza bazında yapılır.
     """
-    results = []
+    if len(df) == 0:
+        return pd.DataFrame()
+    
+    satis_fiyati = df['_fiyat']
+    fark = df['Fark Miktarı']
+    kismi = df['Kısmi Envanter Miktarı']
+    onceki = df['Önceki Fark Miktarı']
+    iptal = df['İptal Satır Miktarı']
+    
+    toplam = df['_toplam']
+    fark_mutlak = (toplam.abs() - iptal).abs()
+    
+    aday = ~df['_dengeli'] & (satis_fiyati >= 100) & (toplam < 0) & (iptal > 0) & (fark_mutlak <= 10)
+    if not aday.any():
+        return pd.DataFrame()
+    
+    fm = fark_mutlak[aday]
+    bantlar = [fm == 0, fm <= 2, fm <= 5]
+    risk = np.select(bantlar, ['ÇOK YÜKSEK', 'YÜKSEK', 'ORTA'], 'DÜŞÜK-ORTA')
+    esitlik = np.select(bantlar, ['TAM EŞİT', 'YAKIN (±2)', 'YAKIN (±5)'], 'FARK: ' + fm.astype(str))
+    
+    result_df = pd.DataFrame({
+        'Malzeme Kodu': df.loc[aday, 'Malzeme Kodu'] if 'Malzeme Kodu' in df.columns else '',
+        'Malzeme Adı': df.loc[aday, 'Malzeme Adı'] if 'Malzeme Adı' in df.columns else '',
+        'Ürün Grubu': df.loc[aday, '_urun_grubu'],
+        'Satış Fiyatı': satis_fiyati[aday],
+        'Fark Miktarı': fark[aday],
+        'Kısmi Env.': kismi[aday],
+        'Önceki Fark': onceki[aday],
+        'TOPLAM': toplam[aday],
+        'İptal Satır': iptal[aday],
+        'Fark': fm,
+        'Durum': esitlik,
+        'Fark Tutarı (TL)': df.loc[aday, 'Fark Tutarı'],
+        'Risk': risk
+    }, index=df.index[aday])
     
-    for idx, row in df.iterrows():
-        # Dengelenmiş ise atla
-        if is_balanced(row):
-            continue
-        
-        satis_fiyati = row.get('Birim Fiyat', 0) or 0
-        if satis_fiyati < 100:
-            continue
-        
-        fark = row['Fark Miktarı']
-        kismi = row['Kısmi Envanter Miktarı']
-        onceki = row['Önceki Fark Miktarı']
-        iptal = row['İptal Satır Miktarı']
-        
-        toplam = fark + kismi + onceki
-        
-        if toplam >= 0 or iptal <= 0:
-            continue
-        
-        fark_mutlak = abs(abs(toplam) - iptal)
-        
-        if fark_mutlak == 0:
-            risk = "ÇOK YÜKSEK"
-            esitlik = "TAM EŞİT"
-        elif fark_mutlak <= 2:
-            risk = "YÜKSEK"
-            esitlik = "YAKIN (±2)"
-        elif fark_mutlak <= 5:
-            risk = "ORTA"
-            esitlik = "YAKIN (±5)"
-        elif fark_mutlak <= 10:
-            risk = "DÜŞÜK-ORTA"
-            esitlik = f"FARK: {fark_mutlak}"
-        else:
-            continue
-        
-        results.append({
-            'Malzeme Kodu': row.get('Malzeme Kodu', ''),
-            'Malzeme Adı': row.get('Malzeme Adı', ''),
-            'Ürün Grubu': row.get('Mal Grubu Tanımı', row.get('Ürün Grubu', '')),
-            'Satış Fiyatı': satis_fiyati,
-            'Fark Miktarı': fark,
-            'Kısmi Env.': kismi,
-            'Önceki Fark': onceki,
-            'TOPLAM': toplam,
-            'İptal Satır': iptal,
-            'Fark': fark_mutlak,
-            'Durum': esitlik,
-            'Fark Tutarı (TL)': row['Fark Tutarı'],
-            'Risk': risk
-        })
+    result_df, dup_key = insert_store_column(result_df, df, aday)
+    result_df = result_df.reset_index(drop=True)
     
-    result_df = pd.DataFrame(results)
+    # DUPLICATE TEMİZLEME
+    result_df = result_df.drop_duplicates(subset=dup_key, keep='first')
     
-    if len(result_df) > 0:
-        # DUPLICATE TEMİZLEME
-        result_df = result_df.drop_duplicates(subset=['Malzeme Kodu'], keep='first')
-        
-        # Risk sıralaması
-        risk_order = {'ÇOK YÜKSEK': 0, 'YÜKSEK': 1, 'ORTA': 2, 'DÜŞÜK-ORTA': 3}
-        result_df['_risk_sort'] = result_df['Risk'].map(risk_order)
-        result_df = result_df.sort_values(['_risk_sort', 'Fark Tutarı (TL)'], ascending=[True, True])
-        result_df = result_df.drop('_risk_sort', axis=1)
+    # Risk sıralaması
+    result_df['_risk_sort'] = result_df['Risk'].map(RISK_SIRASI)
+    result_df = result_df.sort_values(['_risk_sort', 'Fark Tutarı (TL)'], ascending=[True, True])
+    result_df = result_df.drop('_risk_sort', axis=1)
     
     return result_df
@@ -1,11 +1,21 @@
 # ==================== INVENTORY ANALYSIS ====================
 # Envanter analizi ve veri hazırlama
 
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
+from utils.text import add_normalized_columns, norm_col, tr_contains
 
 
-def analyze_inventory(df):
-    """Veriyi analiz için hazırla"""
+def analyze_inventory(df, compact=False):
+    """
+    Veriyi analiz için hazırla
+    
+    compact=True: yeniden adlandırılan kolonlar kopyalanmaz (eski ad yerine yeni ad kalır),
+    tekrar eden metinler category, kayıpsız çevrilebilen sayılar float32 olur.
+    Bellek raporu df.attrs['bellek'] içinde (bkz. compact_frame).
+    """
     df = df.copy()
     
     # DUPLICATE TEMİZLEME
@@ -44,8 +54,15 @@ def analyze_inventory(df):
         'Envanter Tarihi': 'Envanter Tarihi',
     }
     
+    alias_bytes = 0
     for old_col, new_col in col_mapping.items():
-        if old_col in df.columns:
+        if old_col not in df.columns:
+            continue
+        if compact and old_col != new_col:
+            # Kopya yerine yeniden adlandır - aynı veri iki kez tutulmaz
+            alias_bytes += int(df[old_col].memory_usage(index=False, deep=True))
+            df = df.drop(columns=[new_col], errors='ignore').rename(columns={old_col: new_col})
+        else:
             df[new_col] = df[old_col]
     
     numeric_cols = ['Fark Miktarı', 'Fark Tutarı', 'Kısmi Envanter Miktarı', 'Kısmi Envanter Tutarı',
@@ -63,6 +80,58 @@ def analyze_inventory(df):
     
     df['TOPLAM_MIKTAR'] = df['Fark Miktarı'] + df['Kısmi Envanter Miktarı'] + df['Önceki Fark Miktarı']
     
+    if compact:
+        df = compact_frame(df, extra_bytes=alias_bytes)
+    
+    return df
+
+
+# Compact modda her zaman category'e çevrilen tekrar eden metin kolonları
+COMPACT_CATEGORY_COLUMNS = [
+    'Mağaza Kodu', 'Mağaza Adı', 'Satış Müdürü', 'Bölge Sorumlusu', 'Ürün Grubu', 'Ana Grup',
+    'Envanter Dönemi', 'Depolama Koşulu Grubu',
+]
+
+# Diğer metin kolonları: farklı değer oranı bunun altındaysa category
+COMPACT_CATEGORY_MAX_RATIO = 0.5
+
+
+def _float32_safe(values):
+    """float32'ye çevrilince değer kaybı olmuyor mu?"""
+    with np.errstate(over='ignore', invalid='ignore'):
+        return np.array_equal(values.astype('float32').astype(values.dtype), values, equal_nan=True)
+
+
+def compact_frame(df, extra_bytes=0):
+    """
+    DataFrame'i küçült:
+    - tekrar eden metin kolonları → category
+    - ondalıklı kolonlar → float32 (sadece kayıpsızsa; kuruşlu tutarlar float64 kalır),
+      tam sayı kolonları → en küçük tam sayı tipi
+    Bellek raporu df.attrs['bellek']: once / sonra (byte), oran
+    extra_bytes: çağıranın kopyalamadan kurtardığı bayt (rapora eklenir)
+    """
+    once = int(df.memory_usage(index=True, deep=True).sum()) + extra_bytes
+    
+    df = df.copy(deep=False)
+    n = max(len(df), 1)
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_bool_dtype(s) or isinstance(s.dtype, pd.CategoricalDtype):
+            continue
+    
+        if pd.api.types.is_integer_dtype(s):
+            # Tam sayılar tam sayı kalır (float'a çevrilirse görüntüde '-2.0' olur)
+            df[col] = pd.to_numeric(s, downcast='integer')
+        elif pd.api.types.is_float_dtype(s):
+            if s.dtype != 'float32' and _float32_safe(s.to_numpy()):
+                df[col] = s.astype('float32')
+        elif s.dtype == object or pd.api.types.is_string_dtype(s):
+            if col in COMPACT_CATEGORY_COLUMNS or s.nunique(dropna=True) / n <= COMPACT_CATEGORY_MAX_RATIO:
+                df[col] = s.astype('category')
+    
+    sonra = int(df.memory_usage(index=True, deep=True).sum())
+    df.attrs['bellek'] = {'once': once, 'sonra': sonra, 'oran': once / sonra if sonra else 1.0}
     return df
 
 
@@ -70,3 +139,132 @@ def is_balanced(row):
     """Dengelenmiş mi? Fark + Kısmi + Önceki = 0"""
     toplam = row['Fark Miktarı'] + row['Kısmi Envanter Miktarı'] + row['Önceki Fark Miktarı']
     return abs(toplam) <= 0.01
+
+
+def balanced_mask(df):
+    """Vektörel is_balanced: satır bazında Fark + Kısmi + Önceki = 0 maskesi"""
+    toplam = df['Fark Miktarı'] + df['Kısmi Envanter Miktarı'] + df['Önceki Fark Miktarı']
+    return toplam.abs() <= 0.01
+
+
+SIGARA_PATTERN = 'SIGARA|TUTUN'
+
+
+def code_key(s):
+    """
+    Malzeme Kodu → int64 anahtar (12002256, '12002256', '12002256.0' aynı anahtar)
+    Sayıya çevrilemeyen / tam sayı olmayan kodlar -1
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Her kategori bir kez çevrilir
+        keys = np.append(code_key(pd.Series(s.cat.categories, dtype=object)).to_numpy(), -1)
+        return pd.Series(keys[s.cat.codes.to_numpy()], index=s.index)
+    
+    if not pd.api.types.is_numeric_dtype(s):
+        s = pd.to_numeric(s, errors='coerce')
+    
+    values = s.to_numpy(dtype='float64', na_value=np.nan)
+    gecerli = np.isfinite(values) & (values == np.floor(values))
+    return pd.Series(np.where(gecerli, values, -1).astype('int64'), index=s.index)
+
+
+def code_text(s):
+    """
+    Malzeme Kodu → görüntü metni: orijinal kod korunur (baştaki sıfırlar, sayı olmayan kodlar),
+    sadece Excel'in float okumasından kalan '.0' kuyruğu atılır. Eşleştirme code_key ile yapılır.
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Her kategori bir kez çevrilir
+        metin = np.append(code_text(pd.Series(s.cat.categories, dtype=object)).to_numpy(dtype=object), 'nan')
+        return pd.Series(metin[s.cat.codes.to_numpy()], index=s.index, dtype=object)
+    
+    return s.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+
+@lru_cache(maxsize=8)
+def _code_index(kodlar):
+    keys = code_key(pd.Series(list(kodlar), dtype=object))
+    return pd.Index(keys[keys >= 0].unique())
+
+
+def build_code_index(kodlar):
+    """Kod kümesinden int64 index (aynı küme için bir kez kurulur)"""
+    return _code_index(frozenset(str(k) for k in kodlar))
+
+
+def prepare_detection_frame(df, kasa_kodlari=None):
+    """
+    Dedektörlerin ortak kullandığı türetilmiş kolonları BİR KEZ hesapla:
+    _toplam (Fark + Kısmi + Önceki), _dengeli, _fiyat, _urun_grubu,
+    _kod (görüntü için orijinal Malzeme Kodu metni), _kod_no (eşleştirme için int64 kod anahtarı), _sigara
+    ve kasa_kodlari verilirse _kasa.
+    Zaten hazırlanmış bir frame gelirse tekrar hesaplanmaz; sadece _kasa verilen
+    kasa_kodlari ile yeniden kurulur (farklı kod kümesiyle bayat kalmasın).
+    """
+    if '_toplam' in df.columns:
+        if kasa_kodlari is not None:
+            df = df.copy(deep=False)
+            df['_kasa'] = df['_kod_no'].isin(build_code_index(kasa_kodlari))
+        return df
+    
+    p = df.copy(deep=False)
+    
+    p['_toplam'] = p['Fark Miktarı'] + p['Kısmi Envanter Miktarı'] + p['Önceki Fark Miktarı']
+    p['_dengeli'] = p['_toplam'].abs() <= 0.01
+    
+    if 'Birim Fiyat' in p.columns:
+        p['_fiyat'] = p['Birim Fiyat'].fillna(0)
+    else:
+        p['_fiyat'] = 0
+    
+    if 'Mal Grubu Tanımı' in p.columns:
+        p['_urun_grubu'] = p['Mal Grubu Tanımı']
+    elif 'Ürün Grubu' in p.columns:
+        p['_urun_grubu'] = p['Ürün Grubu']
+    else:
+        p['_urun_grubu'] = ''
+    
+    if 'Malzeme Kodu' in p.columns:
+        # Metin (görüntü) ve anahtar (eşleştirme) ayrı tutulur: '0012' anahtarda 12 olur, metinde kalır
+        p['_kod'] = code_text(p['Malzeme Kodu'])
+        p['_kod_no'] = code_key(p['Malzeme Kodu'])
+    else:
+        p['_kod'] = ''
+        p['_kod_no'] = -1
+    
+    # Grup kolonları bir kez normalize edilir (_norm_*), diğer dedektörler de bunları kullanır
+    grup_kolonlari = [c for c in ['Mal Grubu Tanımı', 'Ürün Grubu', 'Ana Grup'] if c in p.columns]
+    p = add_normalized_columns(p, grup_kolonlari)
+    sigara = pd.Series(False, index=p.index)
+    for col in grup_kolonlari:
+        sigara |= tr_contains(p[norm_col(col)], SIGARA_PATTERN, normalized=True)
+    p['_sigara'] = sigara
+    
+    if kasa_kodlari is not None:
+        p['_kasa'] = p['_kod_no'].isin(build_code_index(kasa_kodlari))
+    
+    return p
+
+
+def insert_store_column(result_df, df, mask, key='Malzeme Kodu'):
+    """
+    Çok mağazalı frame: 'Mağaza Kodu' varsa sonucun ilk kolonu yapılır.
+    Dönüş: (result_df, duplicate anahtarı) - mağaza varsa temizlik mağaza×ürün bazında
+    """
+    if 'Mağaza Kodu' not in df.columns:
+        return result_df, [key]
+    
+    result_df.insert(0, 'Mağaza Kodu', df.loc[mask, 'Mağaza Kodu'])
+    return result_df, ['Mağaza Kodu', key]
+
+
+def count_flagged_products(df, mask, keys=None):
+    """
+    Dedektör maskesine giren ürün sayısı - mağaza (veya keys, örn. mağaza×dönem) bazında
+    Dedektör tablolarındaki duplicate temizliği ile aynı: her ürün grup başına bir kez sayılır
+    """
+    keys = keys or ['Mağaza Kodu']
+    if not mask.any():
+        return pd.Series(dtype=int)
+    
+    return df.loc[mask, keys + ['Malzeme Kodu']].drop_duplicates().groupby(keys, observed=True).size()
@@ -1,7 +1,10 @@
 # ==================== KASA ACTIVITY ====================
 # 10 TL ürünleri kontrolü
 
+import numpy as np
 import pandas as pd
+from .inventory_analysis import build_code_index
+from .detector_engine import dedektor, run_detectors
 
 # 10 TL Ürünleri Ürün Kodları (209 adet)
 KASA_AKTIVITESI_KODLARI = {
@@ -28,6 +31,9 @@ KASA_AKTIVITESI_KODLARI = {
     '24004196', '24004115', '14002424', '24003641', '24004972', '13001481', '24003327', '24000004', '23000122',
 }
 
+# Hazır int64 kod index'i (prepare_detection_frame eşleştirmesi bununla yapılır)
+KASA_KOD_INDEX = build_code_index(KASA_AKTIVITESI_KODLARI)
+
 
 def load_kasa_activity_codes():
     """Kasa aktivitesi ürün kodlarını döndür"""
@@ -35,61 +41,57 @@ def load_kasa_activity_codes():
 
 
 def check_kasa_activity_products(df, kasa_kodlari):
+    """10 TL ürünleri kontrolü - run_detectors sarmalayıcısı (bkz. kasa_activity_table)"""
+    sonuc = run_detectors(df, kasa_kodlari, sadece=['kasa'])
+    return sonuc['kasa'], sonuc['kasa_ozet']
+
+
+@dedektor('kasa')
+def kasa_activity_table(df):
     """
-    10 TL Ürünleri Kontrolü
+    10 TL Ürünleri Kontrolü (hazırlanmış frame, _kasa kolonu ile)
     Fiyat değişikliği olan ürünlerde manipülasyon riski
     FORMÜL: Fark + Kısmi (Önceki dahil değil)
     """
-    results = []
+    if len(df) == 0:
+        return pd.DataFrame(), {'toplam_urun': 0, 'sorunlu_urun': 0, 'toplam_adet': 0, 'toplam_tutar': 0}
+    
+    kasa = df['_kasa']
+    
+    fark = df.loc[kasa, 'Fark Miktarı'].fillna(0)
+    kismi = df.loc[kasa, 'Kısmi Envanter Miktarı'].fillna(0)
+    toplam = fark + kismi
+    
+    sifir = pd.Series(0, index=toplam.index)
+    fark_tutari = df.loc[kasa, 'Fark Tutarı'] if 'Fark Tutarı' in df.columns else sifir
+    kismi_tutari = df.loc[kasa, 'Kısmi Envanter Tutarı'] if 'Kısmi Envanter Tutarı' in df.columns else sifir
+    urun_toplam_tutar = fark_tutari + kismi_tutari
     
-    toplam_adet = 0
-    toplam_tutar = 0
-    eslesen_urun = 0
+    sorunlu = toplam != 0
+    fazla = toplam > 0
     
-    for idx, row in df.iterrows():
-        kod_raw = row.get('Malzeme Kodu', '')
-        kod_str = str(kod_raw).replace('.0', '').strip()
-        
-        if kod_str in kasa_kodlari:
-            eslesen_urun += 1
-            fark = row['Fark Miktarı'] if pd.notna(row['Fark Miktarı']) else 0
-            kismi = row['Kısmi Envanter Miktarı'] if pd.notna(row['Kısmi Envanter Miktarı']) else 0
-            toplam = fark + kismi
-            
-            fark_tutari = row.get('Fark Tutarı', 0) or 0
-            kismi_tutari = row.get('Kısmi Envanter Tutarı', 0) or 0
-            urun_toplam_tutar = fark_tutari + kismi_tutari
-            
-            toplam_adet += toplam
-            toplam_tutar += urun_toplam_tutar
-            
-            if toplam != 0:
-                if toplam > 0:
-                    durum = "FAZLA (+)"
-                else:
-                    durum = "AÇIK (-)"
-                
-                results.append({
-                    'Malzeme Kodu': kod_str,
-                    'Malzeme Adı': row.get('Malzeme Adı', ''),
-                    'Fark': fark,
-                    'Kısmi': kismi,
-                    'TOPLAM': toplam,
-                    'Tutar': urun_toplam_tutar,
-                    'Durum': durum
-                })
+    result_df = pd.DataFrame({
+        'Malzeme Kodu': df.loc[kasa, '_kod'],
+        'Malzeme Adı': df.loc[kasa, 'Malzeme Adı'] if 'Malzeme Adı' in df.columns else '',
+        'Fark': fark,
+        'Kısmi': kismi,
+        'TOPLAM': toplam,
+        'Tutar': urun_toplam_tutar,
+        'Durum': np.where(fazla, "FAZLA (+)", "AÇIK (-)"),
+        '_sort': (~fazla).astype(int)
+    }, index=df.index[kasa])[sorunlu].reset_index(drop=True)
     
-    result_df = pd.DataFrame(results)
     if len(result_df) > 0:
-        result_df['_sort'] = result_df['TOPLAM'].apply(lambda x: 0 if x > 0 else 1)
         result_df = result_df.sort_values(['_sort', 'TOPLAM'], ascending=[True, False])
         result_df = result_df.drop('_sort', axis=1)
+    else:
+        result_df = pd.DataFrame()
     
     summary = {
-        'toplam_urun': eslesen_urun,
-        'sorunlu_urun': len(results),
-        'toplam_adet': toplam_adet,
-        'toplam_tutar': toplam_tutar
+        'toplam_urun': int(kasa.sum()),
+        'sorunlu_urun': int(sorunlu.sum()),
+        'toplam_adet': toplam.sum(),
+        'toplam_tutar': urun_toplam_tutar.sum()
     }
     
     return result_df, summary
@@ -1,8 +1,14 @@
 # ==================== REGION ANALYSIS ====================
 # Bölge geneli analiz
 
+import numpy as np
 import pandas as pd
-from config import RISK_CONFIG
+from .risk_calculator import score_store_risk
+from .inventory_analysis import prepare_detection_frame, count_flagged_products
+from .chronic_analysis import chronic_mask, chronic_fire_mask
+from .fire_manipulation import fire_manipulation_mask
+from .external_theft import external_theft_mask
+from .cigarette_analysis import sigara_net_by_store
 
 
 def get_price_col(df):
@@ -14,58 +20,31 @@ def get_price_col(df):
     return pd.Series(0, index=df.index, dtype=float)
 
 
-def compute_sigara_acik_by_store(df):
-    """Sigara açığını mağaza bazında vektörel hesapla"""
-    cols = [c for c in ['Mal Grubu Tanımı', 'Ürün Grubu', 'Ana Grup'] if c in df.columns]
-    if not cols:
+def compute_sigara_acik_by_store(df, keys=None):
+    """Sigara açığını mağaza (veya keys, örn. mağaza×dönem) bazında vektörel hesapla"""
+    net = sigara_net_by_store(df, keys)['Net']
+    if net.empty:
         return pd.Series(dtype=float)
     
-    def norm_turkish(s):
-        s = s.fillna('').astype(str).str.upper()
-        return (s.str.replace('İ', 'I', regex=False)
-                 .str.replace('Ş', 'S', regex=False)
-                 .str.replace('Ğ', 'G', regex=False)
-                 .str.replace('Ü', 'U', regex=False)
-                 .str.replace('Ö', 'O', regex=False)
-                 .str.replace('Ç', 'C', regex=False)
-                 .str.replace('ı', 'I', regex=False))
-    
-    masks = []
-    for c in cols:
-        v = norm_turkish(df[c])
-        masks.append(v.str.contains(r'SIGARA|TUTUN', regex=True, na=False))
-    
-    sig_mask = masks[0]
-    for m in masks[1:]:
-        sig_mask = sig_mask | m
-    
-    required_cols = ['Mağaza Kodu', 'Fark Miktarı', 'Kısmi Envanter Miktarı', 'Önceki Fark Miktarı']
-    available_cols = [c for c in required_cols if c in df.columns]
-    
-    if 'Mağaza Kodu' not in available_cols:
-        return pd.Series(dtype=float)
-    
-    sig_df = df.loc[sig_mask, available_cols].copy()
-    
-    if sig_df.empty:
-        return pd.Series(dtype=float)
-    
-    sig_df['net'] = 0.0
-    if 'Fark Miktarı' in sig_df.columns:
-        sig_df['net'] += sig_df['Fark Miktarı'].fillna(0)
-    if 'Kısmi Envanter Miktarı' in sig_df.columns:
-        sig_df['net'] += sig_df['Kısmi Envanter Miktarı'].fillna(0)
-    if 'Önceki Fark Miktarı' in sig_df.columns:
-        sig_df['net'] += sig_df['Önceki Fark Miktarı'].fillna(0)
-    
-    net_by_store = sig_df.groupby('Mağaza Kodu')['net'].sum()
-    sigara_acik = (-net_by_store).clip(lower=0)
-    
-    return sigara_acik
+    return (-net).clip(lower=0)
+
+
+def _align(series, index):
+    """Gösterge Series'ini mağaza (×dönem) index'ine hizala, olmayan = NaN"""
+    if len(series) == 0:
+        return pd.Series(np.nan, index=index)
+    return series.reindex(index)
 
 
-def analyze_region(df, kasa_kodlari):
-    """Bölge geneli analiz - HIZLI VERSİYON"""
+def analyze_region(df, kasa_kodlari, by_period=False):
+    """
+    Bölge geneli analiz - HIZLI VERSİYON
+    
+    by_period=True: (Mağaza Kodu, Envanter Dönemi) bazında tek geçişte analiz;
+    mağaza×dönem tablosu + dönemden döneme farklar (add_period_deltas) döner
+    """
+    by_period = by_period and 'Envanter Dönemi' in df.columns
+    keys = ['Mağaza Kodu', 'Envanter Dönemi'] if by_period else ['Mağaza Kodu']
     
     magazalar = df['Mağaza Kodu'].dropna().unique().tolist()
     
@@ -87,7 +66,7 @@ def analyze_region(df, kasa_kodlari):
     if 'Satış Müdürü' in df.columns:
         agg_dict['Satış Müdürü'] = 'first'
     
-    store_metrics = df.groupby('Mağaza Kodu').agg(agg_dict).reset_index()
+    store_metrics = df.groupby(keys, observed=True).agg(agg_dict).reset_index()
     
     if 'Satış Müdürü' not in store_metrics.columns:
         store_metrics['Satış Müdürü'] = ''
@@ -107,7 +86,7 @@ def analyze_region(df, kasa_kodlari):
     try:
         store_metrics['Gün'] = (pd.to_datetime(store_metrics['Envanter Tarihi']) - 
                                 pd.to_datetime(store_metrics['Envanter Başlangıç Tarihi'])).dt.days
-        store_metrics['Gün'] = store_metrics['Gün'].apply(lambda x: max(1, x) if pd.notna(x) else 1)
+        store_metrics['Gün'] = store_metrics['Gün'].clip(lower=1).fillna(1).astype(int)
     except:
         store_metrics['Gün'] = 1
     
@@ -116,22 +95,29 @@ def analyze_region(df, kasa_kodlari):
     
     # Risk analizleri
     price = get_price_col(df)
-    ic_hirsizlik = df[(price >= 100) & (df['Fark Miktarı'] < 0)].groupby('Mağaza Kodu').size()
-    kronik = df[(df['Önceki Fark Miktarı'] < 0) & (df['Fark Miktarı'] < 0)].groupby('Mağaza Kodu').size()
+    ic_hirsizlik = df[(price >= 100) & (df['Fark Miktarı'] < 0)].groupby(keys, observed=True).size()
+    
+    # Kronik sayıları dedektörlerle aynı maskelerden (dengelenmiş hariç, ürün başına bir kez)
+    prepared = prepare_detection_frame(df, kasa_kodlari if kasa_kodlari else None)
+    kronik = count_flagged_products(prepared, chronic_mask(prepared), keys)
     
     if 'Önceki Fire Miktarı' in df.columns:
-        kronik_fire = df[(df['Önceki Fire Miktarı'] < 0) & (df['Fire Miktarı'] < 0)].groupby('Mağaza Kodu').size()
+        kronik_fire = count_flagged_products(prepared, chronic_fire_mask(prepared), keys)
     else:
-        kronik_fire = pd.Series(0, index=magazalar)
+        kronik_fire = pd.Series(dtype=int)
     
-    sigara_acik_series = compute_sigara_acik_by_store(df)
-    fire_manip = df[abs(df['Fire Miktarı']) > abs(df['Fark Miktarı'].fillna(0) + df['Kısmi Envanter Miktarı'].fillna(0))].groupby('Mağaza Kodu').size()
+    sigara_acik_series = compute_sigara_acik_by_store(prepared, keys)
+    
+    # Fire manipülasyonu / dış hırsızlık - dedektör maskeleriyle aynı tanım
+    fire_manip = count_flagged_products(prepared, fire_manipulation_mask(prepared), keys)
+    if 'İptal Satır Miktarı' in df.columns:
+        dis_hirsizlik = prepared[external_theft_mask(prepared)].groupby(keys, observed=True).size()
+    else:
+        dis_hirsizlik = pd.Series(dtype=int)
     
-    # 10TL ürünleri
-    kasa_set = set(str(k) for k in kasa_kodlari) if kasa_kodlari else set()
-    if len(kasa_set) > 0:
-        kasa_mask = df['Malzeme Kodu'].astype(str).isin(kasa_set)
-        kasa_agg = df[kasa_mask].groupby('Mağaza Kodu').agg({
+    # 10TL ürünleri - eşleşme prepare_detection_frame'deki int64 kod anahtarından (_kasa)
+    if kasa_kodlari:
+        kasa_agg = prepared[prepared['_kasa']].groupby(keys, observed=True).agg({
             'Fark Miktarı': 'sum',
             'Kısmi Envanter Miktarı': 'sum',
             'Fark Tutarı': 'sum',
@@ -145,116 +131,66 @@ def analyze_region(df, kasa_kodlari):
     else:
         kasa_agg = pd.DataFrame({'10TL Adet': [], '10TL Tutar': []})
     
-    # Sonuçları birleştir
-    results = []
-    rw = RISK_CONFIG.get('risk_weights', {})
-    rl = RISK_CONFIG.get('risk_levels', {})
-    max_score = RISK_CONFIG.get('max_risk_score', 100)
+    # Göstergeleri mağaza (×dönem) index'ine hizala
+    result_df = store_metrics.set_index(keys)
+    indicators = {
+        'İç Hırs.': ic_hirsizlik,
+        'Kr.Açık': kronik,
+        'Kr.Fire': kronik_fire,
+        'Sigara': sigara_acik_series,
+        'Fire Man.': fire_manip,
+        'Dış Hırs.': dis_hirsizlik,
+        '10TL Adet': kasa_agg['10TL Adet'],
+        '10TL Tutar': kasa_agg['10TL Tutar'],
+    }
+    for col, series in indicators.items():
+        result_df[col] = _align(series, result_df.index).fillna(0)
+    for col in ['İç Hırs.', 'Kr.Açık', 'Kr.Fire', 'Fire Man.', 'Dış Hırs.']:
+        result_df[col] = result_df[col].astype(int)
     
-    for _, row in store_metrics.iterrows():
-        mag = row['Mağaza Kodu']
-        
-        ic_hrs = ic_hirsizlik.get(mag, 0)
-        kr_acik = kronik.get(mag, 0)
-        kr_fire = kronik_fire.get(mag, 0) if mag in kronik_fire.index else 0
-        sig_acik = sigara_acik_series.get(mag, 0) if mag in sigara_acik_series.index else 0
-        fire_man = fire_manip.get(mag, 0) if mag in fire_manip.index else 0
-        kasa_adet = kasa_agg.loc[mag, '10TL Adet'] if mag in kasa_agg.index else 0
-        kasa_tutar = kasa_agg.loc[mag, '10TL Tutar'] if mag in kasa_agg.index else 0
-        
-        # Risk puanı hesapla
-        risk_puan = 0
-        risk_nedenler = []
-        toplam_oran = row['Toplam %']
-        
-        to = rw.get('toplam_oran', {})
-        if toplam_oran > to.get('high', {}).get('threshold', 2):
-            risk_puan += to.get('high', {}).get('points', 40)
-            risk_nedenler.append(f"Toplam %{toplam_oran:.1f}")
-        elif toplam_oran > to.get('medium', {}).get('threshold', 1.5):
-            risk_puan += to.get('medium', {}).get('points', 25)
-        elif toplam_oran > to.get('low', {}).get('threshold', 1):
-            risk_puan += to.get('low', {}).get('points', 15)
-        
-        ih = rw.get('ic_hirsizlik', {})
-        if ic_hrs > ih.get('high', {}).get('threshold', 50):
-            risk_puan += ih.get('high', {}).get('points', 30)
-            risk_nedenler.append(f"İç hırs. {ic_hrs}")
-        elif ic_hrs > ih.get('medium', {}).get('threshold', 30):
-            risk_puan += ih.get('medium', {}).get('points', 20)
-        elif ic_hrs > ih.get('low', {}).get('threshold', 15):
-            risk_puan += ih.get('low', {}).get('points', 10)
-        
-        sg = rw.get('sigara', {})
-        if sig_acik > sg.get('high', {}).get('threshold', 5):
-            risk_puan += sg.get('high', {}).get('points', 35)
-            risk_nedenler.append(f"🚬 SİGARA {sig_acik:.0f}")
-        elif sig_acik > sg.get('low', {}).get('threshold', 0):
-            risk_puan += sg.get('low', {}).get('points', 20)
-        
-        kr = rw.get('kronik', {})
-        if kr_acik > kr.get('high', {}).get('threshold', 100):
-            risk_puan += kr.get('high', {}).get('points', 15)
-        elif kr_acik > kr.get('low', {}).get('threshold', 50):
-            risk_puan += kr.get('low', {}).get('points', 10)
-        
-        fm = rw.get('fire_manipulasyon', {})
-        if fire_man > fm.get('high', {}).get('threshold', 10):
-            risk_puan += fm.get('high', {}).get('points', 20)
-        elif fire_man > fm.get('low', {}).get('threshold', 5):
-            risk_puan += fm.get('low', {}).get('points', 10)
-        
-        kt = rw.get('kasa_10tl', {})
-        if kasa_adet > kt.get('high', {}).get('threshold', 20):
-            risk_puan += kt.get('high', {}).get('points', 15)
-        elif kasa_adet > kt.get('low', {}).get('threshold', 10):
-            risk_puan += kt.get('low', {}).get('points', 10)
-        
-        risk_puan = min(risk_puan, max_score)
-        
-        if risk_puan >= rl.get('kritik', 60):
-            risk_seviye = "🔴 KRİTİK"
-        elif risk_puan >= rl.get('riskli', 40):
-            risk_seviye = "🟠 RİSKLİ"
-        elif risk_puan >= rl.get('dikkat', 20):
-            risk_seviye = "🟡 DİKKAT"
-        else:
-            risk_seviye = "🟢 TEMİZ"
-        
-        results.append({
-            'Mağaza Kodu': mag,
-            'Mağaza Adı': row['Mağaza Adı'],
-            'SM': row.get('Satış Müdürü', ''),
-            'BS': row['Bölge Sorumlusu'],
-            'Satış': row['Satış'],
-            'Fark': row['Fark'],
-            'Fire': row['Fire'],
-            'Toplam Açık': row['Toplam Açık'],
-            'Fark %': row['Fark %'],
-            'Fire %': row['Fire %'],
-            'Toplam %': row['Toplam %'],
-            'Gün': row['Gün'],
-            'Günlük Fark': row['Günlük Fark'],
-            'Günlük Fire': row['Günlük Fire'],
-            'İç Hırs.': ic_hrs,
-            'Kr.Açık': kr_acik,
-            'Kr.Fire': kr_fire,
-            'Sigara': sig_acik,
-            'Fire Man.': fire_man,
-            '10TL Adet': kasa_adet,
-            '10TL Tutar': kasa_tutar,
-            'Risk Puan': risk_puan,
-            'Risk': risk_seviye,
-            'Risk Nedenleri': " | ".join(risk_nedenler) if risk_nedenler else "-"
-        })
+    result_df = result_df.reset_index().rename(columns={'Satış Müdürü': 'SM', 'Bölge Sorumlusu': 'BS'})
+    
+    # Risk puanı / seviye / nedenler - RISK_CONFIG ile vektörel
+    result_df = result_df.join(score_store_risk(result_df))
+    
+    result_df = result_df[keys + [
+        'Mağaza Adı', 'SM', 'BS', 'Satış', 'Fark', 'Fire', 'Toplam Açık',
+        'Fark %', 'Fire %', 'Toplam %', 'Gün', 'Günlük Fark', 'Günlük Fire',
+        'İç Hırs.', 'Kr.Açık', 'Kr.Fire', 'Sigara', 'Fire Man.', 'Dış Hırs.', '10TL Adet', '10TL Tutar',
+        'Risk Puan', 'Risk', 'Risk Nedenleri'
+    ]]
+    
+    if by_period:
+        return add_period_deltas(result_df)
     
-    result_df = pd.DataFrame(results)
     if len(result_df) > 0:
         result_df = result_df.sort_values('Risk Puan', ascending=False)
     
     return result_df
 
 
+# Dönemden döneme fark alınan kolonlar (GM trend)
+PERIOD_DELTA_COLUMNS = ['Risk Puan', 'Toplam %', 'Fark %', 'Fire %', 'Toplam Açık', 'İç Hırs.', 'Sigara']
+
+
+def add_period_deltas(df, columns=None, store_col='Mağaza Kodu', period_col='Envanter Dönemi'):
+    """
+    Mağaza×dönem tablosuna bir önceki döneme göre fark kolonları ekle ('Δ <kolon>')
+    Mağazanın ilk dönemi için fark NaN. Sonuç mağaza, dönem sırasında döner.
+    """
+    if len(df) == 0 or period_col not in df.columns:
+        return df
+    
+    df = df.sort_values([store_col, period_col], kind='stable').reset_index(drop=True)
+    grouped = df.groupby(store_col, sort=False, observed=True)
+    
+    for col in (columns or PERIOD_DELTA_COLUMNS):
+        if col in df.columns:
+            df[f"Δ {col}"] = grouped[col].diff()
+    
+    return df
+
+
 def generate_executive_summary(df, kasa_activity_df=None, kasa_summary=None):
     """Yönetici özeti - mal grubu bazlı yorumlar"""
     comments = []
@@ -264,7 +200,7 @@ def generate_executive_summary(df, kasa_activity_df=None, kasa_summary=None):
     df_copy['Önceki Fark Tutarı'] = df_copy.get('Önceki Fark Tutarı', pd.Series(0)).fillna(0)
     df_copy['Toplam Tutar'] = df_copy['Fark Tutarı'] + df_copy['Kısmi Envanter Tutarı'] + df_copy['Önceki Fark Tutarı']
     
-    group_stats = df_copy.groupby('Ürün Grubu').agg({
+    group_stats = df_copy.groupby('Ürün Grubu', observed=True).agg({
         'Toplam Tutar': 'sum',
         'Fire Tutarı': 'sum',
         'Satış Tutarı': 'sum',
@@ -323,7 +259,7 @@ def aggregate_by_group(store_df, group_col):
         'Risk Puan': 'mean',
     }
     
-    result = store_df.groupby(group_col).agg(agg_dict).reset_index()
+    result = store_df.groupby(group_col, observed=True).agg(agg_dict).reset_index()
     result.columns = [group_col, 'Mağaza Sayısı', 'Satış', 'Fark', 'Fire', 'Toplam Açık', 
                       'İç Hırs.', 'Kronik', 'Sigara', '10TL Adet', '10TL Tutar', 'Ort. Risk']
     
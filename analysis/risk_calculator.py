@@ -1,7 +1,93 @@
 # ==================== RISK CALCULATOR ====================
 # Risk puanı hesaplama
 
+import numpy as np
 import pandas as pd
+from config import RISK_CONFIG
+
+# Mağaza risk kuralları: (RISK_CONFIG anahtarı, varsayılan kolon, varsayılan kademeler, neden formatı)
+# Kademeler yukarıdan aşağı denenir (high → medium → low), ilk aşılan eşiğin puanı alınır.
+# Neden metni sadece 'high' kademesinde yazılır.
+STORE_RISK_RULES = [
+    ('toplam_oran', 'Toplam %', {'high': (2.0, 40), 'medium': (1.5, 25), 'low': (1.0, 15)}, 'Toplam %{:.1f}'),
+    ('ic_hirsizlik', 'İç Hırs.', {'high': (50, 30), 'medium': (30, 20), 'low': (15, 10)}, 'İç hırs. {:.0f}'),
+    ('sigara', 'Sigara', {'high': (5, 35), 'low': (0, 20)}, '🚬 SİGARA {:.0f}'),
+    ('kronik', 'Kr.Açık', {'high': (100, 15), 'low': (50, 10)}, None),
+    ('fire_manipulasyon', 'Fire Man.', {'high': (10, 20), 'low': (5, 10)}, None),
+    ('kasa_10tl', '10TL Adet', {'high': (20, 15), 'low': (10, 10)}, None),
+]
+
+RISK_LEVEL_LABELS = ['🔴 KRİTİK', '🟠 RİSKLİ', '🟡 DİKKAT']
+RISK_LEVEL_CLEAN = '🟢 TEMİZ'
+
+
+def get_risk_level(score, config=None):
+    """Risk puanı (skaler veya dizi) → seviye etiketi, eşikler RISK_CONFIG['risk_levels']"""
+    rl = (config or RISK_CONFIG).get('risk_levels', {})
+    score = np.asarray(score)
+    levels = np.select(
+        [score >= rl.get('kritik', 60), score >= rl.get('riskli', 40), score >= rl.get('dikkat', 20)],
+        RISK_LEVEL_LABELS,
+        RISK_LEVEL_CLEAN
+    )
+    return levels if levels.ndim else str(levels)
+
+
+def score_store_risk(df, columns=None, config=None):
+    """
+    Vektörel mağaza risk puanı - analyze_region ve SM/GM view özeti aynı kuralları kullanır
+    
+    df: mağaza (veya mağaza×dönem) başına bir satır, gösterge kolonlarıyla
+    columns: kural → kolon eşlemesi (örn. {'kronik': 'Kronik', 'kasa_10tl': 'Kasa Adet'});
+             olmayan kolonlar 0 kabul edilir
+    config: RISK_CONFIG yerine kullanılacak ağırlıklar
+    
+    Dönüş: df.index ile 'Risk Puan', 'Risk', 'Risk Nedenleri' DataFrame'i
+    """
+    config = config or RISK_CONFIG
+    rw = config.get('risk_weights', {})
+    columns = columns or {}
+    
+    puan = np.zeros(len(df), dtype=np.int64)
+    nedenler = []
+    
+    for key, default_col, default_tiers, neden_format in STORE_RISK_RULES:
+        col = columns.get(key, default_col)
+        if col not in df.columns:
+            continue
+        
+        values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+        cfg = rw.get(key, {})
+        
+        conds, points = [], []
+        for tier, (th, pts) in default_tiers.items():
+            tier_cfg = cfg.get(tier, {})
+            conds.append(values > tier_cfg.get('threshold', th))
+            points.append(tier_cfg.get('points', pts))
+        
+        puan = puan + np.select(conds, points, 0)
+        
+        if neden_format:
+            nedenler.append((conds[0], values, neden_format))
+    
+    puan = np.minimum(puan, config.get('max_risk_score', 100))
+    
+    # Nedenler: sadece nedeni olan satırlar için string üret
+    neden_str = pd.Series('', index=df.index, dtype=object)
+    for mask, values, neden_format in nedenler:
+        if not mask.any():
+            continue
+        parca = pd.Series(values[mask], index=df.index[mask]).map(neden_format.format)
+        mevcut = neden_str[mask]
+        neden_str[mask] = mevcut.where(mevcut == '', mevcut + ' | ') + parca
+    
+    neden_str[neden_str == ''] = '-'
+    
+    return pd.DataFrame({
+        'Risk Puan': puan,
+        'Risk': get_risk_level(puan, config),
+        'Risk Nedenleri': neden_str,
+    }, index=df.index)
 
 
 def calculate_store_risk(df, internal_df, chronic_df, cigarette_df):
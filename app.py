@@ -17,7 +17,7 @@ st.set_page_config(
 )
 
 # ==================== MODÜL IMPORTLARI ====================
-from config import RISK_CONFIG, load_json_data, SM_BS_MAGAZA, SEGMENT_URUN
+from config import RISK_CONFIG, KRONIK_THRESHOLD, load_json_data, SM_BS_MAGAZA, SEGMENT_URUN
 from auth import login, logout, get_current_user
 
 from database import (
@@ -26,7 +26,11 @@ from database import (
     get_available_stores_from_supabase,
     get_single_store_data,
     get_data_from_supabase,
-    get_sm_summary_from_view
+    get_period_history,
+    get_sm_summary_from_view,
+    ENVANTER_DATASET,
+    get_shared_dataset,
+    invalidate_shared_dataset
 )
 
 from analysis import (
@@ -35,19 +39,21 @@ from analysis import (
     detect_internal_theft,
     detect_chronic_products,
     detect_chronic_fire,
+    detect_chronic_history,
     detect_cigarette_shortage,
     find_product_families,
     detect_fire_manipulation,
     detect_external_theft,
     check_kasa_activity_products,
     load_kasa_activity_codes,
+    run_detectors,
     analyze_region,
     generate_executive_summary,
     calculate_store_risk,
     create_top_20_risky
 )
 
-from analysis.region_analysis import aggregate_by_group
+from analysis.region_analysis import aggregate_by_group, add_period_deltas
 
 from camera import (
     get_iptal_verisi_from_sheets,
@@ -68,9 +74,14 @@ from utils import filter_data
 try:
     from surekli_envanter_module import (
         detect_envanter_type,
-        prepare_surekli_data,
-        analyze_surekli_envanter,
-        create_surekli_excel_report,
+        get_magaza_adi_col,
+        get_magaza_onceki_kayitlar,
+        hesapla_risk_skoru,
+        hesapla_bolge_risk_skorlari,
+        get_bolge_surekli_verisi,
+        get_urun_medianlari,
+        risk_detay,
+        RISK_KRITER_ADLARI,
         detect_ic_hirsizlik_surekli,
         enrich_with_camera_surekli,
         create_ic_hirsizlik_excel_surekli
@@ -107,8 +118,8 @@ with col_title:
 with col_user:
     st.markdown(f"👤 **{st.session_state.user.upper()}**")
     if st.button("🚪 Çıkış", key="logout_btn"):
-        if "df_all" in st.session_state:
-            del st.session_state.df_all
+        if "df_version" in st.session_state:
+            del st.session_state.df_version
         logout()
 
 # ==================== CACHE FONKSİYONLARI ====================
@@ -128,6 +139,17 @@ def get_available_periods_cached():
         pass
     return []
 
+@st.cache_data(ttl=300)
+def get_urun_medianlari_cached(donem):
+    """Sürekli envanter bölge medyanları (bölge sapma kriteri)"""
+    return get_urun_medianlari(donem, supabase)
+
+@st.cache_data(ttl=300)
+def get_bolge_risk_cached(donem):
+    """Sürekli envanter bölge risk matrisi (dönemin son sayımları)"""
+    df, df_onceki = get_bolge_surekli_verisi(supabase, donem)
+    return hesapla_bolge_risk_skorlari(df, df_onceki, get_urun_medianlari_cached(donem))
+
 @st.cache_data(ttl=300)
 def get_available_sms_cached():
     """SM'leri al"""
@@ -144,19 +166,28 @@ def get_available_sms_cached():
         pass
     return []
 
+def _load_envanter_dataset():
+    """Tüm envanter verisini çek ve analiz için hazırla (compact)"""
+    df_raw = get_data_from_supabase(satis_muduru=None, donemler=None, show_progress=True)
+    if len(df_raw) == 0:
+        return pd.DataFrame()
+    return analyze_inventory(df_raw, compact=True)
+
 def load_all_data_once():
-    """Tüm veriyi bir kez yükle"""
-    if "df_all" not in st.session_state or st.session_state.df_all is None:
-        with st.spinner("📊 Veriler yükleniyor..."):
-            df_raw = get_data_from_supabase(satis_muduru=None, donemler=None)
-            
-            if len(df_raw) > 0:
-                df_analyzed = analyze_inventory(df_raw)
-                st.session_state.df_all = df_analyzed
-            else:
-                st.session_state.df_all = pd.DataFrame()
+    """
+    Tüm veri - süreç genelinde TEK kopya (tüm oturumlar aynı salt-okunur frame'i okur)
+    Oturumda sadece versiyon tutulur; filtreler filter_data ile yapılır
+    """
+    with st.spinner("📊 Veriler yükleniyor..."):
+        df_all, version = get_shared_dataset(ENVANTER_DATASET, _load_envanter_dataset)
     
-    return st.session_state.df_all
+    if st.session_state.get('df_version') != version:
+        st.session_state.df_version = version
+        bellek = df_all.attrs.get('bellek')
+        if bellek:
+            st.caption(f"💾 Bellek: {bellek['once'] / 1e6:.0f} MB → {bellek['sonra'] / 1e6:.0f} MB ({bellek['oran']:.1f}x)")
+    
+    return df_all
 
 # ==================== DOSYA YÜKLEME ====================
 uploaded_file = st.file_uploader("📁 Excel dosyası yükleyin (Parçalı veya Sürekli)", type=['xlsx', 'xls'])
@@ -210,6 +241,7 @@ col_spacer, col_refresh = st.columns([10, 1])
 with col_refresh:
     if st.button("🔄", help="Verileri yenile"):
         st.cache_data.clear()
+        invalidate_shared_dataset(ENVANTER_DATASET)
         st.rerun()
 
 alt_sekme = st.radio("📦 Envanter Tipi", ["📦 Parçalı", "🔄 Sürekli"], horizontal=True)
@@ -266,6 +298,10 @@ if analysis_mode in ["SM_OZET", "BS_OZET", "GM_OZET"]:
         )
         
         if df_view is not None and len(df_view) > 0:
+            # Çoklu dönem: mağaza bazında bir önceki döneme göre trend kolonları
+            if len(selected_periods) > 1:
+                df_view = add_period_deltas(df_view)
+            
             # Debug: Kolonları göster (sorun çözülünce kaldır)
             # st.write("Kolonlar:", df_view.columns.tolist())
             
@@ -299,6 +335,28 @@ if analysis_mode in ["SM_OZET", "BS_OZET", "GM_OZET"]:
                     st.subheader("👥 BS Bazlı")
                     st.dataframe(bs_grouped, use_container_width=True)
             
+            # Sürekli envanter risk skorları: tüm mağazalar tek hesapla_bolge_risk_skorlari çağrısı
+            if analysis_mode in ["GM_OZET", "BS_OZET"] and SUREKLI_MODULE_LOADED:
+                with st.expander(f"🥩 Sürekli Envanter Risk ({selected_periods[0]})"):
+                    try:
+                        bolge_risk = get_bolge_risk_cached(selected_periods[0])
+                    except Exception as e:
+                        bolge_risk = None
+                        st.error(f"Sürekli envanter verisi alınamadı: {e}")
+                    
+                    if bolge_risk is not None and len(bolge_risk) > 0:
+                        bs_risk = bolge_risk.groupby('BS').agg(
+                            Mağaza=('Mağaza Kodu', 'size'),
+                            Ortalama=('Toplam', 'mean'),
+                            Kritik=('Seviye', lambda s: int((s == 'kritik').sum())),
+                            Riskli=('Seviye', lambda s: int((s == 'riskli').sum())),
+                        ).sort_values('Ortalama', ascending=False).round(1)
+                        st.dataframe(bs_risk, use_container_width=True)
+                        st.dataframe(bolge_risk.rename(columns=RISK_KRITER_ADLARI), use_container_width=True,
+                                     height=400, hide_index=True)
+                    elif bolge_risk is not None:
+                        st.info("📭 Bu dönem için sürekli envanter kaydı yok.")
+            
             # Mağaza listesi
             st.subheader("🏪 Mağazalar")
             
@@ -306,6 +364,9 @@ if analysis_mode in ["SM_OZET", "BS_OZET", "GM_OZET"]:
             all_possible_cols = ['Mağaza Kodu', 'Mağaza Adı', 'Satış', 'Fark', 'Fire', 'Toplam %', 
                                 'İç Hırs.', 'Kronik', 'Sigara', 'Risk', 'Risk Nedenleri', 'Risk Puan',
                                 'toplam_satis', 'toplam_fark', 'toplam_fire', 'risk_puan']
+            if len(selected_periods) > 1:
+                all_possible_cols[1:1] = ['Envanter Dönemi']
+                all_possible_cols += ['Δ Risk Puan', 'Δ Toplam %']
             display_cols = [c for c in all_possible_cols if c in df_view.columns]
             
             # Eğer hiç kolon bulunamadıysa tüm kolonları göster
@@ -359,32 +420,57 @@ elif analysis_mode == "PARCALI":
     # ===== PARÇALI ENVANTER =====
     st.subheader("📦 Parçalı Envanter Analizi")
     
+    df_analyzed = None
     if 'uploaded_df' in st.session_state and st.session_state.get('uploaded_type') == 'parcali':
         df = st.session_state['uploaded_df']
-        df_analyzed = analyze_inventory(df)
+        df_analyzed = analyze_inventory(df, compact=True)
+    else:
+        # Dosya yoksa Supabase'den mağaza: tüm oturumların paylaştığı tek frame filtrelenir
+        col1, col2 = st.columns(2)
+        with col1:
+            available_periods = get_available_periods_cached()
+            secili_donem = st.selectbox("📅 Dönem", available_periods, key="parcali_donem") if available_periods else None
+        with col2:
+            try:
+                magazalar = get_available_stores_from_supabase()
+            except Exception as e:
+                st.error(f"Mağaza listesi alınamadı: {e}")
+                magazalar = {}
+            secili_magaza = st.selectbox(
+                "🏪 Mağaza", [''] + sorted(magazalar), key="parcali_magaza",
+                format_func=lambda k: f"{k} - {magazalar.get(k, '')}" if k else "Seçiniz"
+            )
         
+        if secili_donem and secili_magaza:
+            df_analyzed = filter_data(load_all_data_once(), donemler=[secili_donem], magaza_kodu=secili_magaza)
+            if len(df_analyzed) == 0:
+                st.info("📭 Seçilen mağaza / dönem için veri bulunamadı.")
+    
+    if df_analyzed is not None and len(df_analyzed) > 0:
         # Mağaza bilgisi
         magaza_kodu = df_analyzed['Mağaza Kodu'].iloc[0] if 'Mağaza Kodu' in df_analyzed.columns else 'Bilinmiyor'
         magaza_adi = df_analyzed['Mağaza Adı'].iloc[0] if 'Mağaza Adı' in df_analyzed.columns else ''
         
         st.info(f"🏪 Mağaza: **{magaza_kodu}** - {magaza_adi}")
         
-        # Analizler
-        internal_df = detect_internal_theft(df_analyzed)
-        chronic_df = detect_chronic_products(df_analyzed)
-        chronic_fire_df = detect_chronic_fire(df_analyzed)
-        cigarette_df = detect_cigarette_shortage(df_analyzed)
-        family_df = find_product_families(df_analyzed)
-        fire_manip_df = detect_fire_manipulation(df_analyzed)
-        external_df = detect_external_theft(df_analyzed)
-        kasa_df, kasa_summary = check_kasa_activity_products(df_analyzed, KASA_KODLARI)
+        # Analizler - tek hazırlanmış frame üzerinden
+        tespitler = run_detectors(df_analyzed, KASA_KODLARI)
+        internal_df = tespitler['ic_hirsizlik']
+        chronic_df = tespitler['kronik']
+        chronic_fire_df = tespitler['kronik_fire']
+        cigarette_df = tespitler['sigara']
+        family_df = tespitler['aile']
+        fire_manip_df = tespitler['fire_manipulasyon']
+        external_df = tespitler['dis_hirsizlik']
+        kasa_df, kasa_summary = tespitler['kasa'], tespitler['kasa_ozet']
+        ozet = tespitler['ozet']
         
         # Metrikleri göster
         col1, col2, col3, col4 = st.columns(4)
-        col1.metric("İç Hırsızlık", len(internal_df))
-        col2.metric("Kronik Açık", len(chronic_df))
-        col3.metric("Sigara", len(cigarette_df) - 1 if len(cigarette_df) > 0 else 0)
-        col4.metric("10TL Ürün", kasa_summary.get('sorunlu_urun', 0))
+        col1.metric("İç Hırsızlık", ozet['ic_hirsizlik'])
+        col2.metric("Kronik Açık", ozet['kronik'])
+        col3.metric("Sigara", ozet['sigara'])
+        col4.metric("10TL Ürün", ozet['kasa_sorunlu'])
         
         # Tabs
         tabs = st.tabs(["🔒 İç Hırsızlık", "📊 Kronik", "🚬 Sigara", "👨‍👩‍👧 Aile", "💰 10TL"])
@@ -405,6 +491,16 @@ elif analysis_mode == "PARCALI":
                 st.dataframe(chronic_df, use_container_width=True)
             else:
                 st.success("✅ Kronik açık yok")
+            
+            # Geçmiş dönemlerden gerçek N-dönem kronik (KRONIK_THRESHOLD ardışık açık)
+            if st.checkbox(f"📈 Geçmiş dönemlerde {KRONIK_THRESHOLD}+ dönem üst üste açık veren ürünler", key="kronik_gecmis"):
+                n_donem = st.slider("Dönem sayısı", KRONIK_THRESHOLD, 24, 12, key="kronik_gecmis_n")
+                history_df = get_period_history(n_periods=n_donem, magaza_kodu=magaza_kodu)
+                kronik_gecmis_df = detect_chronic_history(history_df)
+                if len(kronik_gecmis_df) > 0:
+                    st.dataframe(kronik_gecmis_df, use_container_width=True)
+                else:
+                    st.success(f"✅ Son {n_donem} dönemde {KRONIK_THRESHOLD}+ dönem kronik açık yok")
         
         with tabs[2]:
             if len(cigarette_df) > 0:
@@ -461,27 +557,52 @@ elif analysis_mode == "SUREKLI":
         st.stop()
     
     if 'df_surekli' in st.session_state:
-        df_raw = st.session_state['df_surekli']
+        df_prepared = st.session_state['df_surekli']
         
         try:
-            df_prepared = prepare_surekli_data(df_raw)
-            
-            magaza_kodu = df_prepared['Mağaza Kodu'].iloc[0] if 'Mağaza Kodu' in df_prepared.columns else 'Bilinmiyor'
-            magaza_adi = df_prepared['Mağaza Adı'].iloc[0] if 'Mağaza Adı' in df_prepared.columns else ''
+            magaza_kodu = str(df_prepared['Mağaza Kodu'].iloc[0]) if 'Mağaza Kodu' in df_prepared.columns else 'Bilinmiyor'
+            magaza_adi_col = get_magaza_adi_col(df_prepared)
+            magaza_adi = str(df_prepared[magaza_adi_col].iloc[0]) if magaza_adi_col else ''
+            if 'Envanter Dönemi' in df_prepared.columns:
+                envanter_donemi = str(df_prepared['Envanter Dönemi'].iloc[0])
+            else:
+                envanter_donemi = datetime.now().strftime('%Y%m')
             
             st.info(f"🏪 Mağaza: **{magaza_kodu}** - {magaza_adi}")
             
-            analysis_result = analyze_surekli_envanter(df_prepared)
+            # Bu dönemin önceki sayımları (kronik / tekrar kriterleri bir önceki sayımla eşleşir)
+            df_onceki = get_magaza_onceki_kayitlar(supabase, magaza_kodu, envanter_donemi)
             
+            # Sadece puanlar; detay satırları seçilen kriter için risk_frame'den üretilir
+            urun_medianlar = get_urun_medianlari_cached(envanter_donemi)
+            if urun_medianlar is None:
+                st.warning("⚠️ Bölge medyanları alınamadı, bölge sapma kriteri puanlanmadı.")
+            risk = hesapla_risk_skoru(df_prepared, df_onceki, urun_medianlar, detay=False)
+            
+            fark_col = pd.to_numeric(df_prepared.get('Fark Tutarı', pd.Series(dtype=float)), errors='coerce')
+            fire_col = pd.to_numeric(df_prepared.get('Fire Tutarı', pd.Series(dtype=float)), errors='coerce')
             col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Toplam Ürün", analysis_result.get('toplam_urun', 0))
-            col2.metric("Açık Ürün", analysis_result.get('acik_urun', 0))
-            col3.metric("Toplam Açık", f"{analysis_result.get('toplam_acik', 0):,.0f} TL")
-            col4.metric("Risk Seviyesi", analysis_result.get('risk_seviye', 'BELİRSİZ'))
+            col1.metric("Toplam Ürün", len(df_prepared))
+            col2.metric("Açık Ürün", int((fark_col < 0).sum()))
+            col3.metric("Toplam Açık", f"{fark_col.sum() + fire_col.sum():,.0f} TL")
+            col4.metric("Risk Puanı", f"{risk['emoji']} {risk['toplam_puan']}/{risk['max_puan']}",
+                        risk['seviye'].upper())
+            
+            st.subheader("🎯 Risk Skoru")
+            risk_tablosu = pd.DataFrame([
+                {'Kriter': RISK_KRITER_ADLARI[k], 'Puan': d['puan'], 'Max': d['max'], 'Açıklama': d['aciklama']}
+                for k, d in risk['detaylar'].items()
+            ])
+            st.dataframe(risk_tablosu, use_container_width=True, hide_index=True)
+            
+            puanli = [k for k, d in risk['detaylar'].items() if d['puan'] > 0]
+            if puanli:
+                secili_kriter = st.selectbox("🔎 Kriter detayı", puanli, format_func=RISK_KRITER_ADLARI.get,
+                                             key="surekli_risk_kriter")
+                st.dataframe(pd.DataFrame(risk_detay(risk['risk_frame'], secili_kriter)), use_container_width=True)
             
             st.subheader("🔒 İç Hırsızlık Analizi")
             
-            df_onceki = analysis_result.get('df_onceki', pd.DataFrame())
             ic_hirsizlik_df = detect_ic_hirsizlik_surekli(df_prepared, df_onceki)
             
             if len(ic_hirsizlik_df) > 0:
@@ -506,18 +627,6 @@ elif analysis_mode == "SUREKLI":
                     st.warning(f"Kamera entegrasyonu hatası: {e}")
             else:
                 st.success("✅ İç hırsızlık şüphesi tespit edilmedi")
-            
-            st.subheader("📊 Detaylı Rapor")
-            try:
-                excel_output = create_surekli_excel_report(df_prepared, analysis_result, magaza_kodu, magaza_adi)
-                st.download_button(
-                    "📥 Tam Rapor İndir",
-                    data=excel_output,
-                    file_name=f"SurekliEnvanter_{magaza_kodu}_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            except Exception as e:
-                st.error(f"Excel oluşturma hatası: {e}")
         except Exception as e:
             st.error(f"Veri işleme hatası: {e}")
     else:
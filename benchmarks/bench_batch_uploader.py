@@ -0,0 +1,122 @@
+# ==================== BATCH UPLOADER BENCHMARK ====================
+# database.batch_uploader'ı lokal PostgREST stub'ına karşı offline test eder
+#
+# Stub: POST /rest/v1/<tablo>
+#   - her istekte sabit gecikme (ağ round-trip simülasyonu)
+#   - belirli oranda 503 (geçici hata → retry)
+#   - malzeme_kodu == 'HATALI' içeren batch'e 400 (veri hatası → batch bölme)
+#
+# Kullanım (repo kökünden):
+#   python benchmarks/bench_batch_uploader.py [satır_sayısı] [eşzamanlılık]
+
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# database/__init__ Streamlit secrets ile Supabase client açar; modülü dosyadan yükle
+_spec = importlib.util.spec_from_file_location('batch_uploader', os.path.join(ROOT, 'database', 'batch_uploader.py'))
+batch_uploader = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(batch_uploader)
+
+GECIKME = 0.05
+HATA_ORANI = 0.10
+
+
+class PostgrestStub(BaseHTTPRequestHandler):
+    """Minimal PostgREST insert endpoint'i"""
+    rows = []
+    lock = threading.Lock()
+    rng = random.Random(7)
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        threading.Event().wait(GECIKME)
+        
+        with self.lock:
+            gecici_hata = self.rng.random() < HATA_ORANI
+        
+        if gecici_hata:
+            return self._cevap(503, {'message': 'Service Unavailable'})
+        
+        if any(r.get('malzeme_kodu') == 'HATALI' for r in body):
+            return self._cevap(400, {'code': '22P02', 'message': 'invalid input syntax'})
+        
+        with self.lock:
+            self.rows.extend(body)
+        self._cevap(201, [])
+    
+    def _cevap(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, *args):
+        pass
+
+
+def make_insert_func(url):
+    """urllib ile PostgREST insert - hata durumunda HTTPError (code=durum kodu) fırlatır"""
+    def insert(batch):
+        req = urllib.request.Request(
+            url, data=json.dumps(batch).encode(), method='POST',
+            headers={'Content-Type': 'application/json', 'Prefer': 'return=minimal'}
+        )
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            resp.read()
+    return insert
+
+
+def make_batches(n, batch_size=500, hatali=(1234, 77777)):
+    for i in range(0, n, batch_size):
+        yield [
+            {'magaza_kodu': '1001', 'malzeme_kodu': 'HATALI' if j in hatali else str(j), 'fark_miktari': -1.0}
+            for j in range(i, min(i + batch_size, n))
+        ]
+
+
+def calistir(url, n, concurrency):
+    PostgrestStub.rows = []
+    sonuc = batch_uploader.upload_batches(
+        make_insert_func(url), make_batches(n), concurrency=concurrency, backoff=0.05
+    )
+    latencies = sorted(b['latency'] for b in sonuc['batches'])
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    
+    print(f"eşzamanlılık={concurrency:<2}  yüklenen={sonuc['inserted']:,}  tekrar={sonuc['retried']:,}  "
+          f"başarısız={sonuc['failed']}  süre={sonuc['elapsed']:.2f} sn  "
+          f"{sonuc['rows_per_sec']:,.0f} satır/sn  p95 batch={p95 * 1000:.0f} ms")
+    
+    assert sonuc['inserted'] + sonuc['failed'] == n
+    assert len(PostgrestStub.rows) == sonuc['inserted']
+    assert all(r['malzeme_kodu'] == 'HATALI' for r in sonuc['failed_rows'])
+    return sonuc
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PostgrestStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/rest/v1/envanter_veri"
+    
+    try:
+        calistir(url, n, 1)
+        calistir(url, n, concurrency)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# ==================== FAMILY ANALYSIS BENCHMARK ====================
+# find_product_families: eski O(n²) tarama vs groupby tabanlı algoritma
+#
+# Kullanım (repo kökünden):
+#   python benchmarks/bench_family_analysis.py [satır_sayısı]
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis.family_analysis import (
+    find_product_families, get_first_two_words, get_last_word, extract_quantity, is_quantity_similar
+)
+
+
+def legacy_find_product_families(df):
+    """Eski algoritma - her satır için tüm frame üzerinde maske + ikili gramaj kontrolü"""
+    df_copy = df.copy()
+    df_copy['İlk2Kelime'] = df_copy['Malzeme Adı'].apply(get_first_two_words)
+    df_copy['Marka'] = df_copy['Malzeme Adı'].apply(get_last_word)
+    df_copy['Gramaj'] = df_copy['Malzeme Adı'].apply(lambda x: extract_quantity(x)[0])
+    # Boş birim NaN (pandas 3 string dtype ile aynı) - NaN != NaN, gramajsız ürün aileye girmez
+    df_copy['GramajBirim'] = df_copy['Malzeme Adı'].apply(lambda x: extract_quantity(x)[1]).fillna(np.nan)
+    
+    families = []
+    processed_indices = set()
+    
+    for idx, row in df_copy.iterrows():
+        if idx in processed_indices:
+            continue
+        
+        ilk2 = row['İlk2Kelime']
+        marka = row['Marka']
+        urun_grubu = row['Ürün Grubu']
+        
+        if not ilk2 or not marka:
+            continue
+        
+        family_mask = (
+            (df_copy['İlk2Kelime'] == ilk2) &
+            (df_copy['Marka'] == marka) &
+            (df_copy['Ürün Grubu'] == urun_grubu)
+        )
+        potential_family = df_copy[family_mask]
+        if len(potential_family) <= 1:
+            continue
+        
+        family_members = []
+        for fam_idx, fam_row in potential_family.iterrows():
+            if is_quantity_similar(row['Gramaj'], row['GramajBirim'], fam_row['Gramaj'], fam_row['GramajBirim']):
+                family_members.append(fam_idx)
+                processed_indices.add(fam_idx)
+        
+        if len(family_members) <= 1:
+            continue
+        
+        family_df = df_copy.loc[family_members]
+        toplam_fark = family_df['Fark Miktarı'].sum()
+        toplam_kismi = family_df['Kısmi Envanter Miktarı'].sum()
+        toplam_onceki = family_df['Önceki Fark Miktarı'].sum()
+        aile_toplami = toplam_fark + toplam_kismi + toplam_onceki
+        
+        if family_df['Fark Miktarı'].abs().sum() > 0:
+            if abs(aile_toplami) <= 2:
+                sonuc, risk = "KOD KARIŞIKLIĞI - HIRSIZLIK DEĞİL", "DÜŞÜK"
+            elif aile_toplami < -2:
+                sonuc, risk = "AİLEDE NET AÇIK VAR", "ORTA"
+            else:
+                sonuc, risk = "AİLEDE FAZLA VAR", "DÜŞÜK"
+            
+            urunler = family_df['Malzeme Adı'].tolist()
+            farklar = family_df['Fark Miktarı'].tolist()
+            
+            families.append({
+                'Mal Grubu': urun_grubu,
+                'İlk 2 Kelime': ilk2,
+                'Marka': marka,
+                'Ürün Sayısı': len(family_members),
+                'Toplam Fark': toplam_fark,
+                'Toplam Kısmi': toplam_kismi,
+                'Toplam Önceki': toplam_onceki,
+                'AİLE TOPLAMI': aile_toplami,
+                'Sonuç': sonuc,
+                'Risk': risk,
+                'Ürünler': ' | '.join([f"{u[:25]}({f})" for u, f in zip(urunler[:5], farklar[:5])])
+            })
+    
+    result_df = pd.DataFrame(families)
+    if len(result_df) > 0:
+        result_df = result_df.sort_values('AİLE TOPLAMI', ascending=True)
+    
+    return result_df
+
+
+def make_store(n, seed=42):
+    """Sentetik tek mağaza envanteri (analyze_inventory sonrası kolon isimleriyle)"""
+    rng = np.random.default_rng(seed)
+    kelimeler = ['ULKER', 'ETI', 'COCA', 'COLA', 'SUT', 'PEYNIR', 'DETERJAN', 'SAMPUAN',
+                 'CIKOLATA', 'BISKUVI', 'GOFRET', 'KRAKER', 'MAKARNA', 'PIRINC', 'YAG']
+    markalar = ['ULKER', 'ETI', 'PINAR', 'SEK', 'ARIEL', 'OMO', 'TORKU', 'BANVIT']
+    birimler = ['ML', 'LT', 'G', 'GR', 'KG', '', 'L']
+    gramajlar = [50, 100, 250, 400, 500, 750, 1, 1.5, 2, 5000]
+    gruplar = ['SÜT ÜRÜNLERİ', 'DETERJAN', 'BİSKÜVİ', 'İÇECEK', 'TEMEL GIDA']
+    
+    adlar = []
+    for _ in range(n):
+        k = rng.choice(kelimeler, 2)
+        b = rng.choice(birimler)
+        q = f" {rng.choice(gramajlar)}{b}" if b else ''
+        adlar.append(f"{k[0]} {k[1]}{q} {rng.choice(markalar)}")
+    
+    return pd.DataFrame({
+        'Malzeme Kodu': [str(10000000 + i) for i in range(n)],
+        'Malzeme Adı': adlar,
+        'Ürün Grubu': rng.choice(gruplar, n),
+        'Fark Miktarı': rng.integers(-10, 8, n).astype(float),
+        'Kısmi Envanter Miktarı': rng.integers(-3, 3, n).astype(float),
+        'Önceki Fark Miktarı': rng.integers(-5, 5, n).astype(float),
+    })
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    df = make_store(n)
+    
+    t0 = time.perf_counter()
+    yeni = find_product_families(df)
+    t_yeni = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    eski = legacy_find_product_families(df)
+    t_eski = time.perf_counter() - t0
+    
+    pd.testing.assert_frame_equal(eski.reset_index(drop=True), yeni.reset_index(drop=True))
+    
+    print(f"Satır: {n:,}  Aile: {len(yeni):,}")
+    print(f"Eski : {t_eski:8.2f} sn")
+    print(f"Yeni : {t_yeni:8.2f} sn")
+    print(f"Hızlanma: {t_eski / t_yeni:,.0f}x  (sonuçlar birebir aynı)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+# ==================== SÜREKLİ RİSK SKORU BENCHMARK ====================
+# hesapla_risk_skoru: eski kriter başına iterrows vs tek hazırlanmış frame + maskeler
+#
+# Kullanım (repo kökünden):
+#   python benchmarks/bench_surekli_risk.py [ürün_sayısı]
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from surekli_envanter_module import get_magaza_adi_col, hesapla_risk_skoru
+
+
+def legacy_hesapla_risk_skoru(df, df_onceki=None, urun_medianlar=None):
+    """Eski algoritma - kriter başına ayrı iterrows, önceki sayım satır başına filtre ile aranır"""
+    detaylar = {}
+    toplam_puan = 0
+    
+    magaza_kodu = str(df['Mağaza Kodu'].iloc[0]) if 'Mağaza Kodu' in df.columns else ''
+    magaza_adi_col = get_magaza_adi_col(df)
+    magaza_adi = str(df[magaza_adi_col].iloc[0]) if magaza_adi_col else ''
+    
+    # Helper: Satırdan mağaza adı al
+    def get_row_magaza_adi(row):
+        if magaza_adi_col and magaza_adi_col in row.index:
+            return str(row[magaza_adi_col])
+        return magaza_adi
+    
+    # 1. BÖLGE SAPMA (20p)
+    sapma_detay = []
+    if urun_medianlar:
+        for _, row in df.iterrows():
+            kod = str(row.get('Malzeme Kodu', ''))
+            if kod in urun_medianlar:
+                median = urun_medianlar[kod].get('median', 0)
+                if median > 0:
+                    fark = abs(float(row.get('Fark Tutarı', 0) or 0))
+                    fire = abs(float(row.get('Fire Tutarı', 0) or 0))
+                    satis = float(row.get('Satış Hasılatı', 0) or 0)
+                    if satis > 500:
+                        magaza_oran = (fark + fire) / satis * 100
+                        if magaza_oran > median * 1.5:
+                            sapma_detay.append({
+                                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                                'Mağaza Adı': get_row_magaza_adi(row),
+                                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                                'Oran': f"%{magaza_oran:.1f}",
+                                'Median': f"%{median:.1f}",
+                                'Kat': f"{magaza_oran/median:.1f}x"
+                            })
+    cnt = len(sapma_detay)
+    puan = 20 if cnt >= 15 else 15 if cnt >= 10 else 10 if cnt >= 5 else 5 if cnt >= 2 else 0
+    detaylar['bolge_sapma'] = {
+        'puan': puan, 'max': 20,
+        'aciklama': f"{cnt} ürün median üstü" if urun_medianlar else "Bölge verisi gerekli",
+        'detay': sapma_detay
+    }
+    toplam_puan += puan
+    
+    # 2. SATIR İPTALİ (12p)
+    iptal_detay = []
+    if 'İptal Satır Tutarı' in df.columns:
+        for _, row in df.iterrows():
+            iptal = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
+            if iptal > 50:
+                iptal_detay.append({
+                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                    'Mağaza Adı': get_row_magaza_adi(row),
+                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                    'İptal Tutarı': f"{iptal:,.0f} TL"
+                })
+    iptal_tutar = abs(df['İptal Satır Tutarı'].sum()) if 'İptal Satır Tutarı' in df.columns else 0
+    puan = 12 if iptal_tutar > 1500 else 8 if iptal_tutar > 500 else 4 if iptal_tutar > 100 else 0
+    detaylar['satir_iptali'] = {
+        'puan': puan, 'max': 12,
+        'aciklama': f"{iptal_tutar:,.0f} TL iptal",
+        'detay': iptal_detay
+    }
+    toplam_puan += puan
+    
+    # 3. KRONİK AÇIK (10p) - Envanter sayısı bazlı
+    kronik_acik_detay = []
+    veri_var = df_onceki is not None and not df_onceki.empty
+    if veri_var:
+        for _, row in df.iterrows():
+            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
+            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
+            if env_sayisi <= 1:
+                continue
+            onceki = df_onceki[
+                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
+                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
+            ]
+            if onceki.empty:
+                continue
+            onceki = onceki.iloc[0]
+            fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
+            fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
+            if fark_simdi < fark_onceki - 50:  # Daha fazla açık
+                kronik_acik_detay.append({
+                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                    'Mağaza Adı': get_row_magaza_adi(row),
+                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                    'Önceki': f"{fark_onceki:,.0f}",
+                    'Şimdi': f"{fark_simdi:,.0f}",
+                    'Durum': 'Açık artıyor'
+                })
+    cnt = len(kronik_acik_detay)
+    puan = 10 if cnt >= 10 else 6 if cnt >= 5 else 3 if cnt >= 2 else 0
+    detaylar['kronik_acik'] = {
+        'puan': puan, 'max': 10,
+        'aciklama': f"{cnt} ürün 2+ sayımda açık" if veri_var else "⏳ Önceki veri bekleniyor",
+        'detay': kronik_acik_detay
+    }
+    toplam_puan += puan
+    
+    # 4. AİLE ANALİZİ (5p) - TODO
+    detaylar['aile_analizi'] = {
+        'puan': 0, 'max': 5,
+        'aciklama': "Henüz aktif değil",
+        'detay': []
+    }
+    
+    # 5. KRONİK FİRE (8p)
+    kronik_fire_detay = []
+    if veri_var:
+        for _, row in df.iterrows():
+            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
+            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
+            if env_sayisi <= 1:
+                continue
+            onceki = df_onceki[
+                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
+                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
+            ]
+            if onceki.empty:
+                continue
+            onceki = onceki.iloc[0]
+            fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
+            fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
+            if fire_simdi < fire_onceki - 50:  # Daha fazla fire
+                kronik_fire_detay.append({
+                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                    'Mağaza Adı': get_row_magaza_adi(row),
+                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                    'Önceki': f"{fire_onceki:,.0f}",
+                    'Şimdi': f"{fire_simdi:,.0f}",
+                    'Durum': 'Fire artıyor'
+                })
+    cnt = len(kronik_fire_detay)
+    puan = 8 if cnt >= 8 else 5 if cnt >= 4 else 2 if cnt >= 2 else 0
+    detaylar['kronik_fire'] = {
+        'puan': puan, 'max': 8,
+        'aciklama': f"{cnt} ürün 2+ sayımda fire" if veri_var else "⏳ Önceki veri bekleniyor",
+        'detay': kronik_fire_detay
+    }
+    toplam_puan += puan
+    
+    # 6. FİRE MANİPÜLASYONU (8p) - Fire var ama açık artıyor
+    fire_manip_detay = []
+    if veri_var:
+        for _, row in df.iterrows():
+            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
+            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
+            if env_sayisi <= 1:
+                continue
+            onceki = df_onceki[
+                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
+                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
+            ]
+            if onceki.empty:
+                continue
+            onceki = onceki.iloc[0]
+            fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
+            fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
+            fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
+            fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
+            fark_degisim = fark_simdi - fark_onceki
+            fire_degisim = fire_simdi - fire_onceki
+            # Açık arttı (daha negatif) ama fire yazmadı
+            if fark_degisim < -50 and fire_degisim > -10:
+                fire_manip_detay.append({
+                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                    'Mağaza Adı': get_row_magaza_adi(row),
+                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                    'Fark Değişim': f"{fark_degisim:,.0f}",
+                    'Fire Değişim': f"{fire_degisim:,.0f}",
+                    'Durum': '🚨 Fire yazmadan açık'
+                })
+    cnt = len(fire_manip_detay)
+    puan = 8 if cnt >= 5 else 5 if cnt >= 3 else 2 if cnt >= 1 else 0
+    detaylar['fire_manipulasyon'] = {
+        'puan': puan, 'max': 8,
+        'aciklama': f"{cnt} üründe fire↑ açık↓" if veri_var else "⏳ Önceki veri bekleniyor",
+        'detay': fire_manip_detay
+    }
+    toplam_puan += puan
+    
+    # 7. SAYILMAYAN ÜRÜN (8p) - Sayım atlama
+    sayim_detay = []
+    gun = datetime.now().day
+    beklenen_sayim = min((gun // 7) + 1, 4)
+    if 'Envanter Sayisi' in df.columns:
+        for _, row in df.iterrows():
+            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
+            if env_sayisi < beklenen_sayim:
+                sayim_detay.append({
+                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                    'Mağaza Adı': get_row_magaza_adi(row),
+                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                    'Yapılan': env_sayisi,
+                    'Beklenen': beklenen_sayim,
+                    'Durum': f"⚠️ {beklenen_sayim - env_sayisi} eksik"
+                })
+    cnt = len(sayim_detay)
+    puan = 8 if cnt >= 10 else 5 if cnt >= 5 else 2 if cnt >= 2 else 0
+    detaylar['sayilmayan_urun'] = {
+        'puan': puan, 'max': 8,
+        'aciklama': f"{cnt} üründe sayım eksik (beklenen: {beklenen_sayim})",
+        'detay': sayim_detay
+    }
+    toplam_puan += puan
+    
+    # 8. ANORMAL MİKTAR (10p)
+    anormal_detay = []
+    istisnalar = ['PATATES', 'SOĞAN', 'SOGAN', 'KARPUZ', 'KAVUN']
+    for _, row in df.iterrows():
+        miktar = row.get('Sayım Miktarı', 0)
+        if pd.isna(miktar):
+            continue
+        urun_adi = str(row.get('Malzeme Tanımı', '')).upper()
+        esik = 200 if any(ist in urun_adi for ist in istisnalar) else 50
+        if miktar > esik:
+            anormal_detay.append({
+                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                'Mağaza Adı': get_row_magaza_adi(row),
+                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                'Miktar': f"{miktar:.0f}",
+                'Durum': f'>{esik} kg/adet'
+            })
+    cnt = len(anormal_detay)
+    puan = 10 if cnt >= 5 else 6 if cnt >= 3 else 3 if cnt >= 1 else 0
+    detaylar['anormal_miktar'] = {
+        'puan': puan, 'max': 10,
+        'aciklama': f"{cnt} üründe >50 kg/adet",
+        'detay': anormal_detay
+    }
+    toplam_puan += puan
+    
+    # 9. TEKRAR MİKTAR (8p)
+    tekrar_detay = []
+    if veri_var:
+        for _, row in df.iterrows():
+            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
+            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
+            miktar = row.get('Sayım Miktarı', 0)
+            if env_sayisi <= 1 or pd.isna(miktar) or miktar <= 0:
+                continue
+            onceki = df_onceki[
+                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
+                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
+            ]
+            if onceki.empty:
+                continue
+            onceki = onceki.iloc[0]
+            onceki_miktar = float(onceki.get('sayim_miktari', 0) or 0)
+            if onceki_miktar > 0 and abs(miktar - onceki_miktar) / onceki_miktar <= 0.03:
+                tekrar_detay.append({
+                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                    'Mağaza Adı': get_row_magaza_adi(row),
+                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                    'Önceki': f"{onceki_miktar:.1f}",
+                    'Şimdi': f"{miktar:.1f}",
+                    'Durum': 'Aynı miktar'
+                })
+    cnt = len(tekrar_detay)
+    puan = 8 if cnt >= 10 else 5 if cnt >= 5 else 2 if cnt >= 2 else 0
+    detaylar['tekrar_miktar'] = {
+        'puan': puan, 'max': 8,
+        'aciklama': f"{cnt} ürün aynı miktar" if veri_var else "⏳ Önceki veri bekleniyor",
+        'detay': tekrar_detay
+    }
+    toplam_puan += puan
+    
+    # 10. YUVARLAK SAYI (8p)
+    yuvarlak_detay = []
+    for _, row in df.iterrows():
+        miktar = row.get('Sayım Miktarı', 0)
+        if pd.isna(miktar) or miktar == 0:
+            continue
+        if miktar > 0 and miktar % 5 == 0 and miktar >= 5:
+            yuvarlak_detay.append({
+                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
+                'Mağaza Adı': get_row_magaza_adi(row),
+                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
+                'Miktar': f"{miktar:.0f}",
+                'Durum': 'Yuvarlak sayı'
+            })
+    cnt = len(yuvarlak_detay)
+    yuvarlak_oran = cnt / max(len(df), 1)
+    puan = 8 if yuvarlak_oran > 0.35 else 5 if yuvarlak_oran > 0.20 else 2 if yuvarlak_oran > 0.10 else 0
+    detaylar['yuvarlak_sayi'] = {
+        'puan': puan, 'max': 8,
+        'aciklama': f"{cnt} ürün (%{yuvarlak_oran*100:.0f}) yuvarlak",
+        'detay': yuvarlak_detay
+    }
+    toplam_puan += puan
+    
+    # Seviye belirleme
+    if toplam_puan <= 25:
+        seviye, emoji = 'normal', '✅'
+    elif toplam_puan <= 50:
+        seviye, emoji = 'dikkat', '⚠️'
+    elif toplam_puan <= 75:
+        seviye, emoji = 'riskli', '🟠'
+    else:
+        seviye, emoji = 'kritik', '🔴'
+    
+    return {
+        'toplam_puan': toplam_puan,
+        'max_puan': 97,
+        'seviye': seviye,
+        'emoji': emoji,
+        'detaylar': detaylar,
+        'magaza_kodu': magaza_kodu,
+        'magaza_adi': magaza_adi
+    }
+
+
+def make_surekli(n, seed=42):
+    """
+    Sentetik tek mağaza sürekli envanteri + önceki sayım kayıtları + bölge medyanları
+    Dönüş: (df, df_onceki, urun_medianlar)
+    """
+    rng = np.random.default_rng(seed)
+    kodlar = [str(20000000 + i) for i in range(n)]
+    adlar = rng.choice(['ELMA', 'PATATES', 'PILIC BUT', 'EKMEK', 'DOMATES', 'SUT'], n)
+    env = rng.integers(1, 4, n)
+    miktar = np.round(rng.uniform(0, 80, n), 1)
+    yuvarlak = rng.random(n) < 0.2
+    miktar[yuvarlak] = rng.choice([5, 10, 20, 50], yuvarlak.sum())
+    
+    df = pd.DataFrame({
+        'Mağaza Kodu': '5001',
+        'Mağaza Adı': 'TEST',
+        'Malzeme Kodu': kodlar,
+        'Malzeme Tanımı': [f"{a} {i}" for i, a in enumerate(adlar)],
+        'Envanter Sayisi': env,
+        'Sayım Miktarı': miktar,
+        'Fark Tutarı': np.round(rng.normal(-40, 120, n), 2),
+        'Fire Tutarı': np.round(-np.abs(rng.normal(0, 60, n)), 2),
+        'Satış Hasılatı': np.round(rng.uniform(0, 5000, n), 2),
+        'İptal Satır Tutarı': np.round(-np.abs(rng.normal(0, 30, n)), 2),
+    })
+    
+    onceki = df[df['Envanter Sayisi'] > 1]
+    df_onceki = pd.DataFrame({
+        'malzeme_kodu': onceki['Malzeme Kodu'].to_numpy(),
+        'envanter_sayisi': (onceki['Envanter Sayisi'] - 1).to_numpy(),
+        'fark_tutari': np.round(rng.normal(-20, 120, len(onceki)), 2),
+        'fire_tutari': np.round(-np.abs(rng.normal(0, 60, len(onceki))), 2),
+        'sayim_miktari': np.where(rng.random(len(onceki)) < 0.3, onceki['Sayım Miktarı'],
+                                  np.round(rng.uniform(1, 80, len(onceki)), 1)),
+    })
+    
+    urun_medianlar = {k: {'median': float(m)} for k, m in zip(kodlar, np.round(rng.uniform(0, 20, n), 1))}
+    return df, df_onceki, urun_medianlar
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    df, df_onceki, urun_medianlar = make_surekli(n)
+    
+    t0 = time.perf_counter()
+    yeni = hesapla_risk_skoru(df, df_onceki, urun_medianlar)
+    t_yeni = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    yeni_puan = hesapla_risk_skoru(df, df_onceki, urun_medianlar, detay=False)
+    t_puan = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    eski = legacy_hesapla_risk_skoru(df, df_onceki, urun_medianlar)
+    t_eski = time.perf_counter() - t0
+    
+    assert yeni == eski
+    assert yeni_puan['toplam_puan'] == eski['toplam_puan']
+    
+    print(f"Ürün: {n:,}  Puan: {yeni['toplam_puan']} ({yeni['seviye']})")
+    print(f"Eski          : {t_eski:8.2f} sn")
+    print(f"Yeni (detaylı): {t_yeni:8.2f} sn")
+    print(f"Yeni (puan)   : {t_puan:8.2f} sn")
+    print(f"Hızlanma: {t_eski / t_yeni:,.0f}x  (sonuçlar birebir aynı)")
+
+
+if __name__ == '__main__':
+    main()
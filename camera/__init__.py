@@ -175,7 +175,9 @@ def enrich_internal_theft_with_camera(internal_df, magaza_kodu, envanter_tarihi,
                             if full_df is not None:
                                 alt_rows = full_df[full_df['Malzeme Kodu'].astype(str) == alt_kod]
                                 if len(alt_rows) > 0:
-                                    alt_ad = alt_rows['Malzeme Tanımı'].iloc[0] if 'Malzeme Tanımı' in alt_rows.columns else alt_kod
+                                    # compact frame'de 'Malzeme Tanımı' → 'Malzeme Adı' olarak yeniden adlandırılır
+                                    ad_col = next((c for c in ['Malzeme Tanımı', 'Malzeme Adı'] if c in alt_rows.columns), None)
+                                    alt_ad = str(alt_rows[ad_col].iloc[0]) if ad_col else alt_kod
                             
                             alternatif_detay = f"🔄 KATEGORİ: {alt_ad[:30] if alt_ad else alt_kod} → {alt_sonuc['detay']}"
                             break
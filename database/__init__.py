@@ -4,6 +4,16 @@ from .supabase_crud import (
     save_to_supabase,
     get_available_stores_from_supabase,
     get_single_store_data,
-    get_data_from_supabase
+    get_data_from_supabase,
+    get_period_history
 )
 from .supabase_views import get_sm_summary_from_view
+from .batch_uploader import upload_batches
+from .local_cache import invalidate_cache
+from .shared_dataset import (
+    ENVANTER_DATASET,
+    get_shared_dataset,
+    refresh_shared_dataset,
+    invalidate_shared_dataset,
+    shared_dataset_info
+)
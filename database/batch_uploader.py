@@ -0,0 +1,233 @@
+# ==================== BATCH UPLOADER ====================
+# Supabase toplu insert: sınırlı eşzamanlılık, retry, hatalı satır izolasyonu, kalıcı hatada durma
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# İşlenmeden reddedilen istekler: tekrar göndermek güvenli
+SAFE_RETRY_STATUS = {408, 425, 429, 503}
+# Sunucu işlemiş olabilir (commit sonrası timeout / gateway hatası): insert tekrarı satırları çift yazabilir
+AMBIGUOUS_STATUS = {500, 502, 504}
+# Satır bazlı veri hatası (geçersiz değer, constraint ihlali): batch bölünerek hatalı satır izole edilir
+DATA_STATUS = {400, 409, 422}
+# PostgreSQL SQLSTATE sınıfları: 22 veri istisnası, 23 bütünlük ihlali
+DATA_SQLSTATE_CLASSES = ('22', '23')
+SAFE_RETRY_KEYWORDS = ('too many requests', 'connection refused', 'connecterror', 'connecttimeout')
+AMBIGUOUS_KEYWORDS = ('timeout', 'timed out', 'reset by peer', 'temporarily', 'connection')
+DATA_KEYWORDS = ('invalid input syntax', 'violates', 'duplicate key', 'out of range', 'value too long')
+
+
+def classify_error(e):
+    """
+    Hata türü:
+        'retry'     - istek işlenmedi, aynen tekrar denenebilir (bağlanamadı, 429, 503)
+        'ambiguous' - istek işlenmiş olabilir (okuma timeout'u, 500/502/504, bağlantı koptu)
+        'data'      - satır bazlı veri hatası (400/409/422, SQLSTATE 22xxx/23xxx): bölünerek izole edilir
+        'fatal'     - kalıcı hata (401/403/404, tablo/kolon yok, şema hatası): hiçbir satır yazılamaz
+    """
+    if isinstance(e, ConnectionRefusedError):
+        return 'retry'
+    
+    # PostgREST APIError.code: SQLSTATE (örn. '23505', '42P01') veya 'PGRST...'
+    code = str(getattr(e, 'code', '') or '')
+    if code.startswith('PGRST'):
+        return 'fatal'
+    if len(code) == 5:
+        return 'data' if code[:2] in DATA_SQLSTATE_CLASSES else 'fatal'
+    
+    response = getattr(e, 'response', None)
+    statuses = [getattr(e, attr, None) for attr in ('status_code', 'status', 'code')]
+    statuses.append(getattr(response, 'status_code', None) if response is not None else None)
+    for val in statuses:
+        try:
+            val = int(val)
+        except (TypeError, ValueError):
+            continue
+        if val in SAFE_RETRY_STATUS:
+            return 'retry'
+        if val in AMBIGUOUS_STATUS:
+            return 'ambiguous'
+        if val in DATA_STATUS:
+            return 'data'
+        if 400 <= val < 600:
+            return 'fatal'
+    
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return 'ambiguous'
+    
+    msg = f"{type(e).__name__} {e}".lower()
+    if any(kw in msg for kw in SAFE_RETRY_KEYWORDS):
+        return 'retry'
+    if any(kw in msg for kw in AMBIGUOUS_KEYWORDS):
+        return 'ambiguous'
+    if any(kw in msg for kw in DATA_KEYWORDS):
+        return 'data'
+    return 'fatal'
+
+
+def _send_with_retry(insert_func, batch, max_retries, backoff, stats, idempotent=False):
+    """
+    Batch'i gönder; güvenli geçici hatada exponential backoff ile tekrar dene.
+    Belirsiz hatalar (işlenmiş olabilir) sadece idempotent insert'te (upsert) tekrar denenir.
+    Dönüş: (başarılı mı, son hata, deneme sayısı, hata türü)
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            insert_func(batch)
+            return True, None, attempt, None
+        except Exception as e:
+            kind = classify_error(e)
+            tekrar = kind == 'retry' or (kind == 'ambiguous' and idempotent)
+            if attempt > max_retries or not tekrar:
+                return False, e, attempt, kind
+            with stats['lock']:
+                stats['retried'] += len(batch)
+            time.sleep(backoff * (2 ** (attempt - 1)))
+
+
+def _upload_one(insert_func, batch_no, batch, max_retries, backoff, stats, idempotent=False):
+    """
+    Tek batch'i yükle. Sadece satır bazlı veri hatasında ('data') ikiye bölüp her yarıyı
+    ayrı dener, böylece hatalı satır(lar) izole edilir; geri kalanı yüklenir.
+    Belirsiz hatada (idempotent değilse) parça bölünmez / tekrar gönderilmez:
+    satırlar yazılmış olabilir, 'ambiguous' olarak raporlanır.
+    Kalıcı hatada ('fatal') parçanın tamamı tek istekle başarısız sayılır ve
+    stats['abort'] kurulur: bekleyen parçalar / yeni batch'ler gönderilmez.
+    """
+    t0 = time.perf_counter()
+    inserted = 0
+    failed_rows = []
+    ambiguous = 0
+    skipped = 0
+    errors = []
+    attempts = 0
+    
+    pending = [batch]
+    while pending:
+        if stats['abort'].is_set():
+            # Başka bir batch kalıcı hata aldı: kalan parçalar gönderilmeden başarısız
+            for part in pending:
+                failed_rows.extend(part)
+                skipped += len(part)
+            break
+    
+        part = pending.pop()
+        ok, err, n_try, kind = _send_with_retry(insert_func, part, max_retries, backoff, stats, idempotent)
+        attempts += n_try
+    
+        if ok:
+            inserted += len(part)
+        elif kind == 'data' and len(part) > 1:
+            mid = len(part) // 2
+            pending.append(part[mid:])
+            pending.append(part[:mid])
+        else:
+            failed_rows.extend(part)
+            if kind == 'ambiguous':
+                ambiguous += len(part)
+            if kind == 'fatal':
+                with stats['lock']:
+                    if stats['fatal'] is None:
+                        stats['fatal'] = str(err)[:200]
+                stats['abort'].set()
+            errors.append(str(err)[:200])
+    
+    return {
+        'batch': batch_no,
+        'rows': len(batch),
+        'inserted': inserted,
+        'failed': len(failed_rows),
+        'ambiguous': ambiguous,
+        'skipped': skipped,
+        'attempts': attempts,
+        'latency': time.perf_counter() - t0,
+        'failed_rows': failed_rows,
+        'errors': errors,
+    }
+
+
+def upload_batches(insert_func, batches, concurrency=4, max_retries=3, backoff=0.5, on_batch=None,
+                   idempotent=False):
+    """
+    Batch'leri sınırlı thread havuzu ile yükle
+    
+    insert_func: list[dict] alıp insert eden fonksiyon (hata durumunda exception fırlatır)
+    batches: list[dict] parçaları üreten iterable/generator (lazy tüketilir)
+    concurrency: aynı anda uçuşta olan en fazla batch sayısı (backpressure)
+    on_batch: her batch bitince çağrılır → on_batch(batch_sonucu, özet)
+    idempotent: insert_func tekrarında çift kayıt oluşmuyorsa (upsert + on_conflict) True;
+                o zaman timeout / 5xx gibi belirsiz hatalar da tekrar denenir
+    
+    Kalıcı hatada (401/403/404, tablo yok, şema hatası) yükleme durdurulur: yeni batch
+    gönderilmez, kalan satırlar 'skipped' olarak failed / failed_rows'a eklenir.
+    
+    Dönüş dict:
+        inserted, retried, failed, ambiguous (yazılmış olabilecek başarısız satırlar),
+        skipped (kalıcı hata sonrası hiç gönderilmeyen satırlar), aborted (kalıcı hata mesajı veya None),
+        failed_rows, errors, batches (batch, rows, inserted, failed, ambiguous, skipped,
+        attempts, latency), elapsed, rows_per_sec
+    """
+    concurrency = max(1, int(concurrency))
+    stats = {'lock': threading.Lock(), 'retried': 0, 'abort': threading.Event(), 'fatal': None}
+    
+    result = {
+        'inserted': 0,
+        'retried': 0,
+        'failed': 0,
+        'ambiguous': 0,
+        'skipped': 0,
+        'aborted': None,
+        'failed_rows': [],
+        'errors': [],
+        'batches': [],
+        'elapsed': 0.0,
+        'rows_per_sec': 0.0,
+    }
+    
+    t0 = time.perf_counter()
+    
+    def topla(sonuc):
+        result['inserted'] += sonuc['inserted']
+        result['failed'] += sonuc['failed']
+        result['ambiguous'] += sonuc['ambiguous']
+        result['skipped'] += sonuc['skipped']
+        result['failed_rows'].extend(sonuc.pop('failed_rows'))
+        result['errors'].extend(sonuc.pop('errors'))
+        result['batches'].append(sonuc)
+        if on_batch:
+            on_batch(sonuc, result)
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+    
+        for batch_no, batch in enumerate(batches, 1):
+            # Backpressure: havuz doluysa yeni batch üretmeden önce birinin bitmesini bekle
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for f in done:
+                    topla(f.result())
+    
+            if stats['abort'].is_set():
+                # Kalıcı hata: kalan batch'ler gönderilmez
+                result['skipped'] += len(batch)
+                result['failed'] += len(batch)
+                result['failed_rows'].extend(batch)
+                continue
+    
+            in_flight.add(pool.submit(_upload_one, insert_func, batch_no, batch, max_retries, backoff, stats,
+                                      idempotent))
+    
+        for f in wait(in_flight).done:
+            topla(f.result())
+    
+    result['batches'].sort(key=lambda b: b['batch'])
+    result['retried'] = stats['retried']
+    result['aborted'] = stats['fatal']
+    result['elapsed'] = time.perf_counter() - t0
+    if result['elapsed'] > 0:
+        result['rows_per_sec'] = result['inserted'] / result['elapsed']
+    
+    return result
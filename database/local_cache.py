@@ -0,0 +1,147 @@
+# ==================== LOCAL CACHE ====================
+# envanter_veri için disk üstü Parquet cache
+# Partition: envanter_donemi × kapsam (tümü / SM / mağaza)
+# Her partition yanında meta (satır sayısı + max id) tutulur; değişim tespiti bununla yapılır
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+CACHE_DIR = os.environ.get('ENVANTER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'envanter_cache'))
+CACHE_MAX_BYTES = int(os.environ.get('ENVANTER_CACHE_MAX_MB', '1024')) * 1024 * 1024
+
+
+def _safe(value):
+    """Dosya adı için güvenli parça"""
+    text = str(value)
+    safe = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in text)
+    return f"{safe}-{hashlib.md5(text.encode('utf-8')).hexdigest()[:6]}"
+
+
+def make_scope(satis_muduru=None, magaza_kodu=None):
+    """Partition kapsamı: mağaza > SM > tümü"""
+    if magaza_kodu:
+        return f"magaza={magaza_kodu}"
+    if satis_muduru:
+        return f"sm={satis_muduru}"
+    return 'all'
+
+
+def _partition_dir(columns, donem, scope):
+    # Kolon listesi değişirse eski cache ile karışmasın
+    schema = hashlib.md5(columns.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, schema, f"donem={_safe(donem)}", _safe(scope))
+
+
+def read_partition(columns, donem, scope, probe):
+    """
+    Cache'deki partition'ı oku - meta, probe (satır sayısı, max id) ile aynıysa
+    Değişmiş / eksik / okunamıyorsa None
+    """
+    if not PARQUET_AVAILABLE:
+        return None
+    
+    path = _partition_dir(columns, donem, scope)
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if [meta.get('rows'), meta.get('max_id')] != list(probe):
+            return None
+    
+        data_file = os.path.join(path, 'data.parquet')
+        df = pd.read_parquet(data_file)
+        os.utime(data_file)  # LRU için son erişim
+        return df
+    except:
+        return None
+
+
+def write_partition(columns, donem, scope, probe, df):
+    """Partition'ı yaz (veri önce, meta en son - yarım yazım geçersiz sayılır)"""
+    if not PARQUET_AVAILABLE:
+        return False
+    
+    path = _partition_dir(columns, donem, scope)
+    tmp_file = None
+    try:
+        os.makedirs(path, exist_ok=True)
+        # Her yazıcının kendi geçici dosyası - aynı partition'ı eşzamanlı yenileyen oturumlar çakışmaz
+        with tempfile.NamedTemporaryFile(dir=path, prefix='data.', suffix='.parquet.tmp', delete=False) as f:
+            tmp_file = f.name
+        df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, os.path.join(path, 'data.parquet'))
+    
+        with tempfile.NamedTemporaryFile('w', dir=path, prefix='meta.', suffix='.json.tmp', delete=False,
+                                         encoding='utf-8') as f:
+            tmp_file = f.name
+            json.dump({'rows': probe[0], 'max_id': probe[1]}, f)
+        os.replace(tmp_file, os.path.join(path, 'meta.json'))
+    except:
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        shutil.rmtree(path, ignore_errors=True)
+        return False
+    
+    evict_cache()
+    return True
+
+
+def _partition_dirs():
+    """(klasör, boyut, son erişim) listesi"""
+    result = []
+    if not os.path.isdir(CACHE_DIR):
+        return result
+    
+    for root, _, files in os.walk(CACHE_DIR):
+        if 'data.parquet' not in files:
+            continue
+        size = sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        result.append((root, size, os.path.getmtime(os.path.join(root, 'data.parquet'))))
+    return result
+
+
+def evict_cache(max_bytes=None):
+    """Toplam boyut limiti aşılırsa en eski erişilen partition'ları sil"""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    parts = _partition_dirs()
+    total = sum(size for _, size, _ in parts)
+    
+    for path, size, _ in sorted(parts, key=lambda p: p[2]):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+    
+    return total
+
+
+def invalidate_cache(donemler=None):
+    """
+    Cache'i geçersiz kıl
+    donemler verilirse sadece o dönemlerin tüm partition'ları, yoksa tüm cache silinir
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    
+    if not donemler:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        return
+    
+    hedefler = {f"donem={_safe(d)}" for d in donemler}
+    for schema in os.listdir(CACHE_DIR):
+        schema_dir = os.path.join(CACHE_DIR, schema)
+        if not os.path.isdir(schema_dir):
+            continue
+        for name in os.listdir(schema_dir):
+            if name in hedefler:
+                shutil.rmtree(os.path.join(schema_dir, name), ignore_errors=True)
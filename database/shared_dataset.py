@@ -0,0 +1,114 @@
+# ==================== SHARED DATASET ====================
+# Süreç genelinde paylaşılan, salt-okunur veri setleri
+# Tüm oturumlar aynı frame'i okur; yenileme yeni frame'i hazırlayıp tek atamayla değiştirir
+
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Analiz edilmiş (compact) envanter_veri - app.load_all_data_once yükler, save_to_supabase geçersiz kılar
+ENVANTER_DATASET = 'envanter'
+
+# ad → {'version', 'df', 'loaded_at', 'stale'}
+_registry = {}
+_registry_lock = threading.Lock()
+_load_locks = {}
+
+
+def _load_lock(name):
+    with _registry_lock:
+        return _load_locks.setdefault(name, threading.Lock())
+
+
+def freeze_frame(df):
+    """
+    Frame'i salt-okunur hale getir: sayısal/tarih kolonları read-only dizilerle, birleştirilmeden
+    (copy=False) yeniden kurulur. Yerinde yazma (loc/iloc) ValueError verir.
+    object kolonlar dokunulmadan kalır (pandas bazı object işlemlerinde yazılabilir buffer bekler).
+    """
+    kolonlar = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, np.dtype) and s.dtype != object:
+            values = s.to_numpy()
+            values.flags.writeable = False
+            kolonlar[col] = values
+        else:
+            kolonlar[col] = s.array
+    
+    frozen = pd.DataFrame(kolonlar, index=df.index, copy=False)
+    frozen.attrs = dict(df.attrs)
+    return frozen
+
+
+def _swap(name, df):
+    """Yeni versiyonu tek atamayla yayınla"""
+    df = freeze_frame(df)
+    with _registry_lock:
+        onceki = _registry.get(name)
+        entry = {
+            'version': (onceki['version'] + 1) if onceki else 1,
+            'df': df,
+            'loaded_at': time.time(),
+            'stale': False,
+        }
+        _registry[name] = entry
+    return df, entry['version']
+
+
+def get_shared_dataset(name, loader):
+    """
+    Paylaşılan veri setini döndür: (df, version)
+    İlk çağrıda / geçersiz kılındıktan sonra loader() ile yüklenir.
+    Yükleme sürerken eski versiyon varsa diğer oturumlar onu okumaya devam eder.
+    """
+    entry = _registry.get(name)
+    if entry is not None and not entry['stale']:
+        return entry['df'], entry['version']
+    
+    lock = _load_lock(name)
+    if entry is not None and not lock.acquire(blocking=False):
+        return entry['df'], entry['version']
+    if entry is None:
+        lock.acquire()
+    
+    try:
+        entry = _registry.get(name)
+        if entry is not None and not entry['stale']:
+            return entry['df'], entry['version']
+        return _swap(name, loader())
+    finally:
+        lock.release()
+
+
+def refresh_shared_dataset(name, loader):
+    """Yeni veriyi yükle ve versiyonu değiştir (okuyucular yükleme boyunca eski versiyonu görür)"""
+    with _load_lock(name):
+        return _swap(name, loader())
+
+
+def invalidate_shared_dataset(name=None):
+    """Veri setini (veya hepsini) eski olarak işaretle - sonraki okuma yeniden yükler"""
+    with _registry_lock:
+        for key, entry in _registry.items():
+            if name is None or key == name:
+                entry['stale'] = True
+
+
+def shared_dataset_info():
+    """Yüklü veri setleri: ad → version, satır, bellek (byte), yüklenme zamanı"""
+    with _registry_lock:
+        entries = dict(_registry)
+    
+    return {
+        name: {
+            'version': e['version'],
+            'rows': len(e['df']),
+            'bytes': int(e['df'].memory_usage(index=True, deep=True).sum()),
+            'loaded_at': e['loaded_at'],
+            'stale': e['stale'],
+        }
+        for name, e in entries.items()
+    }
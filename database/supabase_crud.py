@@ -1,10 +1,102 @@
 # ==================== SUPABASE CRUD ====================
 # Supabase veri okuma/yazma işlemleri
 
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import chain
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 from .supabase_client import supabase
+from .batch_uploader import upload_batches
+from .local_cache import PARQUET_AVAILABLE, make_scope, read_partition, write_partition, invalidate_cache
+from .shared_dataset import ENVANTER_DATASET, invalidate_shared_dataset
+from utils.records import iter_record_chunks
+from config import SM_BS_MAGAZA
+
+
+# Envanter anahtarı = Mağaza Kodu | Envanter Dönemi | Depolama Koşulu Grubu
+# v_envanter_anahtar: envanter_veri üzerinde DISTINCT anahtar view'i (README'ye bakın)
+ENV_KEY_VIEW = 'v_envanter_anahtar'
+ENV_KEY_STORE_BATCH = 50
+ENV_KEY_PAGE_SIZE = 1000
+ENV_KEY_COLUMNS = ['magaza_kodu', 'envanter_donemi', 'depolama_kosulu_grubu']
+
+# View / tablo yok hatası: Postgres 42P01, PostgREST schema cache PGRST205
+MISSING_RELATION_CODES = {'42P01', 'PGRST205'}
+
+# envanter_veri insert ayarları
+UPLOAD_BATCH_SIZE = 500
+UPLOAD_CONCURRENCY = 4
+
+
+def is_missing_relation_error(e):
+    """Hata, sorgulanan view/tablonun olmamasından mı? (diğer hatalar yukarı fırlatılmalı)"""
+    if str(getattr(e, 'code', '')) in MISSING_RELATION_CODES:
+        return True
+    msg = str(e).lower()
+    return 'does not exist' in msg or 'could not find the table' in msg
+
+
+def get_existing_env_keys(unique_envs):
+    """
+    Yüklenecek envanter anahtarlarından Supabase'de zaten olanları bul
+    
+    unique_envs: 'Mağaza Kodu', 'Envanter Dönemi', 'Depolama Koşulu Grubu', '_env_key' kolonları
+    
+    v_envanter_anahtar view'i mağaza batch'leri + dönem listesi ile in_ sorgusu yapılır,
+    fark kümesi lokalde alınır → O(#mağaza / batch) istek.
+    Sayfalar anahtar kolonlarına göre sıralı çekilir (sırasız range sayfaları çakışıp anahtar atlayabilir).
+    View yoksa anahtar başına tek sorguya (eski yöntem) düşer; diğer hatalar çağırana fırlatılır -
+    okunamayan anahtar "yok" sayılırsa aynı envanter ikinci kez yüklenir.
+    """
+    upload_keys = set(unique_envs['_env_key'])
+    magazalar = sorted(unique_envs['Mağaza Kodu'].astype(str).unique())
+    donemler = sorted(unique_envs['Envanter Dönemi'].astype(str).unique())
+    
+    try:
+        db_keys = set()
+        for i in range(0, len(magazalar), ENV_KEY_STORE_BATCH):
+            batch = magazalar[i:i + ENV_KEY_STORE_BATCH]
+            offset = 0
+            
+            while True:
+                query = supabase.table(ENV_KEY_VIEW).select(','.join(ENV_KEY_COLUMNS)).in_(
+                    'magaza_kodu', batch
+                ).in_('envanter_donemi', donemler)
+                for col in ENV_KEY_COLUMNS:
+                    query = query.order(col)
+                result = query.range(offset, offset + ENV_KEY_PAGE_SIZE - 1).execute()
+                
+                rows = result.data or []
+                for r in rows:
+                    db_keys.add(f"{r['magaza_kodu']}|{r['envanter_donemi']}|{r['depolama_kosulu_grubu']}")
+                
+                if len(rows) < ENV_KEY_PAGE_SIZE:
+                    break
+                offset += ENV_KEY_PAGE_SIZE
+        
+        return upload_keys & db_keys
+    except Exception as e:
+        if not is_missing_relation_error(e):
+            raise
+    
+    # Fallback: view yoksa anahtar başına sorgu
+    existing_envs = set()
+    for _, env_row in unique_envs.iterrows():
+        result = supabase.table('envanter_veri').select('id').eq(
+            'magaza_kodu', str(env_row['Mağaza Kodu'])
+        ).eq(
+            'envanter_donemi', str(env_row['Envanter Dönemi'])
+        ).eq(
+            'depolama_kosulu_grubu', str(env_row['Depolama Koşulu Grubu'])
+        ).limit(1).execute()
+        
+        if result.data and len(result.data) > 0:
+            existing_envs.add(env_row['_env_key'])
+    
+    return existing_envs
 
 
 def save_to_supabase(df_original):
@@ -31,22 +123,8 @@ def save_to_supabase(df_original):
         
         unique_envs = df[['Mağaza Kodu', 'Envanter Dönemi', 'Depolama Koşulu Grubu', '_env_key']].drop_duplicates()
         
-        # Supabase'de hangileri mevcut kontrol et
-        existing_envs = set()
-        for _, env_row in unique_envs.iterrows():
-            try:
-                result = supabase.table('envanter_veri').select('id').eq(
-                    'magaza_kodu', str(env_row['Mağaza Kodu'])
-                ).eq(
-                    'envanter_donemi', str(env_row['Envanter Dönemi'])
-                ).eq(
-                    'depolama_kosulu_grubu', str(env_row['Depolama Koşulu Grubu'])
-                ).limit(1).execute()
-                
-                if result.data and len(result.data) > 0:
-                    existing_envs.add(env_row['_env_key'])
-            except:
-                pass
+        # Supabase'de hangileri mevcut kontrol et (mağaza batch'leri ile toplu sorgu)
+        existing_envs = get_existing_env_keys(unique_envs)
         
         # Sadece yeni envanterler
         new_env_keys = set(unique_envs['_env_key']) - existing_envs
@@ -107,35 +185,39 @@ def save_to_supabase(df_original):
             'İptal Satır Tutarı': 'iptal_satir_tutari',
         }
         
-        # Veriyi hazırla
-        records = []
-        for _, row in df_new.iterrows():
-            record = {}
-            for excel_col, db_col in col_mapping.items():
-                if excel_col in row.index:
-                    val = row[excel_col]
-                    if pd.isna(val):
-                        val = None
-                    elif isinstance(val, pd.Timestamp):
-                        val = val.strftime('%Y-%m-%d')
-                    elif isinstance(val, (np.integer, np.int64)):
-                        val = int(val)
-                    elif isinstance(val, (np.floating, np.float64)):
-                        val = float(val) if not np.isnan(val) else None
-                    record[db_col] = val
-            records.append(record)
-        
-        # Batch insert
-        batch_size = 500
-        inserted = 0
-        
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i+batch_size]
-            try:
-                supabase.table('envanter_veri').insert(batch).execute()
-                inserted += len(batch)
-            except Exception as e:
-                st.warning(f"Batch {i//batch_size + 1} hatası: {str(e)[:100]}")
+        # Batch insert (kolon bazlı dönüşüm, paralel yükleme + retry + hatalı batch bölme)
+        progress = st.progress(0.0, text="Yükleniyor...")
+        toplam_satir = max(len(df_new), 1)
+        
+        def on_batch(batch_sonuc, ozet):
+            biten = ozet['inserted'] + ozet['failed']
+            progress.progress(min(biten / toplam_satir, 1.0),
+                              text=f"Yükleniyor... {biten:,}/{toplam_satir:,} satır")
+        
+        upload = upload_batches(
+            lambda batch: supabase.table('envanter_veri').insert(batch).execute(),
+            iter_record_chunks(df_new, UPLOAD_BATCH_SIZE, col_mapping),
+            concurrency=UPLOAD_CONCURRENCY,
+            on_batch=on_batch
+        )
+        progress.empty()
+        
+        inserted = upload['inserted']
+        if upload['failed'] > 0:
+            st.warning(f"{upload['failed']} satır yüklenemedi ({upload['retried']} satır tekrar denendi): "
+                       f"{upload['errors'][0][:100]}")
+        if upload['aborted']:
+            # Yetki / tablo / şema hatası: kalan batch'ler gönderilmedi
+            st.error(f"Yükleme durduruldu: {upload['aborted'][:100]} ({upload['skipped']:,} satır gönderilmedi)")
+        if upload['ambiguous'] > 0:
+            # Timeout / 5xx: sunucu yazmış olabilir - çift kayıt olmasın diye tekrar gönderilmedi
+            st.warning(f"{upload['ambiguous']} satırın yazılıp yazılmadığı belirsiz (zaman aşımı / sunucu hatası); "
+                       f"tekrar yüklemeden önce kontrol edin")
+        
+        # Lokal cache ve paylaşılan frame: yüklenen dönemlerin verisi artık eski
+        if inserted > 0:
+            invalidate_cache(df_new['Envanter Dönemi'].astype(str).unique().tolist())
+            invalidate_shared_dataset(ENVANTER_DATASET)
         
         # Materialized view refresh
         if inserted > 0:
@@ -145,49 +227,234 @@ def save_to_supabase(df_original):
                 pass
         
         new_list = [k.replace('|', ' / ') for k in new_env_keys]
-        return inserted, len(skipped_env_keys), f"Yüklenen: {', '.join(new_list[:3])}..."
+        return inserted, len(skipped_env_keys), (f"Yüklenen: {', '.join(new_list[:3])}... "
+                                                 f"({upload['rows_per_sec']:,.0f} satır/sn)")
         
     except Exception as e:
         return 0, 0, f"Hata: {str(e)}"
 
 
+# ==================== KEYSET OKUMA ====================
+# envanter_veri okuma: offset yerine id > last_id (keyset) sayfalama,
+# büyük sorgularda id aralığı shard'lara bölünüp paralel çekilir
+
+FETCH_PAGE_SIZE = 1000
+FETCH_MAX_SHARDS = 6
+FETCH_ROWS_PER_SHARD = 20000
+
+
+def _envanter_query(columns, satis_muduru=None, donemler=None, magaza_kodu=None, count=None):
+    """envanter_veri sorgusu + ortak filtreler"""
+    if count:
+        query = supabase.table('envanter_veri').select(columns, count=count)
+    else:
+        query = supabase.table('envanter_veri').select(columns)
+    
+    if satis_muduru:
+        query = query.eq('satis_muduru', satis_muduru)
+    if magaza_kodu:
+        query = query.eq('magaza_kodu', str(magaza_kodu))
+    if donemler and len(donemler) > 0:
+        query = query.in_('envanter_donemi', list(donemler))
+    
+    return query
+
+
+def _get_id_bounds(filters):
+    """Filtreye uyan satırların (min id, max id, satır sayısı) - sayı bilinmiyorsa 0"""
+    ilk = _envanter_query('id', count='exact', **filters).order('id').limit(1).execute()
+    if not ilk.data:
+        return None
+    
+    son = _envanter_query('id', **filters).order('id', desc=True).limit(1).execute()
+    return ilk.data[0]['id'], son.data[0]['id'], ilk.count or 0
+
+
+def _fetch_id_range(columns, filters, lo=None, hi=None, on_page=None):
+    """
+    [lo, hi] id aralığını keyset ile sayfa sayfa çek
+    Sayfalar doğrudan kolon listelerine eklenir (dict listesi biriktirilmez)
+    Keyset için 'id' her zaman seçilir (columns içinde yoksa eklenir) ve dönüşte yer alır
+    """
+    names = columns.split(',')
+    if 'id' not in names:
+        names.append('id')
+    select = ','.join(names)
+    arrays = {c: [] for c in names}
+    last_id = None
+    
+    while True:
+        query = _envanter_query(select, **filters)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        elif lo is not None:
+            query = query.gte('id', lo)
+        if hi is not None:
+            query = query.lte('id', hi)
+        
+        page = query.order('id').limit(FETCH_PAGE_SIZE).execute().data
+        if not page:
+            break
+        
+        for c in names:
+            arrays[c].extend([r.get(c) for r in page])
+        last_id = page[-1]['id']
+        
+        if on_page:
+            on_page(len(page))
+        
+        if len(page) < FETCH_PAGE_SIZE:
+            break
+    
+    return arrays
+
+
+def fetch_envanter_data(columns, satis_muduru=None, donemler=None, magaza_kodu=None,
+                        show_progress=False, with_id=False):
+    """
+    envanter_veri'den filtreli veri çek → DataFrame (id sırasıyla, with_id ile 'id' kolonu dahil)
+    
+    Satır sayısı FETCH_ROWS_PER_SHARD'ı aşarsa [min id, max id] aralığı
+    en fazla FETCH_MAX_SHARDS parçaya bölünür ve parçalar eşzamanlı çekilir.
+    Hata durumunda exception fırlatır (çağıran yakalar).
+    """
+    filters = {'satis_muduru': satis_muduru, 'donemler': donemler, 'magaza_kodu': magaza_kodu}
+    
+    bounds = _get_id_bounds(filters)
+    if bounds is None:
+        return pd.DataFrame()
+    id_min, id_max, total = bounds
+    
+    n_shards = int(min(FETCH_MAX_SHARDS, max(1, total // FETCH_ROWS_PER_SHARD)))
+    edges = np.linspace(id_min, id_max + 1, n_shards + 1).astype(np.int64)
+    shards = [(int(edges[i]), int(edges[i + 1]) - 1) for i in range(n_shards)]
+    
+    progress = st.progress(0.0, text="📊 Veriler yükleniyor...") if show_progress else None
+    fetched = [0]
+    lock = threading.Lock()
+    
+    def on_page(n):
+        with lock:
+            fetched[0] += n
+    
+    with ThreadPoolExecutor(max_workers=n_shards) as pool:
+        futures = [pool.submit(_fetch_id_range, columns, filters, lo, hi, on_page) for lo, hi in shards]
+        
+        # UI güncellemesi ana thread'de (Streamlit worker thread'den çağrılamaz)
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.25)
+            if progress is not None:
+                oran = min(fetched[0] / total, 1.0) if total else 0.0
+                progress.progress(oran, text=f"📊 Veriler yükleniyor... {fetched[0]:,}/{total:,} satır")
+        
+        parts = [f.result() for f in futures]
+    
+    if progress is not None:
+        progress.empty()
+    
+    names = columns.split(',')
+    if with_id and 'id' not in names:
+        names.append('id')
+    return pd.DataFrame({c: list(chain.from_iterable(p[c] for p in parts)) for c in names})
+
+
+def _probe_partition(filters):
+    """Ucuz değişim kontrolü: (satır sayısı, max id)"""
+    result = _envanter_query('id', count='exact', **filters).order('id', desc=True).limit(1).execute()
+    max_id = result.data[0]['id'] if result.data else None
+    return result.count or 0, max_id
+
+
+def _list_periods():
+    """Tüm dönemler (v_distinct_donem) - alınamazsa None"""
+    try:
+        result = supabase.table('v_distinct_donem').select('envanter_donemi').execute()
+        return sorted({r['envanter_donemi'] for r in result.data if r.get('envanter_donemi')})
+    except:
+        return None
+
+
+def fetch_envanter_cached(columns, satis_muduru=None, donemler=None, magaza_kodu=None, show_progress=False):
+    """
+    fetch_envanter_data + lokal Parquet cache
+    
+    Her dönem bir partition'dır (kapsam: tümü / SM / mağaza). Partition başına
+    (satır sayısı, max id) probe'u paralel atılır; sadece eksik ya da değişmiş
+    partition'lar ağdan çekilir. Sonuç id sırasıyla birleştirilir.
+    """
+    periods = list(donemler) if donemler else None
+    if PARQUET_AVAILABLE and periods is None:
+        periods = _list_periods()
+    
+    if not PARQUET_AVAILABLE or not periods:
+        return fetch_envanter_data(columns, satis_muduru=satis_muduru, donemler=donemler,
+                                   magaza_kodu=magaza_kodu, show_progress=show_progress)
+    
+    scope = make_scope(satis_muduru, magaza_kodu)
+    base = {'satis_muduru': satis_muduru, 'magaza_kodu': magaza_kodu}
+    
+    with ThreadPoolExecutor(max_workers=min(8, len(periods))) as pool:
+        probes = list(pool.map(lambda d: _probe_partition({**base, 'donemler': [d]}), periods))
+    
+    parts = []
+    for donem, probe in zip(periods, probes):
+        if probe[1] is None:
+            continue
+        
+        df = read_partition(columns, donem, scope, probe)
+        if df is None:
+            df = fetch_envanter_data(columns, donemler=[donem], show_progress=show_progress,
+                                     with_id=True, **base)
+            write_partition(columns, donem, scope, probe, df)
+        parts.append(df)
+    
+    if not parts:
+        return pd.DataFrame()
+    
+    df = pd.concat(parts, ignore_index=True)
+    df = df.sort_values('id', kind='stable').drop(columns='id').reset_index(drop=True)
+    return df
+
+
 @st.cache_data(ttl=600)
 def get_available_stores_from_supabase():
-    """Mevcut mağazaları al - dropdown için"""
+    """
+    Mevcut mağazaları al - dropdown için
+    v_distinct_magaza view'inden (magaza_kodu sıralı sayfalar), view yoksa sm_bs_magaza.json (isimsiz).
+    Diğer hatalar çağırana fırlatılır - eksik liste sessizce JSON'a düşmesin.
+    """
     try:
         all_stores = {}
         offset = 0
-        batch_size = 1000
         
         while True:
-            result = supabase.table('envanter_veri').select('magaza_kodu,magaza_tanim').range(offset, offset + batch_size - 1).execute()
-            if not result.data:
-                break
+            result = supabase.table('v_distinct_magaza').select('magaza_kodu,magaza_tanim').order(
+                'magaza_kodu'
+            ).range(offset, offset + FETCH_PAGE_SIZE - 1).execute()
             
-            for r in result.data:
+            for r in result.data or []:
                 if r.get('magaza_kodu'):
-                    all_stores[r['magaza_kodu']] = r.get('magaza_tanim', '')
-            
-            if len(result.data) < batch_size:
-                break
-            offset += batch_size
+                    all_stores[r['magaza_kodu']] = r.get('magaza_tanim') or ''
             
-            if offset > 50000:
+            if not result.data or len(result.data) < FETCH_PAGE_SIZE:
                 break
+            offset += FETCH_PAGE_SIZE
         
-        return all_stores
-    except:
-        return {}
+        if all_stores:
+            return all_stores
+    except Exception as e:
+        if not is_missing_relation_error(e):
+            raise
+    
+    # Fallback: mağaza listesi JSON'dan (mağaza adı yok)
+    return {kod: '' for kod in SM_BS_MAGAZA}
 
 
 @st.cache_data(ttl=300, show_spinner=False)
 def get_single_store_data(magaza_kodu, donemler=None):
     """Tek mağaza için veri çek - HIZLI"""
     try:
-        all_data = []
-        batch_size = 1000
-        offset = 0
-        
         required_columns = ','.join([
             'magaza_kodu', 'magaza_tanim', 'satis_muduru', 'bolge_sorumlusu',
             'depolama_kosulu_grubu', 'depolama_kosulu', 'envanter_donemi', 'envanter_tarihi', 'envanter_baslangic_tarihi',
@@ -197,31 +464,10 @@ def get_single_store_data(magaza_kodu, donemler=None):
             'satis_miktari', 'satis_hasilati', 'iptal_satir_miktari'
         ])
         
-        for _ in range(50):
-            query = supabase.table('envanter_veri').select(required_columns)
-            query = query.eq('magaza_kodu', str(magaza_kodu))
-            
-            if donemler and len(donemler) > 0:
-                query = query.in_('envanter_donemi', list(donemler))
-            
-            query = query.order('id')
-            query = query.range(offset, offset + batch_size - 1)
-            result = query.execute()
-            
-            if not result.data:
-                break
-            
-            all_data.extend(result.data)
-            
-            if len(result.data) < batch_size:
-                break
-            
-            offset += batch_size
-        
-        if not all_data:
-            return pd.DataFrame()
+        df = fetch_envanter_cached(required_columns, donemler=donemler, magaza_kodu=magaza_kodu)
         
-        df = pd.DataFrame(all_data)
+        if df.empty:
+            return df
         
         reverse_mapping = {
             'magaza_kodu': 'Mağaza Kodu',
@@ -258,14 +504,9 @@ def get_single_store_data(magaza_kodu, donemler=None):
         return pd.DataFrame()
 
 
-def get_data_from_supabase(satis_muduru=None, donemler=None):
-    """Supabase'den veri çek ve DataFrame'e çevir"""
+def get_data_from_supabase(satis_muduru=None, donemler=None, show_progress=False):
+    """Supabase'den veri çek ve DataFrame'e çevir (keyset + paralel shard)"""
     try:
-        all_data = []
-        batch_size = 1000
-        offset = 0
-        max_iterations = 500
-        
         required_columns = ','.join([
             'magaza_kodu', 'magaza_tanim', 'satis_muduru', 'bolge_sorumlusu',
             'depolama_kosulu_grubu', 'depolama_kosulu', 'envanter_donemi', 'envanter_tarihi', 'envanter_baslangic_tarihi',
@@ -275,37 +516,11 @@ def get_data_from_supabase(satis_muduru=None, donemler=None):
             'satis_miktari', 'satis_hasilati', 'iptal_satir_miktari'
         ])
         
-        iteration = 0
-        while iteration < max_iterations:
-            iteration += 1
-            
-            query = supabase.table('envanter_veri').select(required_columns)
-            
-            if satis_muduru:
-                query = query.eq('satis_muduru', satis_muduru)
-            
-            if donemler and len(donemler) > 0:
-                query = query.in_('envanter_donemi', donemler)
-            
-            query = query.order('id')
-            query = query.range(offset, offset + batch_size - 1)
-            
-            result = query.execute()
-            
-            if not result.data or len(result.data) == 0:
-                break
-            
-            all_data.extend(result.data)
-            
-            if len(result.data) < batch_size:
-                break
-            
-            offset += batch_size
-        
-        if not all_data:
-            return pd.DataFrame()
+        df = fetch_envanter_cached(required_columns, satis_muduru=satis_muduru, donemler=donemler,
+                                   show_progress=show_progress)
         
-        df = pd.DataFrame(all_data)
+        if df.empty:
+            return df
         
         reverse_mapping = {
             'magaza_kodu': 'Mağaza Kodu',
@@ -340,3 +555,38 @@ def get_data_from_supabase(satis_muduru=None, donemler=None):
     except Exception as e:
         st.error(f"Supabase hatası: {str(e)}")
         return pd.DataFrame()
+
+
+def get_period_history(n_periods=None, satis_muduru=None, magaza_kodu=None):
+    """
+    Son N dönemin ürün bazlı fark geçmişi (kronik analiz için)
+    Dar kolon seti; lokal Parquet cache üzerinden (değişmeyen dönemler tekrar inmez)
+    """
+    try:
+        periods = _list_periods()
+        if not periods:
+            return pd.DataFrame()
+        if n_periods:
+            periods = periods[-n_periods:]
+        
+        history_columns = ','.join([
+            'magaza_kodu', 'envanter_donemi', 'malzeme_kodu', 'malzeme_tanimi', 'mal_grubu_tanimi',
+            'fark_miktari', 'fark_tutari'
+        ])
+        
+        df = fetch_envanter_cached(history_columns, satis_muduru=satis_muduru, donemler=periods,
+                                   magaza_kodu=magaza_kodu)
+        
+        return df.rename(columns={
+            'magaza_kodu': 'Mağaza Kodu',
+            'envanter_donemi': 'Envanter Dönemi',
+            'malzeme_kodu': 'Malzeme Kodu',
+            'malzeme_tanimi': 'Malzeme Adı',
+            'mal_grubu_tanimi': 'Ürün Grubu',
+            'fark_miktari': 'Fark Miktarı',
+            'fark_tutari': 'Fark Tutarı',
+        })
+        
+    except Exception as e:
+        st.error(f"Geçmiş veri hatası: {e}")
+        return pd.DataFrame()
@@ -4,6 +4,7 @@
 import streamlit as st
 import pandas as pd
 from .supabase_client import supabase
+from analysis.risk_calculator import score_store_risk
 
 
 @st.cache_data(ttl=300)
@@ -73,7 +74,7 @@ def get_sm_summary_from_view(satis_muduru=None, donemler=None, tarih_baslangic=N
         try:
             df['Gün'] = (pd.to_datetime(df['Envanter Tarihi']) - 
                         pd.to_datetime(df['Envanter Başlangıç Tarihi'])).dt.days
-            df['Gün'] = df['Gün'].apply(lambda x: max(1, abs(x)) if pd.notna(x) else 1)
+            df['Gün'] = df['Gün'].abs().clip(lower=1).fillna(1)
         except:
             df['Gün'] = 1
         
@@ -81,72 +82,11 @@ def get_sm_summary_from_view(satis_muduru=None, donemler=None, tarih_baslangic=N
         df['Günlük Fire'] = df['Fire'] / df['Gün']
         
         # Sigara açığı
-        df['Sigara'] = df['Sigara Net'].apply(lambda x: abs(x) if x < 0 else 0)
-        
-        # Risk puanı hesapla
-        def calc_risk_score(row):
-            score = 0
-            reasons = []
-            
-            kayip = row['Toplam %']
-            if kayip > 2.0:
-                score += 40
-                reasons.append(f"Kayıp %{kayip:.1f}")
-            elif kayip > 1.5:
-                score += 25
-                reasons.append(f"Kayıp %{kayip:.1f}")
-            elif kayip > 1.0:
-                score += 15
-            
-            ic = row['İç Hırs.']
-            if ic > 50:
-                score += 30
-                reasons.append(f"İç Hırs. {ic:.0f}")
-            elif ic > 30:
-                score += 20
-            elif ic > 15:
-                score += 10
-            
-            sig = row['Sigara']
-            if sig > 5:
-                score += 35
-                reasons.append(f"Sigara {sig:.0f}")
-            elif sig > 0:
-                score += 20
-                reasons.append(f"Sigara {sig:.0f}")
-            
-            kr = row['Kronik']
-            if kr > 100:
-                score += 15
-                reasons.append(f"Kronik {kr:.0f}")
-            elif kr > 50:
-                score += 10
-            
-            kasa = abs(row.get('Kasa Tutar', 0) or 0)
-            if kasa > 5000:
-                score += 20
-                reasons.append(f"Kasa {kasa:,.0f}")
-            elif kasa > 2000:
-                score += 10
-            
-            return score, ', '.join(reasons) if reasons else '-'
-        
-        df[['Risk Puan', 'Risk Nedenleri']] = df.apply(
-            lambda row: pd.Series(calc_risk_score(row)), axis=1
-        )
-        
-        # Risk seviyesi
-        def get_risk_level(score):
-            if score >= 70:
-                return '🔴 KRİTİK'
-            elif score >= 50:
-                return '🟠 RİSKLİ'
-            elif score >= 30:
-                return '🟡 DİKKAT'
-            else:
-                return '🟢 TEMİZ'
-        
-        df['Risk'] = df['Risk Puan'].apply(get_risk_level)
+        df['Sigara'] = (-df['Sigara Net']).clip(lower=0).fillna(0)
+        
+        # Risk puanı - analyze_region ile aynı vektörel skorlayıcı (RISK_CONFIG)
+        df = df.join(score_store_risk(df, columns={'kronik': 'Kronik', 'kasa_10tl': 'Kasa Adet'}))
+        
         df['BS'] = df['Bölge Sorumlusu']
         
         return df
@@ -6,968 +6,21 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from functools import lru_cache
 import json
+import re
 import os
+import logging
+from utils.records import frame_to_records
+from utils.text import normalize_tr_text
 
-# ==================== JSON'DAN VERİ YÜKLEME ====================
-
-def load_json_data(filename):
-    """JSON dosyasından veri yükle"""
-    paths = [
-        os.path.join(os.path.dirname(__file__), filename),
-        os.path.join('/mount/src/envanter-risk-analizi', filename),
-        filename
-    ]
-    for path in paths:
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            continue
-    return {}
-
-# Verileri yükle
-SM_BS_MAGAZA = load_json_data('sm_bs_magaza.json')
-SEGMENT_URUN = load_json_data('segment_urun.json')
-
-# ==================== SABİTLER ====================
-
-HARIC_NITELIKLER = ['Geçici Delist', 'Bölgesel', 'Delist']
-SEGMENT_MAPPING = {
-    'L': ['L', 'LA', 'LAB', 'LABC', 'LABCD'],
-    'A': ['A', 'LA', 'LAB', 'LABC', 'LABCD'],
-    'B': ['B', 'LAB', 'LABC', 'LABCD'],
-    'C': ['C', 'LABC', 'LABCD'],
-    'D': ['D', 'LABCD']
-}
-
-# Kategori tespiti için keyword'ler
-KATEGORI_KEYWORDS = {
-    'Et-Tavuk': ['ET VE ET ÜRÜNLERİ', 'TAVUK', 'PİLİÇ', 'KIYMA', 'KÖFTE', 'SUCUK', 'SALAM'],
-    'Ekmek': ['UN VE UNLU MAMULLER', 'EKMEK', 'LAVAŞ', 'BAZLAMA', 'PİDE', 'SIMIT'],
-    'Meyve/Sebze': ['MEYVE', 'SEBZE', 'YAŞ MEYVE', 'YAŞ SEBZE']
-}
-
-# Risk puan ağırlıkları (toplam 97) - ESKİ KRİTERLER
-RISK_WEIGHTS = {
-    'bolge_sapma': 20,
-    'satir_iptali': 12,
-    'kronik_acik': 10,
-    'aile_analizi': 5,
-    'kronik_fire': 8,
-    'fire_manipulasyon': 8,
-    'sayilmayan_urun': 8,
-    'anormal_miktar': 10,
-    'tekrar_miktar': 8,
-    'yuvarlak_sayi': 8
-}
-
-# ==================== YARDIMCI FONKSİYONLAR ====================
-
-def get_magaza_bilgi(magaza_kodu):
-    """Mağaza SM/BS bilgisini döner"""
-    magaza_kodu = str(magaza_kodu)
-    if magaza_kodu in SM_BS_MAGAZA:
-        return SM_BS_MAGAZA[magaza_kodu]
-    return {'sm': 'BİLİNMİYOR', 'bs': 'BİLİNMİYOR'}
-
-def get_sm_list():
-    """Tüm SM listesini döner"""
-    return list(set(v['sm'] for v in SM_BS_MAGAZA.values()))
-
-def get_bs_list():
-    """Tüm BS listesini döner"""
-    return list(set(v['bs'] for v in SM_BS_MAGAZA.values()))
-
-def get_magazalar_by_sm(sm):
-    """Bir SM'e bağlı mağazaları döner"""
-    return [k for k, v in SM_BS_MAGAZA.items() if v['sm'] == sm]
-
-def get_magazalar_by_bs(bs):
-    """Bir BS'e bağlı mağazaları döner"""
-    return [k for k, v in SM_BS_MAGAZA.items() if v['bs'] == bs]
-
-def get_magaza_adi_col(df):
-    """DataFrame'deki mağaza adı kolonunu bul"""
-    if 'Mağaza Adı' in df.columns:
-        return 'Mağaza Adı'
-    elif 'Mağaza Tanım' in df.columns:
-        return 'Mağaza Tanım'
-    return None
-
-def detect_kategori(row):
-    """Satırdan kategori tespit et"""
-    text = ' '.join([
-        str(row.get('Ürün Grubu Tanımı', '')),
-        str(row.get('Mal Grubu Tanımı', '')),
-        str(row.get('Malzeme Tanımı', ''))
-    ]).upper()
-    
-    for kategori, keywords in KATEGORI_KEYWORDS.items():
-        for kw in keywords:
-            if kw in text:
-                return kategori
-    return 'Diğer'
-
-# ==================== ENVANTER TİPİ TESPİTİ ====================
-
-def detect_envanter_type(df):
-    """Dosyanın sürekli mi parçalı mı olduğunu tespit et"""
-    cols_lower = [c.lower() for c in df.columns]
-    
-    # Sürekli envanter belirteçleri
-    surekli_indicators = ['envanter sayisi', 'envanter sayısı', 'depolama koşulu']
-    for ind in surekli_indicators:
-        if any(ind in c for c in cols_lower):
-            return 'surekli'
-    
-    # Depolama koşulu değerleri kontrolü
-    if 'Depolama Koşulu Grubu' in df.columns or 'Depolama Koşulu' in df.columns:
-        return 'surekli'
-    
-    return 'parcali'
-
-# ==================== SUPABASE KAYIT FONKSİYONLARI ====================
-
-def prepare_detay_kayitlar(df):
-    """
-    DataFrame'den Supabase'e kaydedilecek detay kayıtlarını hazırla
-    Her satır = 1 ürün kaydı
-    """
-    records = []
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    # Envanter dönemi
-    if 'Envanter Dönemi' in df.columns:
-        envanter_donemi = str(df['Envanter Dönemi'].iloc[0])
-    else:
-        envanter_donemi = datetime.now().strftime('%Y%m')
-    
-    for _, row in df.iterrows():
-        magaza_kodu = str(row.get('Mağaza Kodu', ''))
-        if not magaza_kodu:
-            continue
-            
-        magaza_bilgi = get_magaza_bilgi(magaza_kodu)
-        kategori = detect_kategori(row)
-        
-        # Envanter sayısı
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        record = {
-            'magaza_kodu': magaza_kodu,
-            'magaza_adi': str(row.get(magaza_adi_col, '')) if magaza_adi_col else '',
-            'sm': magaza_bilgi['sm'],
-            'bs': magaza_bilgi['bs'],
-            'malzeme_kodu': str(row.get('Malzeme Kodu', '')),
-            'malzeme_tanimi': str(row.get('Malzeme Tanımı', ''))[:100],
-            'kategori': kategori,
-            'envanter_donemi': envanter_donemi,
-            'envanter_sayisi': env_sayisi,
-            'fark_miktari': float(row.get('Fark Miktarı', 0) or 0),
-            'fark_tutari': float(row.get('Fark Tutarı', 0) or 0),
-            'fire_miktari': float(row.get('Fire Miktarı', 0) or 0),
-            'fire_tutari': float(row.get('Fire Tutarı', 0) or 0),
-            'iptal_satir_tutari': float(row.get('İptal Satır Tutarı', 0) or 0),
-            'sayim_miktari': float(row.get('Sayım Miktarı', 0) or 0),
-            'satis_hasilati': float(row.get('Satış Hasılatı', 0) or 0),
-        }
-        records.append(record)
-    
-    return records
-
-def save_detay_to_supabase(supabase_client, records):
-    """Detay kayıtlarını Supabase'e kaydet (upsert)"""
-    if not records:
-        return 0, 0
-    
-    inserted = 0
-    skipped = 0
-    
-    # Batch upsert
-    try:
-        result = supabase_client.table('surekli_envanter_detay').upsert(
-            records,
-            on_conflict='magaza_kodu,malzeme_kodu,envanter_donemi,envanter_sayisi'
-        ).execute()
-        inserted = len(result.data) if result.data else 0
-    except Exception as e:
-        print(f"Supabase hata: {e}")
-        # Tek tek dene
-        for rec in records:
-            try:
-                supabase_client.table('surekli_envanter_detay').upsert(
-                    rec,
-                    on_conflict='magaza_kodu,malzeme_kodu,envanter_donemi,envanter_sayisi'
-                ).execute()
-                inserted += 1
-            except:
-                skipped += 1
-    
-    return inserted, skipped
-
-def get_onceki_envanter(supabase_client, magaza_kodu, malzeme_kodu, envanter_donemi, envanter_sayisi):
-    """Bir önceki envanter sayısındaki kaydı getir"""
-    if envanter_sayisi <= 1:
-        return None
-    
-    try:
-        result = supabase_client.table('surekli_envanter_detay').select('*').eq(
-            'magaza_kodu', magaza_kodu
-        ).eq(
-            'malzeme_kodu', malzeme_kodu
-        ).eq(
-            'envanter_donemi', envanter_donemi
-        ).eq(
-            'envanter_sayisi', envanter_sayisi - 1
-        ).execute()
-        
-        if result.data:
-            return result.data[0]
-    except:
-        pass
-    return None
-
-def get_magaza_onceki_kayitlar(supabase_client, magaza_kodu, envanter_donemi):
-    """Mağazanın bu dönemdeki tüm önceki kayıtlarını getir"""
-    try:
-        result = supabase_client.table('surekli_envanter_detay').select('*').eq(
-            'magaza_kodu', magaza_kodu
-        ).eq(
-            'envanter_donemi', envanter_donemi
-        ).execute()
-        
-        if result.data:
-            return pd.DataFrame(result.data)
-    except:
-        pass
-    return pd.DataFrame()
-
-# ==================== ANALİZ FONKSİYONLARI ====================
-
-def analiz_fire_yazmama(df, df_onceki=None):
-    """
-    Fire yazmadan açık verenleri tespit et
-    Envanter sayısı artmış + Fark artmış + Fire artmamış = 🚨
-    """
-    sonuclar = []
-    
-    if df_onceki is None or df_onceki.empty:
-        # Önceki veri yok, sadece mevcut durumu raporla
-        return sonuclar
-    
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    for _, row in df.iterrows():
-        malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        if env_sayisi <= 1:
-            continue
-        
-        # Önceki kaydı bul
-        onceki = df_onceki[
-            (df_onceki['malzeme_kodu'] == malzeme_kodu) & 
-            (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-        ]
-        
-        if onceki.empty:
-            continue
-        
-        onceki = onceki.iloc[0]
-        
-        # Değişimleri hesapla
-        fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-        fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-        fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
-        fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
-        
-        fark_degisim = fark_simdi - fark_onceki  # Negatif = daha fazla açık
-        fire_degisim = fire_simdi - fire_onceki  # Negatif = daha fazla fire
-        
-        # Fire yazmama: Fark arttı (daha negatif) ama fire artmadı
-        if fark_degisim < -50 and fire_degisim >= -10:  # 50 TL'den fazla yeni açık, 10 TL'den az fire
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Env.Sayısı': f"{env_sayisi-1} → {env_sayisi}",
-                'Fark Değişim': f"{fark_degisim:,.0f} TL",
-                'Fire Değişim': f"{fire_degisim:,.0f} TL",
-                'Durum': '🚨 Fire yazmadan açık!'
-            })
-    
-    return sonuclar
-
-def analiz_kronik_acik(df, df_onceki=None):
-    """Her sayımda açık artan ürünleri tespit et"""
-    sonuclar = []
-    
-    if df_onceki is None or df_onceki.empty:
-        return sonuclar
-    
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    for _, row in df.iterrows():
-        malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        if env_sayisi <= 1:
-            continue
-        
-        onceki = df_onceki[
-            (df_onceki['malzeme_kodu'] == malzeme_kodu) & 
-            (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-        ]
-        
-        if onceki.empty:
-            continue
-        
-        onceki = onceki.iloc[0]
-        
-        fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-        fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-        fark_degisim = fark_simdi - fark_onceki
-        
-        # Kronik açık: Her sayımda açık artıyor
-        if fark_degisim < -100:  # 100 TL'den fazla yeni açık
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Env.Sayısı': f"{env_sayisi-1} → {env_sayisi}",
-                'Önceki Fark': f"{fark_onceki:,.0f} TL",
-                'Şimdiki Fark': f"{fark_simdi:,.0f} TL",
-                'Yeni Açık': f"{fark_degisim:,.0f} TL"
-            })
-    
-    return sonuclar
-
-def analiz_sayim_atlama(df, beklenen_sayim=4):
-    """Beklenen sayımdan az sayım yapılan ürünleri tespit et"""
-    sonuclar = []
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    for _, row in df.iterrows():
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        if env_sayisi < beklenen_sayim:
-            eksik = beklenen_sayim - env_sayisi
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Yapılan Sayım': env_sayisi,
-                'Beklenen': beklenen_sayim,
-                'Eksik': f"⚠️ {eksik} sayım eksik"
-            })
-    
-    return sonuclar
-
-def analiz_iptal_artis(df, df_onceki=None):
-    """İptal tutarı artışını tespit et"""
-    sonuclar = []
-    
-    if df_onceki is None or df_onceki.empty:
-        # Önceki yok, sadece yüksek iptalleri göster
-        magaza_adi_col = get_magaza_adi_col(df)
-        for _, row in df.iterrows():
-            iptal = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-            if iptal > 100:
-                sonuclar.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                    'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'İptal Tutarı': f"{iptal:,.0f} TL",
-                    'Durum': 'Kümülatif iptal'
-                })
-        return sonuclar
-    
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    for _, row in df.iterrows():
-        malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        if env_sayisi <= 1:
-            iptal = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-            if iptal > 100:
-                sonuclar.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                    'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'İptal Tutarı': f"{iptal:,.0f} TL",
-                    'Durum': 'İlk sayım iptal'
-                })
-            continue
-        
-        onceki = df_onceki[
-            (df_onceki['malzeme_kodu'] == malzeme_kodu) & 
-            (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-        ]
-        
-        if onceki.empty:
-            continue
-        
-        onceki = onceki.iloc[0]
-        
-        iptal_simdi = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-        iptal_onceki = abs(float(onceki.get('iptal_satir_tutari', 0) or 0))
-        iptal_degisim = iptal_simdi - iptal_onceki
-        
-        if iptal_degisim > 50:  # 50 TL'den fazla yeni iptal
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Env.Sayısı': f"{env_sayisi-1} → {env_sayisi}",
-                'Önceki İptal': f"{iptal_onceki:,.0f} TL",
-                'Şimdiki İptal': f"{iptal_simdi:,.0f} TL",
-                'Yeni İptal': f"+{iptal_degisim:,.0f} TL"
-            })
-    
-    return sonuclar
-
-def analiz_yuvarlak_sayi(df):
-    """Yuvarlak sayı girişlerini tespit et (5, 10, 15, 20...)"""
-    sonuclar = []
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    for _, row in df.iterrows():
-        miktar = row.get('Sayım Miktarı', 0)
-        if pd.isna(miktar) or miktar == 0:
-            continue
-        
-        # Yuvarlak sayı kontrolü (5'in katları)
-        if miktar > 0 and miktar % 5 == 0 and miktar >= 5:
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Miktar': f"{miktar:.0f}",
-                'Durum': 'Yuvarlak sayı'
-            })
-    
-    return sonuclar
-
-def analiz_anormal_miktar(df, esik=50):
-    """Anormal yüksek miktarları tespit et"""
-    sonuclar = []
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    # İstisna ürünler (patates, soğan gibi yüksek olabilir)
-    istisnalar = ['PATATES', 'SOĞAN', 'SOGAN', 'KARPUZ', 'KAVUN']
-    
-    for _, row in df.iterrows():
-        miktar = row.get('Sayım Miktarı', 0)
-        if pd.isna(miktar):
-            continue
-        
-        urun_adi = str(row.get('Malzeme Tanımı', '')).upper()
-        
-        # İstisna kontrolü
-        if any(ist in urun_adi for ist in istisnalar):
-            esik_urun = 200  # Bu ürünler için daha yüksek eşik
-        else:
-            esik_urun = esik
-        
-        if miktar > esik_urun:
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Miktar': f"{miktar:.0f}",
-                'Eşik': f">{esik_urun}",
-                'Durum': '⚠️ Anormal yüksek'
-            })
-    
-    return sonuclar
-
-# ==================== RİSK SKORU HESAPLAMA ====================
-
-def hesapla_risk_skoru(df, df_onceki=None, urun_medianlar=None):
-    """
-    Sürekli envanter risk skorunu hesaplar - Toplam 97 puan
-    ESKİ KRİTERLER ile
-    """
-    detaylar = {}
-    toplam_puan = 0
-    
-    magaza_kodu = str(df['Mağaza Kodu'].iloc[0]) if 'Mağaza Kodu' in df.columns else ''
-    magaza_adi_col = get_magaza_adi_col(df)
-    magaza_adi = str(df[magaza_adi_col].iloc[0]) if magaza_adi_col else ''
-    
-    # Helper: Satırdan mağaza adı al
-    def get_row_magaza_adi(row):
-        if magaza_adi_col and magaza_adi_col in row.index:
-            return str(row[magaza_adi_col])
-        return magaza_adi
-    
-    # 1. BÖLGE SAPMA (20p)
-    sapma_detay = []
-    if urun_medianlar:
-        for _, row in df.iterrows():
-            kod = str(row.get('Malzeme Kodu', ''))
-            if kod in urun_medianlar:
-                median = urun_medianlar[kod].get('median', 0)
-                if median > 0:
-                    fark = abs(float(row.get('Fark Tutarı', 0) or 0))
-                    fire = abs(float(row.get('Fire Tutarı', 0) or 0))
-                    satis = float(row.get('Satış Hasılatı', 0) or 0)
-                    if satis > 500:
-                        magaza_oran = (fark + fire) / satis * 100
-                        if magaza_oran > median * 1.5:
-                            sapma_detay.append({
-                                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                                'Mağaza Adı': get_row_magaza_adi(row),
-                                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                                'Oran': f"%{magaza_oran:.1f}",
-                                'Median': f"%{median:.1f}",
-                                'Kat': f"{magaza_oran/median:.1f}x"
-                            })
-    cnt = len(sapma_detay)
-    puan = 20 if cnt >= 15 else 15 if cnt >= 10 else 10 if cnt >= 5 else 5 if cnt >= 2 else 0
-    detaylar['bolge_sapma'] = {
-        'puan': puan, 'max': 20,
-        'aciklama': f"{cnt} ürün median üstü" if urun_medianlar else "Bölge verisi gerekli",
-        'detay': sapma_detay
-    }
-    toplam_puan += puan
-    
-    # 2. SATIR İPTALİ (12p)
-    iptal_detay = []
-    if 'İptal Satır Tutarı' in df.columns:
-        for _, row in df.iterrows():
-            iptal = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-            if iptal > 50:
-                iptal_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'İptal Tutarı': f"{iptal:,.0f} TL"
-                })
-    iptal_tutar = abs(df['İptal Satır Tutarı'].sum()) if 'İptal Satır Tutarı' in df.columns else 0
-    puan = 12 if iptal_tutar > 1500 else 8 if iptal_tutar > 500 else 4 if iptal_tutar > 100 else 0
-    detaylar['satir_iptali'] = {
-        'puan': puan, 'max': 12,
-        'aciklama': f"{iptal_tutar:,.0f} TL iptal",
-        'detay': iptal_detay
-    }
-    toplam_puan += puan
-    
-    # 3. KRONİK AÇIK (10p) - Envanter sayısı bazlı
-    kronik_acik_detay = []
-    veri_var = df_onceki is not None and not df_onceki.empty
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi <= 1:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-            fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-            if fark_simdi < fark_onceki - 50:  # Daha fazla açık
-                kronik_acik_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Önceki': f"{fark_onceki:,.0f}",
-                    'Şimdi': f"{fark_simdi:,.0f}",
-                    'Durum': 'Açık artıyor'
-                })
-    cnt = len(kronik_acik_detay)
-    puan = 10 if cnt >= 10 else 6 if cnt >= 5 else 3 if cnt >= 2 else 0
-    detaylar['kronik_acik'] = {
-        'puan': puan, 'max': 10,
-        'aciklama': f"{cnt} ürün 2+ sayımda açık" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': kronik_acik_detay
-    }
-    toplam_puan += puan
-    
-    # 4. AİLE ANALİZİ (5p) - TODO
-    detaylar['aile_analizi'] = {
-        'puan': 0, 'max': 5,
-        'aciklama': "Henüz aktif değil",
-        'detay': []
-    }
-    
-    # 5. KRONİK FİRE (8p)
-    kronik_fire_detay = []
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi <= 1:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
-            fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
-            if fire_simdi < fire_onceki - 50:  # Daha fazla fire
-                kronik_fire_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Önceki': f"{fire_onceki:,.0f}",
-                    'Şimdi': f"{fire_simdi:,.0f}",
-                    'Durum': 'Fire artıyor'
-                })
-    cnt = len(kronik_fire_detay)
-    puan = 8 if cnt >= 8 else 5 if cnt >= 4 else 2 if cnt >= 2 else 0
-    detaylar['kronik_fire'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} ürün 2+ sayımda fire" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': kronik_fire_detay
-    }
-    toplam_puan += puan
-    
-    # 6. FİRE MANİPÜLASYONU (8p) - Fire var ama açık artıyor
-    fire_manip_detay = []
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi <= 1:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-            fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-            fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
-            fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
-            fark_degisim = fark_simdi - fark_onceki
-            fire_degisim = fire_simdi - fire_onceki
-            # Açık arttı (daha negatif) ama fire yazmadı
-            if fark_degisim < -50 and fire_degisim > -10:
-                fire_manip_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Fark Değişim': f"{fark_degisim:,.0f}",
-                    'Fire Değişim': f"{fire_degisim:,.0f}",
-                    'Durum': '🚨 Fire yazmadan açık'
-                })
-    cnt = len(fire_manip_detay)
-    puan = 8 if cnt >= 5 else 5 if cnt >= 3 else 2 if cnt >= 1 else 0
-    detaylar['fire_manipulasyon'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} üründe fire↑ açık↓" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': fire_manip_detay
-    }
-    toplam_puan += puan
-    
-    # 7. SAYILMAYAN ÜRÜN (8p) - Sayım atlama
-    sayim_detay = []
-    gun = datetime.now().day
-    beklenen_sayim = min((gun // 7) + 1, 4)
-    if 'Envanter Sayisi' in df.columns:
-        for _, row in df.iterrows():
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi < beklenen_sayim:
-                sayim_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Yapılan': env_sayisi,
-                    'Beklenen': beklenen_sayim,
-                    'Durum': f"⚠️ {beklenen_sayim - env_sayisi} eksik"
-                })
-    cnt = len(sayim_detay)
-    puan = 8 if cnt >= 10 else 5 if cnt >= 5 else 2 if cnt >= 2 else 0
-    detaylar['sayilmayan_urun'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} üründe sayım eksik (beklenen: {beklenen_sayim})",
-        'detay': sayim_detay
-    }
-    toplam_puan += puan
-    
-    # 8. ANORMAL MİKTAR (10p)
-    anormal_detay = []
-    istisnalar = ['PATATES', 'SOĞAN', 'SOGAN', 'KARPUZ', 'KAVUN']
-    for _, row in df.iterrows():
-        miktar = row.get('Sayım Miktarı', 0)
-        if pd.isna(miktar):
-            continue
-        urun_adi = str(row.get('Malzeme Tanımı', '')).upper()
-        esik = 200 if any(ist in urun_adi for ist in istisnalar) else 50
-        if miktar > esik:
-            anormal_detay.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                'Mağaza Adı': get_row_magaza_adi(row),
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Miktar': f"{miktar:.0f}",
-                'Durum': f'>{esik} kg/adet'
-            })
-    cnt = len(anormal_detay)
-    puan = 10 if cnt >= 5 else 6 if cnt >= 3 else 3 if cnt >= 1 else 0
-    detaylar['anormal_miktar'] = {
-        'puan': puan, 'max': 10,
-        'aciklama': f"{cnt} üründe >50 kg/adet",
-        'detay': anormal_detay
-    }
-    toplam_puan += puan
-    
-    # 9. TEKRAR MİKTAR (8p)
-    tekrar_detay = []
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            miktar = row.get('Sayım Miktarı', 0)
-            if env_sayisi <= 1 or pd.isna(miktar) or miktar <= 0:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            onceki_miktar = float(onceki.get('sayim_miktari', 0) or 0)
-            if onceki_miktar > 0 and abs(miktar - onceki_miktar) / onceki_miktar <= 0.03:
-                tekrar_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Önceki': f"{onceki_miktar:.1f}",
-                    'Şimdi': f"{miktar:.1f}",
-                    'Durum': 'Aynı miktar'
-                })
-    cnt = len(tekrar_detay)
-    puan = 8 if cnt >= 10 else 5 if cnt >= 5 else 2 if cnt >= 2 else 0
-    detaylar['tekrar_miktar'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} ürün aynı miktar" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': tekrar_detay
-    }
-    toplam_puan += puan
-    
-    # 10. YUVARLAK SAYI (8p)
-    yuvarlak_detay = []
-    for _, row in df.iterrows():
-        miktar = row.get('Sayım Miktarı', 0)
-        if pd.isna(miktar) or miktar == 0:
-            continue
-        if miktar > 0 and miktar % 5 == 0 and miktar >= 5:
-            yuvarlak_detay.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                'Mağaza Adı': get_row_magaza_adi(row),
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Miktar': f"{miktar:.0f}",
-                'Durum': 'Yuvarlak sayı'
-            })
-    cnt = len(yuvarlak_detay)
-    yuvarlak_oran = cnt / max(len(df), 1)
-    puan = 8 if yuvarlak_oran > 0.35 else 5 if yuvarlak_oran > 0.20 else 2 if yuvarlak_oran > 0.10 else 0
-    detaylar['yuvarlak_sayi'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} ürün (%{yuvarlak_oran*100:.0f}) yuvarlak",
-        'detay': yuvarlak_detay
-    }
-    toplam_puan += puan
-    
-    # Seviye belirleme
-    if toplam_puan <= 25:
-        seviye, emoji = 'normal', '✅'
-    elif toplam_puan <= 50:
-        seviye, emoji = 'dikkat', '⚠️'
-    elif toplam_puan <= 75:
-        seviye, emoji = 'riskli', '🟠'
-    else:
-        seviye, emoji = 'kritik', '🔴'
-    
-    return {
-        'toplam_puan': toplam_puan,
-        'max_puan': 97,
-        'seviye': seviye,
-        'emoji': emoji,
-        'detaylar': detaylar,
-        'magaza_kodu': magaza_kodu,
-        'magaza_adi': magaza_adi
-    }
-
-# ==================== ÖZET FONKSİYONLARI ====================
-
-def hesapla_kategori_ozet(df):
-    """Kategori bazlı özet hesapla"""
-    ozet = {}
-    
-    for _, row in df.iterrows():
-        kategori = detect_kategori(row)
-        if kategori == 'Diğer':
-            continue
-        
-        if kategori not in ozet:
-            ozet[kategori] = {'fark': 0, 'fire': 0, 'satis': 0, 'urun_sayisi': 0}
-        
-        ozet[kategori]['fark'] += float(row.get('Fark Tutarı', 0) or 0)
-        ozet[kategori]['fire'] += float(row.get('Fire Tutarı', 0) or 0)
-        ozet[kategori]['satis'] += float(row.get('Satış Hasılatı', 0) or 0)
-        ozet[kategori]['urun_sayisi'] += 1
-    
-    # Oran hesapla
-    for kat in ozet:
-        kayip = abs(ozet[kat]['fark']) + abs(ozet[kat]['fire'])
-        satis = ozet[kat]['satis']
-        ozet[kat]['oran'] = (kayip / satis * 100) if satis > 0 else 0
-    
-    return ozet
-
-def hesapla_magaza_ozet(df):
-    """Mağaza bazlı özet hesapla"""
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    agg_dict = {
-        'Fark Tutarı': 'sum',
-        'Fire Tutarı': 'sum',
-        'Satış Hasılatı': 'sum',
-        'Malzeme Kodu': 'count'
-    }
-    if magaza_adi_col:
-        agg_dict[magaza_adi_col] = 'first'
-    
-    ozet = df.groupby('Mağaza Kodu').agg(agg_dict).reset_index()
-    ozet.columns = ['Mağaza Kodu', 'Fark', 'Fire', 'Satış', 'Ürün Sayısı'] + (['Mağaza Adı'] if magaza_adi_col else [])
-    
-    ozet['Kayıp'] = abs(ozet['Fark']) + abs(ozet['Fire'])
-    ozet['Oran'] = np.where(ozet['Satış'] > 0, ozet['Kayıp'] / ozet['Satış'] * 100, 0)
-    
-    # SM/BS ekle
-    ozet['SM'] = ozet['Mağaza Kodu'].apply(lambda x: get_magaza_bilgi(x)['sm'])
-    ozet['BS'] = ozet['Mağaza Kodu'].apply(lambda x: get_magaza_bilgi(x)['bs'])
-    
-    return ozet.sort_values('Oran', ascending=False)
-
-def hesapla_sm_ozet(df):
-    """SM bazlı özet hesapla"""
-    magaza_ozet = hesapla_magaza_ozet(df)
-    
-    sm_ozet = magaza_ozet.groupby('SM').agg({
-        'Mağaza Kodu': 'nunique',
-        'Fark': 'sum',
-        'Fire': 'sum',
-        'Satış': 'sum',
-        'Kayıp': 'sum'
-    }).reset_index()
-    
-    sm_ozet.columns = ['SM', 'Mağaza Sayısı', 'Fark', 'Fire', 'Satış', 'Kayıp']
-    sm_ozet['Oran'] = np.where(sm_ozet['Satış'] > 0, sm_ozet['Kayıp'] / sm_ozet['Satış'] * 100, 0)
-    
-    return sm_ozet.sort_values('Oran', ascending=False)
-
-def hesapla_top10(df):
-    """Top 10 listelerini hesapla"""
-    magaza_ozet = hesapla_magaza_ozet(df)
-    
-    sonuc = {
-        'top10_magaza': magaza_ozet.nlargest(10, 'Oran'),
-        'top5_acik': None,
-        'top5_fire': None
-    }
-    
-    # Ürün bazlı
-    if 'Malzeme Kodu' in df.columns:
-        urun_ozet = df.groupby(['Malzeme Kodu', 'Malzeme Tanımı']).agg({
-            'Fark Tutarı': 'sum',
-            'Fire Tutarı': 'sum',
-            'Mağaza Kodu': 'nunique'
-        }).reset_index()
-        
-        urun_ozet.columns = ['Kod', 'Ürün', 'Fark', 'Fire', 'Mağaza Sayısı']
-        
-        sonuc['top5_acik'] = urun_ozet.nsmallest(5, 'Fark')[['Ürün', 'Fark', 'Mağaza Sayısı']]
-        sonuc['top5_fire'] = urun_ozet.nsmallest(5, 'Fire')[['Ürün', 'Fire', 'Mağaza Sayısı']]
-    
-    return sonuc
-
-# ==================== SAYIM DİSİPLİNİ ====================
-
-def hesapla_sayim_disiplini(df, beklenen_sayim=None):
-    """Sayım disiplini analizi - hangi ürünler kaç kez sayılmış"""
-    if beklenen_sayim is None:
-        gun = datetime.now().day
-        beklenen_sayim = min((gun // 7) + 1, 4)
-    
-    sonuc = {
-        'beklenen_sayim': beklenen_sayim,
-        'urunler': [],
-        'ozet': {}
-    }
-    
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    # Envanter sayısı dağılımı
-    if 'Envanter Sayisi' in df.columns:
-        for env_sayisi in range(1, beklenen_sayim + 1):
-            cnt = len(df[df['Envanter Sayisi'] == env_sayisi])
-            sonuc['ozet'][f'sayim_{env_sayisi}'] = cnt
-        
-        # Eksik sayımlar
-        eksik = df[df['Envanter Sayisi'] < beklenen_sayim]
-        for _, row in eksik.iterrows():
-            sonuc['urunler'].append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Yapılan': int(row.get('Envanter Sayisi', 1)),
-                'Beklenen': beklenen_sayim,
-                'Eksik': beklenen_sayim - int(row.get('Envanter Sayisi', 1))
-            })
-    
-    return sonuc
-
-# ==================== EXPORT ====================
-
-# Geriye uyumluluk için eski fonksiyon isimleri
-def detect_yuvarlak_sayi(df):
-    """Yuvarlak sayı DataFrame döndür"""
-    sonuclar = analiz_yuvarlak_sayi(df)
-    if not sonuclar:
-        return pd.DataFrame()
-    return pd.DataFrame(sonuclar)
-
-def detect_anormal_miktar(df):
-    """Anormal miktar DataFrame döndür"""
-    sonuclar = analiz_anormal_miktar(df)
-    if not sonuclar:
-        return pd.DataFrame()
-    return pd.DataFrame(sonuclar)
-
-def detect_fire_manipulasyon(df):
-    """Fire manipülasyon - eski versiyon uyumluluğu"""
-    # Yeni sistemde bu analiz_fire_yazmama ile yapılıyor
-    return pd.DataFrame()
-
-def hesapla_bolge_ozeti(df):
-    """Bölge özeti - top10 ile aynı"""
-    return hesapla_top10(df)
-# ==================== SÜREKLİ ENVANTER MODÜLÜ v3 ====================
-# Haftalık envanter analizi: Et-Tavuk, Ekmek, Meyve/Sebze
-# Yeni mantık: Envanter Sayısı bazlı kümülatif takip
-# Supabase: surekli_envanter_detay tablosu
-
-import pandas as pd
-import numpy as np
-from datetime import datetime
-import json
-import os
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
 
 # ==================== JSON'DAN VERİ YÜKLEME ====================
 
@@ -1008,6 +61,21 @@ KATEGORI_KEYWORDS = {
     'Meyve/Sebze': ['MEYVE', 'SEBZE', 'YAŞ MEYVE', 'YAŞ SEBZE']
 }
 
+# Keyword'lerin normalize halleri (Türkçe karakter sadeleştirilmiş) - bir kez hesaplanır
+KATEGORI_KEYWORDS_NORM = {
+    kategori: [normalize_tr_text(kw) for kw in keywords]
+    for kategori, keywords in KATEGORI_KEYWORDS.items()
+}
+
+# Kategori başına tek derlenmiş alternation regex (sözlük sırası = öncelik sırası)
+KATEGORI_DESENLERI = {
+    kategori: re.compile('|'.join(re.escape(kw) for kw in keywords))
+    for kategori, keywords in KATEGORI_KEYWORDS_NORM.items()
+}
+
+# Kategori metnini oluşturan kolonlar (birleştirme sırası önemli)
+KATEGORI_KOLONLARI = ['Ürün Grubu Tanımı', 'Mal Grubu Tanımı', 'Malzeme Tanımı']
+
 # Risk puan ağırlıkları (toplam 97) - ESKİ KRİTERLER
 RISK_WEIGHTS = {
     'bolge_sapma': 20,
@@ -1055,20 +123,51 @@ def get_magaza_adi_col(df):
         return 'Mağaza Tanım'
     return None
 
-def detect_kategori(row):
-    """Satırdan kategori tespit et"""
-    text = ' '.join([
-        str(row.get('Ürün Grubu Tanımı', '')),
-        str(row.get('Mal Grubu Tanımı', '')),
-        str(row.get('Malzeme Tanımı', ''))
-    ]).upper()
-    
-    for kategori, keywords in KATEGORI_KEYWORDS.items():
-        for kw in keywords:
-            if kw in text:
-                return kategori
+@lru_cache(maxsize=65536)
+def _kategori_metin(text):
+    """Normalize birleşik metin → kategori (her farklı metin bir kez aranır)"""
+    for kategori, desen in KATEGORI_DESENLERI.items():
+        if desen.search(text):
+            return kategori
     return 'Diğer'
 
+def detect_kategori(row):
+    """Satırdan kategori tespit et (ortak Türkçe normalizasyon: PİLİÇ = PILIÇ = PILIC)"""
+    return _kategori_metin(' '.join(normalize_tr_text(row.get(col, '')) for col in KATEGORI_KOLONLARI))
+
+def detect_kategori_kolon(df):
+    """
+    Kolon bazlı kategori tespiti → Series (df.index ile hizalı)
+    Her farklı (ürün grubu, mal grubu, malzeme tanımı) üçlüsü bir kez çözülür, sonuç satırlara geri dağıtılır
+    """
+    if len(df) == 0:
+        return pd.Series([], index=df.index, dtype=object)
+    
+    # Kolon başına factorize → üçlü tek int64 anahtar
+    anahtar = np.zeros(len(df), dtype=np.int64)
+    normlar = []
+    for col in KATEGORI_KOLONLARI:
+        if col in df.columns:
+            codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+            normlar.append([normalize_tr_text(v) for v in uniques])
+        else:
+            codes = np.zeros(len(df), dtype=np.int64)
+            normlar.append([''])
+        anahtar = anahtar * len(normlar[-1]) + codes
+    
+    codes, uniques = pd.factorize(anahtar)
+    
+    # Anahtar → kolon kodları (ters çevirme) → birleşik metin → kategori
+    kategoriler = []
+    for key in uniques:
+        parcalar = []
+        for norm in reversed(normlar):
+            key, kod = divmod(int(key), len(norm))
+            parcalar.append(norm[kod])
+        kategoriler.append(_kategori_metin(' '.join(reversed(parcalar))))
+    
+    return pd.Series(np.asarray(kategoriler, dtype=object)[codes], index=df.index)
+
 # ==================== ENVANTER TİPİ TESPİTİ ====================
 
 def detect_envanter_type(df):
@@ -1092,49 +191,56 @@ def detect_envanter_type(df):
 def prepare_detay_kayitlar(df):
     """
     DataFrame'den Supabase'e kaydedilecek detay kayıtlarını hazırla
-    Her satır = 1 ürün kaydı
+    Her satır = 1 ürün kaydı (kolon bazlı, satır döngüsü yok)
     """
-    records = []
+    if len(df) == 0:
+        return []
+    
     magaza_adi_col = get_magaza_adi_col(df)
     
+    def kolon(col, default):
+        return df[col] if col in df.columns else pd.Series(default, index=df.index)
+    
+    def sayisal(col):
+        # Kolon yoksa 0; boş (NaN) değer None olarak gider (JSON null)
+        return pd.to_numeric(kolon(col, 0), errors='coerce').astype(float)
+    
     # Envanter dönemi
     if 'Envanter Dönemi' in df.columns:
         envanter_donemi = str(df['Envanter Dönemi'].iloc[0])
     else:
         envanter_donemi = datetime.now().strftime('%Y%m')
     
-    for _, row in df.iterrows():
-        magaza_kodu = str(row.get('Mağaza Kodu', ''))
-        if not magaza_kodu:
-            continue
-            
-        magaza_bilgi = get_magaza_bilgi(magaza_kodu)
-        kategori = detect_kategori(row)
-        
-        # Envanter sayısı
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        record = {
-            'magaza_kodu': magaza_kodu,
-            'magaza_adi': str(row.get(magaza_adi_col, '')) if magaza_adi_col else '',
-            'sm': magaza_bilgi['sm'],
-            'bs': magaza_bilgi['bs'],
-            'malzeme_kodu': str(row.get('Malzeme Kodu', '')),
-            'malzeme_tanimi': str(row.get('Malzeme Tanımı', ''))[:100],
-            'kategori': kategori,
-            'envanter_donemi': envanter_donemi,
-            'envanter_sayisi': env_sayisi,
-            'fark_miktari': float(row.get('Fark Miktarı', 0) or 0),
-            'fark_tutari': float(row.get('Fark Tutarı', 0) or 0),
-            'fire_miktari': float(row.get('Fire Miktarı', 0) or 0),
-            'fire_tutari': float(row.get('Fire Tutarı', 0) or 0),
-            'iptal_satir_tutari': float(row.get('İptal Satır Tutarı', 0) or 0),
-            'sayim_miktari': float(row.get('Sayım Miktarı', 0) or 0),
-            'satis_hasilati': float(row.get('Satış Hasılatı', 0) or 0),
-        }
-        records.append(record)
+    magaza_kodu = kolon('Mağaza Kodu', '').astype(str)
+    gecerli = magaza_kodu != ''
+    
+    # SM/BS: unique mağaza başına bir lookup
+    bilgi = {m: get_magaza_bilgi(m) for m in magaza_kodu.unique()}
     
-    return records
+    # Envanter sayısı (boş/0 → 1)
+    env_sayisi = pd.to_numeric(kolon('Envanter Sayisi', 1), errors='coerce').fillna(1)
+    env_sayisi = env_sayisi.where(env_sayisi != 0, 1).astype(int)
+    
+    kayitlar = pd.DataFrame({
+        'magaza_kodu': magaza_kodu,
+        'magaza_adi': df[magaza_adi_col].astype(str) if magaza_adi_col else '',
+        'sm': magaza_kodu.map(lambda m: bilgi[m]['sm']),
+        'bs': magaza_kodu.map(lambda m: bilgi[m]['bs']),
+        'malzeme_kodu': kolon('Malzeme Kodu', '').astype(str),
+        'malzeme_tanimi': kolon('Malzeme Tanımı', '').astype(str).str[:100],
+        'kategori': detect_kategori_kolon(df),
+        'envanter_donemi': envanter_donemi,
+        'envanter_sayisi': env_sayisi,
+        'fark_miktari': sayisal('Fark Miktarı'),
+        'fark_tutari': sayisal('Fark Tutarı'),
+        'fire_miktari': sayisal('Fire Miktarı'),
+        'fire_tutari': sayisal('Fire Tutarı'),
+        'iptal_satir_tutari': sayisal('İptal Satır Tutarı'),
+        'sayim_miktari': sayisal('Sayım Miktarı'),
+        'satis_hasilati': sayisal('Satış Hasılatı'),
+    }, index=df.index)
+    
+    return frame_to_records(kayitlar[gecerli])
 
 def save_detay_to_supabase(supabase_client, records):
     """Detay kayıtlarını Supabase'e kaydet (upsert)"""
@@ -1152,7 +258,7 @@ def save_detay_to_supabase(supabase_client, records):
         ).execute()
         inserted = len(result.data) if result.data else 0
     except Exception as e:
-        print(f"Supabase hata: {e}")
+        logger.warning("Supabase toplu kayıt hatası, tek tek deneniyor: %s", e)
         # Tek tek dene
         for rec in records:
             try:
@@ -1164,6 +270,16 @@ def save_detay_to_supabase(supabase_client, records):
             except:
                 skipped += 1
     
+    # Bölge medyanlarını yeni sayımla artımlı güncelle
+    # Güncelleme başarısız olursa dönemin tabloları silinir: eksik/eski tablo kalmaz, sonraki okuma baştan hesaplar
+    if inserted:
+        for donem, grup in pd.DataFrame(records).groupby('envanter_donemi'):
+            try:
+                guncelle_urun_medianlari(donem, grup, supabase_client)
+            except Exception as e:
+                logger.warning("Bölge medyanı güncellenemedi (%s): %s", donem, e)
+                _medyan_sil(supabase_client, donem)
+    
     return inserted, skipped
 
 def get_onceki_envanter(supabase_client, magaza_kodu, malzeme_kodu, envanter_donemi, envanter_sayisi):
@@ -1203,105 +319,366 @@ def get_magaza_onceki_kayitlar(supabase_client, magaza_kodu, envanter_donemi):
         pass
     return pd.DataFrame()
 
+# ==================== ÖNCEKİ SAYIM EŞLEŞTİRME ====================
+
+def _kolon(df, col, default=''):
+    """Kolon yoksa sabit değerli Series"""
+    return df[col] if col in df.columns else pd.Series(default, index=df.index)
+
+def _sayisal(df, col):
+    """float(row.get(col, 0) or 0) karşılığı - kolon yoksa 0, NaN korunur (-0.0 → 0.0, `or 0` gibi)"""
+    if col not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[col], errors='coerce').astype(float) + 0.0
+
+def _env_sayisi(df):
+    """Envanter Sayisi (boş/0 → 1)"""
+    env = pd.to_numeric(_kolon(df, 'Envanter Sayisi', 1), errors='coerce').fillna(1)
+    return env.where(env != 0, 1).astype(int)
+
+def onceki_sayim_eslestir(df, df_onceki=None):
+    """
+    Her satırı bir önceki sayım kaydıyla TEK merge ile eşleştir
+    Anahtar: (malzeme_kodu, envanter_sayisi - 1) - aynı anahtarda birden fazla kayıt varsa ilki
+    İki frame'de de mağaza kodu varsa anahtara eklenir (çok mağazalı bölge frame'i)
+    
+    Dönüş (df.index ile hizalı):
+        _env_sayisi, _onceki_var (sayı > 1 ve kayıt bulundu),
+        _onceki_fark, _onceki_fire, _onceki_iptal, _onceki_sayim
+    """
+    env = _env_sayisi(df)
+    eslesme = pd.DataFrame({
+        '_env_sayisi': env,
+        '_onceki_var': False,
+        '_onceki_fark': np.nan,
+        '_onceki_fire': np.nan,
+        '_onceki_iptal': np.nan,
+        '_onceki_sayim': np.nan,
+    }, index=df.index)
+    
+    if df_onceki is None or df_onceki.empty or 'malzeme_kodu' not in df_onceki.columns:
+        return eslesme
+    
+    sayisi = pd.to_numeric(_kolon(df_onceki, 'envanter_sayisi', np.nan), errors='coerce')
+    gecerli = sayisi.notna() & (sayisi == sayisi.round())
+    onceki = pd.DataFrame({
+        '_kod': df_onceki['malzeme_kodu'].astype(str),
+        '_sayisi': sayisi,
+        '_onceki_fark': _sayisal(df_onceki, 'fark_tutari'),
+        '_onceki_fire': _sayisal(df_onceki, 'fire_tutari'),
+        '_onceki_iptal': _sayisal(df_onceki, 'iptal_satir_tutari'),
+        '_onceki_sayim': _sayisal(df_onceki, 'sayim_miktari'),
+    })[gecerli]
+    onceki['_sayisi'] = onceki['_sayisi'].astype('int64')
+    
+    anahtar = pd.DataFrame({
+        '_kod': _kolon(df, 'Malzeme Kodu', '').astype(str).to_numpy(),
+        '_sayisi': (env - 1).astype('int64').to_numpy(),
+    })
+    keys = ['_kod', '_sayisi']
+    if 'Mağaza Kodu' in df.columns and 'magaza_kodu' in df_onceki.columns:
+        onceki['_magaza'] = df_onceki['magaza_kodu'].astype(str)
+        anahtar['_magaza'] = df['Mağaza Kodu'].astype(str).to_numpy()
+        keys.append('_magaza')
+    
+    onceki = onceki.drop_duplicates(subset=keys, keep='first')
+    merged = anahtar.merge(onceki, on=keys, how='left', indicator=True)
+    merged.index = df.index
+    
+    for col in ['_onceki_fark', '_onceki_fire', '_onceki_iptal', '_onceki_sayim']:
+        eslesme[col] = merged[col]
+    eslesme['_onceki_var'] = (merged['_merge'] == 'both') & (env > 1)
+    return eslesme
+
+def _detay_kayitlari(df, mask, kolonlar):
+    """Maskeye giren satırlar için detay dict listesi (kolonlar: ad → Series / sabit)"""
+    if not mask.any():
+        return []
+    secili = {ad: (deger[mask] if isinstance(deger, pd.Series) else deger) for ad, deger in kolonlar.items()}
+    return pd.DataFrame(secili, index=df.index[mask]).to_dict('records')
+
+def _fmt(series, fmt):
+    """Sayı → metin (f-string biçimiyle aynı)"""
+    return series.map(fmt.format)
+
+# ==================== BÖLGE MEDYANLARI ====================
+# Ürün bazında bölge kayıp oranı medyanları (bölge sapma kriteri için)
+# Dönem başına küçük bir lookup tablosu: Supabase surekli_urun_medyan tablosunda saklanır (tüm sunucular aynı tabloyu okur).
+# Mağaza × ürün oran tablosu ENVANTER_MEDYAN_DIR verilmişse (paylaşılan klasör) Parquet olarak tutulur;
+# o zaman yeni sayım yüklendikçe sadece etkilenen ürünlerin medyanı yeniden hesaplanır, yoksa dönem baştan hesaplanır
+
+MEDYAN_TABLO = 'surekli_urun_medyan'
+MEDYAN_DIR = os.environ.get('ENVANTER_MEDYAN_DIR') or None
+MEDYAN_MIN_MAGAZA = 3  # Medyan için en az mağaza sayısı
+MEDYAN_MIN_SATIS = 500  # Oranın anlamlı olduğu en düşük satış (bölge sapma kriteri ile aynı)
+MEDYAN_YUZDELIKLER = (0.75, 0.90)
+MEDYAN_KOLONLARI = 'magaza_kodu,malzeme_kodu,envanter_sayisi,fark_tutari,fire_tutari,satis_hasilati'
+MEDYAN_SAYFA = 1000
+
+def _oran_dosyasi(envanter_donemi):
+    """Dönemin oran dosyası (MEDYAN_DIR verilmemişse None)"""
+    if not MEDYAN_DIR or not PARQUET_AVAILABLE:
+        return None
+    safe = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(envanter_donemi))
+    return os.path.join(MEDYAN_DIR, f"oran_{safe}.parquet")
+
+def _oran_oku(envanter_donemi):
+    path = _oran_dosyasi(envanter_donemi)
+    if path is None:
+        return None
+    try:
+        return pd.read_parquet(path)
+    except (OSError, ValueError):
+        return None
+
+def _oran_yaz(envanter_donemi, df):
+    """Atomik yazım (önce .tmp, sonra rename)"""
+    path = _oran_dosyasi(envanter_donemi)
+    if path is None:
+        return False
+    try:
+        os.makedirs(MEDYAN_DIR, exist_ok=True)
+        df.to_parquet(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return True
+    except (OSError, ValueError) as e:
+        logger.warning("Oran tablosu yazılamadı (%s): %s", envanter_donemi, e)
+        return False
+
+def _medyan_tablo_oku(supabase_client, envanter_donemi):
+    """Dönemin kayıtlı medyan tablosu (Supabase, sayfalı); kayıt yoksa None"""
+    satirlar = []
+    offset = 0
+    while True:
+        page = supabase_client.table(MEDYAN_TABLO).select('*').eq(
+            'envanter_donemi', envanter_donemi
+        ).order('malzeme_kodu').range(offset, offset + MEDYAN_SAYFA - 1).execute().data
+        satirlar.extend(page or [])
+        if not page or len(page) < MEDYAN_SAYFA:
+            break
+        offset += MEDYAN_SAYFA
+    
+    if not satirlar:
+        return None
+    kolonlar = ['median'] + [f"p{int(q * 100)}" for q in MEDYAN_YUZDELIKLER] + ['magaza_sayisi']
+    tablo = pd.DataFrame(satirlar).astype({'malzeme_kodu': str}).set_index('malzeme_kodu')[kolonlar]
+    tablo = tablo.astype({c: 'float32' for c in kolonlar if c != 'magaza_sayisi'})
+    tablo['magaza_sayisi'] = tablo['magaza_sayisi'].astype('int32')
+    return tablo
+
+def _medyan_tablo_yaz(supabase_client, envanter_donemi, tablo, urunler=None):
+    """
+    Dönemin medyan satırlarını değiştir: önce sil (urunler verilmişse sadece o ürünler), sonra ekle
+    Yarıda kalırsa çağıran _medyan_sil ile dönemi temizler
+    """
+    sorgu = supabase_client.table(MEDYAN_TABLO).delete().eq('envanter_donemi', envanter_donemi)
+    if urunler is not None:
+        sorgu = sorgu.in_('malzeme_kodu', [str(k) for k in urunler])
+    sorgu.execute()
+    
+    kayitlar = frame_to_records(tablo.reset_index().assign(envanter_donemi=envanter_donemi))
+    for i in range(0, len(kayitlar), MEDYAN_SAYFA):
+        supabase_client.table(MEDYAN_TABLO).insert(kayitlar[i:i + MEDYAN_SAYFA]).execute()
+
+def hesapla_urun_oranlari(df_detay):
+    """
+    surekli_envanter_detay kayıtları → mağaza × ürün kayıp oranı
+    Kümülatif takip: her mağaza-ürün için son envanter sayısı alınır
+    oran = (|fark| + |fire|) / satış * 100 (satış <= 500 ise NaN)
+    """
+    kolonlar = ['magaza_kodu', 'malzeme_kodu', 'envanter_sayisi', 'oran']
+    if df_detay is None or len(df_detay) == 0:
+        return pd.DataFrame(columns=kolonlar)
+    
+    fark = _sayisal(df_detay, 'fark_tutari')
+    fire = _sayisal(df_detay, 'fire_tutari')
+    satis = _sayisal(df_detay, 'satis_hasilati')
+    
+    oranlar = pd.DataFrame({
+        'magaza_kodu': _kolon(df_detay, 'magaza_kodu', '').astype(str),
+        'malzeme_kodu': _kolon(df_detay, 'malzeme_kodu', '').astype(str),
+        'envanter_sayisi': pd.to_numeric(_kolon(df_detay, 'envanter_sayisi', 1), errors='coerce').fillna(1).astype('int32'),
+        'oran': ((fark.abs() + fire.abs()) / satis.where(satis > MEDYAN_MIN_SATIS) * 100).astype('float32'),
+    })
+    
+    oranlar = oranlar.sort_values('envanter_sayisi', kind='stable')
+    oranlar = oranlar.drop_duplicates(subset=['magaza_kodu', 'malzeme_kodu'], keep='last')
+    return oranlar.reset_index(drop=True)
+
+def hesapla_urun_medianlari(oranlar, yuzdelikler=MEDYAN_YUZDELIKLER, min_magaza=MEDYAN_MIN_MAGAZA):
+    """
+    Mağaza × ürün oranlarından ürün bazında medyan tablosu
+    Dönüş: index=malzeme_kodu, kolonlar median, p75, p90 (yuzdelikler), magaza_sayisi
+    """
+    kolonlar = ['median'] + [f"p{int(q * 100)}" for q in yuzdelikler] + ['magaza_sayisi']
+    gecerli = oranlar.dropna(subset=['oran'])
+    if len(gecerli) == 0:
+        return pd.DataFrame(columns=kolonlar, index=pd.Index([], name='malzeme_kodu'))
+    
+    g = gecerli.groupby('malzeme_kodu', sort=False)['oran']
+    tablo = pd.DataFrame({'median': g.median(), 'magaza_sayisi': g.size()})
+    if yuzdelikler:
+        yuzde = g.quantile(list(yuzdelikler)).unstack()
+        for q in yuzdelikler:
+            tablo[f"p{int(q * 100)}"] = yuzde[q]
+    
+    tablo = tablo[tablo['magaza_sayisi'] >= min_magaza]
+    tablo = tablo.astype({c: 'float32' for c in kolonlar if c != 'magaza_sayisi'})
+    tablo['magaza_sayisi'] = tablo['magaza_sayisi'].astype('int32')
+    return tablo[kolonlar]
+
+def fetch_surekli_detay(supabase_client, envanter_donemi, columns=MEDYAN_KOLONLARI):
+    """Dönemin tüm surekli_envanter_detay kayıtları (sayfalı) → DataFrame"""
+    names = columns.split(',')
+    arrays = {c: [] for c in names}
+    offset = 0
+    
+    while True:
+        page = supabase_client.table('surekli_envanter_detay').select(columns).eq(
+            'envanter_donemi', envanter_donemi
+        ).order('magaza_kodu').order('malzeme_kodu').order('envanter_sayisi').range(
+            offset, offset + MEDYAN_SAYFA - 1
+        ).execute().data
+        if not page:
+            break
+        for c in names:
+            arrays[c].extend([r.get(c) for r in page])
+        if len(page) < MEDYAN_SAYFA:
+            break
+        offset += MEDYAN_SAYFA
+    
+    return pd.DataFrame(arrays)
+
+def yenile_urun_medianlari(supabase_client, envanter_donemi):
+    """Dönemin medyan tablosunu baştan hesapla (tüm mağazalar) ve kaydet"""
+    oranlar = hesapla_urun_oranlari(fetch_surekli_detay(supabase_client, envanter_donemi))
+    tablo = hesapla_urun_medianlari(oranlar)
+    _medyan_tablo_yaz(supabase_client, envanter_donemi, tablo)
+    _oran_yaz(envanter_donemi, oranlar)
+    return tablo
+
+def _medyan_sil(supabase_client, envanter_donemi):
+    """Dönemin kayıtlı tablolarını sil - sonraki get_urun_medianlari baştan hesaplar"""
+    path = _oran_dosyasi(envanter_donemi)
+    if path is not None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    try:
+        supabase_client.table(MEDYAN_TABLO).delete().eq('envanter_donemi', envanter_donemi).execute()
+    except Exception as e:
+        logger.warning("Bölge medyanı silinemedi (%s): %s", envanter_donemi, e)
+
+def guncelle_urun_medianlari(envanter_donemi, yeni_kayitlar, supabase_client=None):
+    """
+    Artımlı güncelleme: yeni yüklenen detay kayıtlarını (records / DataFrame) dönemin oran tablosuna işle,
+    sadece etkilenen ürünlerin medyanını yeniden hesapla
+    Aynı mağaza-ürün için yeni kayıt eskisinin yerine geçer (aynı envanter sayısında da)
+    
+    Kayıtlı oran tablosu yoksa (dönemin ilk yüklemesi / MEDYAN_DIR verilmemiş) yeni kayıtlar tek başına yetmez:
+    tüm dönem baştan hesaplanır. supabase_client yoksa hiçbir şey yazılmaz (None)
+    """
+    if supabase_client is None:
+        return None
+    
+    mevcut = _oran_oku(envanter_donemi)
+    tablo = _medyan_tablo_oku(supabase_client, envanter_donemi) if mevcut is not None else None
+    if mevcut is None or tablo is None:
+        return yenile_urun_medianlari(supabase_client, envanter_donemi)
+    
+    yeni = hesapla_urun_oranlari(pd.DataFrame(yeni_kayitlar))
+    if len(yeni) == 0:
+        return tablo
+    
+    oranlar = pd.concat([mevcut, yeni], ignore_index=True)
+    oranlar = oranlar.sort_values('envanter_sayisi', kind='stable')
+    oranlar = oranlar.drop_duplicates(subset=['magaza_kodu', 'malzeme_kodu'], keep='last').reset_index(drop=True)
+    
+    etkilenen = yeni['malzeme_kodu'].unique()
+    guncel = hesapla_urun_medianlari(oranlar[oranlar['malzeme_kodu'].isin(etkilenen)])
+    guncel = pd.concat([tablo[~tablo.index.isin(etkilenen)], guncel])
+    
+    _medyan_tablo_yaz(supabase_client, envanter_donemi, guncel.loc[guncel.index.isin(etkilenen)], etkilenen)
+    _oran_yaz(envanter_donemi, oranlar)
+    return guncel
+
+def get_urun_medianlari(envanter_donemi, supabase_client=None):
+    """
+    Dönemin medyan tablosu (hesapla_risk_skoru / hesapla_bolge_risk_skorlari için urun_medianlar)
+    Supabase'de kayıtlı tablo yoksa baştan hesaplanıp kaydedilir; supabase_client yoksa / hata olursa None
+    """
+    if supabase_client is None:
+        return None
+    try:
+        tablo = _medyan_tablo_oku(supabase_client, envanter_donemi)
+        if tablo is None:
+            tablo = yenile_urun_medianlari(supabase_client, envanter_donemi)
+    except Exception as e:
+        logger.warning("Bölge medyanı alınamadı (%s): %s", envanter_donemi, e)
+        return None
+    return tablo
+
 # ==================== ANALİZ FONKSİYONLARI ====================
 
-def analiz_fire_yazmama(df, df_onceki=None):
+def analiz_fire_yazmama(df, df_onceki=None, eslesme=None):
     """
     Fire yazmadan açık verenleri tespit et
     Envanter sayısı artmış + Fark artmış + Fire artmamış = 🚨
+    eslesme: onceki_sayim_eslestir sonucu (verilmezse hesaplanır)
     """
-    sonuclar = []
-    
     if df_onceki is None or df_onceki.empty:
         # Önceki veri yok, sadece mevcut durumu raporla
-        return sonuclar
+        return []
     
+    if eslesme is None:
+        eslesme = onceki_sayim_eslestir(df, df_onceki)
     magaza_adi_col = get_magaza_adi_col(df)
     
-    for _, row in df.iterrows():
-        malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        if env_sayisi <= 1:
-            continue
-        
-        # Önceki kaydı bul
-        onceki = df_onceki[
-            (df_onceki['malzeme_kodu'] == malzeme_kodu) & 
-            (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-        ]
-        
-        if onceki.empty:
-            continue
-        
-        onceki = onceki.iloc[0]
-        
-        # Değişimleri hesapla
-        fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-        fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-        fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
-        fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
-        
-        fark_degisim = fark_simdi - fark_onceki  # Negatif = daha fazla açık
-        fire_degisim = fire_simdi - fire_onceki  # Negatif = daha fazla fire
-        
-        # Fire yazmama: Fark arttı (daha negatif) ama fire artmadı
-        if fark_degisim < -50 and fire_degisim >= -10:  # 50 TL'den fazla yeni açık, 10 TL'den az fire
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Env.Sayısı': f"{env_sayisi-1} → {env_sayisi}",
-                'Fark Değişim': f"{fark_degisim:,.0f} TL",
-                'Fire Değişim': f"{fire_degisim:,.0f} TL",
-                'Durum': '🚨 Fire yazmadan açık!'
-            })
-    
-    return sonuclar
-
-def analiz_kronik_acik(df, df_onceki=None):
+    fark_degisim = _sayisal(df, 'Fark Tutarı') - eslesme['_onceki_fark']  # Negatif = daha fazla açık
+    fire_degisim = _sayisal(df, 'Fire Tutarı') - eslesme['_onceki_fire']  # Negatif = daha fazla fire
+    env = eslesme['_env_sayisi']
+    
+    # Fire yazmama: Fark arttı (daha negatif) ama fire artmadı
+    # 50 TL'den fazla yeni açık, 10 TL'den az fire
+    mask = eslesme['_onceki_var'] & (fark_degisim < -50) & (fire_degisim >= -10)
+    
+    return _detay_kayitlari(df, mask, {
+        'Mağaza Kodu': _kolon(df, 'Mağaza Kodu', ''),
+        'Mağaza Adı': df[magaza_adi_col] if magaza_adi_col else '',
+        'Ürün': _kolon(df, 'Malzeme Tanımı', '').astype(str).str[:30],
+        'Env.Sayısı': (env - 1).astype(str) + ' → ' + env.astype(str),
+        'Fark Değişim': _fmt(fark_degisim, '{:,.0f} TL'),
+        'Fire Değişim': _fmt(fire_degisim, '{:,.0f} TL'),
+        'Durum': '🚨 Fire yazmadan açık!'
+    })
+
+def analiz_kronik_acik(df, df_onceki=None, eslesme=None):
     """Her sayımda açık artan ürünleri tespit et"""
-    sonuclar = []
-    
     if df_onceki is None or df_onceki.empty:
-        return sonuclar
+        return []
     
+    if eslesme is None:
+        eslesme = onceki_sayim_eslestir(df, df_onceki)
     magaza_adi_col = get_magaza_adi_col(df)
     
-    for _, row in df.iterrows():
-        malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        if env_sayisi <= 1:
-            continue
-        
-        onceki = df_onceki[
-            (df_onceki['malzeme_kodu'] == malzeme_kodu) & 
-            (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-        ]
-        
-        if onceki.empty:
-            continue
-        
-        onceki = onceki.iloc[0]
-        
-        fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-        fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-        fark_degisim = fark_simdi - fark_onceki
-        
-        # Kronik açık: Her sayımda açık artıyor
-        if fark_degisim < -100:  # 100 TL'den fazla yeni açık
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Env.Sayısı': f"{env_sayisi-1} → {env_sayisi}",
-                'Önceki Fark': f"{fark_onceki:,.0f} TL",
-                'Şimdiki Fark': f"{fark_simdi:,.0f} TL",
-                'Yeni Açık': f"{fark_degisim:,.0f} TL"
-            })
+    fark_simdi = _sayisal(df, 'Fark Tutarı')
+    fark_onceki = eslesme['_onceki_fark']
+    fark_degisim = fark_simdi - fark_onceki
+    env = eslesme['_env_sayisi']
     
-    return sonuclar
+    # Kronik açık: Her sayımda açık artıyor - 100 TL'den fazla yeni açık
+    mask = eslesme['_onceki_var'] & (fark_degisim < -100)
+    
+    return _detay_kayitlari(df, mask, {
+        'Mağaza Kodu': _kolon(df, 'Mağaza Kodu', ''),
+        'Mağaza Adı': df[magaza_adi_col] if magaza_adi_col else '',
+        'Ürün': _kolon(df, 'Malzeme Tanımı', '').astype(str).str[:30],
+        'Env.Sayısı': (env - 1).astype(str) + ' → ' + env.astype(str),
+        'Önceki Fark': _fmt(fark_onceki, '{:,.0f} TL'),
+        'Şimdiki Fark': _fmt(fark_simdi, '{:,.0f} TL'),
+        'Yeni Açık': _fmt(fark_degisim, '{:,.0f} TL')
+    })
 
 def analiz_sayim_atlama(df, beklenen_sayim=4):
     """Beklenen sayımdan az sayım yapılan ürünleri tespit et"""
@@ -1324,69 +701,52 @@ def analiz_sayim_atlama(df, beklenen_sayim=4):
     
     return sonuclar
 
-def analiz_iptal_artis(df, df_onceki=None):
+def analiz_iptal_artis(df, df_onceki=None, eslesme=None):
     """İptal tutarı artışını tespit et"""
-    sonuclar = []
+    magaza_adi_col = get_magaza_adi_col(df)
+    iptal = _sayisal(df, 'İptal Satır Tutarı').abs()
+    
+    ortak = {
+        'Mağaza Kodu': _kolon(df, 'Mağaza Kodu', ''),
+        'Mağaza Adı': df[magaza_adi_col] if magaza_adi_col else '',
+        'Ürün': _kolon(df, 'Malzeme Tanımı', '').astype(str).str[:30],
+    }
     
     if df_onceki is None or df_onceki.empty:
         # Önceki yok, sadece yüksek iptalleri göster
-        magaza_adi_col = get_magaza_adi_col(df)
-        for _, row in df.iterrows():
-            iptal = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-            if iptal > 100:
-                sonuclar.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                    'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'İptal Tutarı': f"{iptal:,.0f} TL",
-                    'Durum': 'Kümülatif iptal'
-                })
-        return sonuclar
-    
-    magaza_adi_col = get_magaza_adi_col(df)
-    
-    for _, row in df.iterrows():
-        malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-        env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-        
-        if env_sayisi <= 1:
-            iptal = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-            if iptal > 100:
-                sonuclar.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                    'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'İptal Tutarı': f"{iptal:,.0f} TL",
-                    'Durum': 'İlk sayım iptal'
-                })
-            continue
-        
-        onceki = df_onceki[
-            (df_onceki['malzeme_kodu'] == malzeme_kodu) & 
-            (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-        ]
-        
-        if onceki.empty:
-            continue
-        
-        onceki = onceki.iloc[0]
-        
-        iptal_simdi = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-        iptal_onceki = abs(float(onceki.get('iptal_satir_tutari', 0) or 0))
-        iptal_degisim = iptal_simdi - iptal_onceki
-        
-        if iptal_degisim > 50:  # 50 TL'den fazla yeni iptal
-            sonuclar.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', ''),
-                'Mağaza Adı': row.get(magaza_adi_col, '') if magaza_adi_col else '',
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Env.Sayısı': f"{env_sayisi-1} → {env_sayisi}",
-                'Önceki İptal': f"{iptal_onceki:,.0f} TL",
-                'Şimdiki İptal': f"{iptal_simdi:,.0f} TL",
-                'Yeni İptal': f"+{iptal_degisim:,.0f} TL"
-            })
+        return _detay_kayitlari(df, iptal > 100, {
+            **ortak,
+            'İptal Tutarı': _fmt(iptal, '{:,.0f} TL'),
+            'Durum': 'Kümülatif iptal'
+        })
     
-    return sonuclar
+    if eslesme is None:
+        eslesme = onceki_sayim_eslestir(df, df_onceki)
+    env = eslesme['_env_sayisi']
+    
+    ilk_sayim = (env <= 1) & (iptal > 100)
+    
+    iptal_onceki = eslesme['_onceki_iptal'].abs()
+    iptal_degisim = iptal - iptal_onceki
+    artis = eslesme['_onceki_var'] & (iptal_degisim > 50)  # 50 TL'den fazla yeni iptal
+    
+    ilk_kayitlar = _detay_kayitlari(df, ilk_sayim, {
+        **ortak,
+        'İptal Tutarı': _fmt(iptal, '{:,.0f} TL'),
+        'Durum': 'İlk sayım iptal'
+    })
+    artis_kayitlar = _detay_kayitlari(df, artis, {
+        **ortak,
+        'Env.Sayısı': (env - 1).astype(str) + ' → ' + env.astype(str),
+        'Önceki İptal': _fmt(iptal_onceki, '{:,.0f} TL'),
+        'Şimdiki İptal': _fmt(iptal, '{:,.0f} TL'),
+        'Yeni İptal': _fmt(iptal_degisim, '+{:,.0f} TL')
+    })
+    
+    # Satır sırasını koru (iki tür kayıt tek listede, orijinal sırada)
+    sira = np.concatenate([np.flatnonzero(ilk_sayim.to_numpy()), np.flatnonzero(artis.to_numpy())])
+    kayitlar = ilk_kayitlar + artis_kayitlar
+    return [kayitlar[i] for i in np.argsort(sira, kind='stable')]
 
 def analiz_yuvarlak_sayi(df):
     """Yuvarlak sayı girişlerini tespit et (5, 10, 15, 20...)"""
@@ -1445,342 +805,412 @@ def analiz_anormal_miktar(df, esik=50):
 
 # ==================== RİSK SKORU HESAPLAMA ====================
 
-def hesapla_risk_skoru(df, df_onceki=None, urun_medianlar=None):
+# Kriter → (max puan, eşik tablosu [(eşik, puan), ...] büyükten küçüğe, karşılaştırma)
+# '>=' adet eşikleri, '>' tutar / oran eşikleri
+RISK_PUAN_TABLOSU = {
+    'bolge_sapma': (20, [(15, 20), (10, 15), (5, 10), (2, 5)], '>='),
+    'satir_iptali': (12, [(1500, 12), (500, 8), (100, 4)], '>'),
+    'kronik_acik': (10, [(10, 10), (5, 6), (2, 3)], '>='),
+    'aile_analizi': (5, [], '>='),
+    'kronik_fire': (8, [(8, 8), (4, 5), (2, 2)], '>='),
+    'fire_manipulasyon': (8, [(5, 8), (3, 5), (1, 2)], '>='),
+    'sayilmayan_urun': (8, [(10, 8), (5, 5), (2, 2)], '>='),
+    'anormal_miktar': (10, [(5, 10), (3, 6), (1, 3)], '>='),
+    'tekrar_miktar': (8, [(10, 8), (5, 5), (2, 2)], '>='),
+    'yuvarlak_sayi': (8, [(0.35, 8), (0.20, 5), (0.10, 2)], '>'),
+}
+
+# Kriter görünen adları (UI / Excel)
+RISK_KRITER_ADLARI = {
+    'bolge_sapma': 'Bölge Sapma',
+    'satir_iptali': 'Satır İptali',
+    'kronik_acik': 'Kronik Açık',
+    'aile_analizi': 'Aile Analizi',
+    'kronik_fire': 'Kronik Fire',
+    'fire_manipulasyon': 'Fire Manipülasyonu',
+    'sayilmayan_urun': 'Sayılmayan Ürün',
+    'anormal_miktar': 'Anormal Miktar',
+    'tekrar_miktar': 'Tekrar Miktar',
+    'yuvarlak_sayi': 'Yuvarlak Sayı',
+}
+
+# Satır bazlı maskesi olan kriterler (aile_analizi henüz aktif değil)
+RISK_MASKE_KRITERLERI = ['bolge_sapma', 'satir_iptali', 'kronik_acik', 'kronik_fire', 'fire_manipulasyon',
+                         'sayilmayan_urun', 'anormal_miktar', 'tekrar_miktar', 'yuvarlak_sayi']
+
+# Yüksek miktarı normal olan ürünler (anormal miktar eşiği 200)
+ANORMAL_ISTISNALAR = ['PATATES', 'SOĞAN', 'SOGAN', 'KARPUZ', 'KAVUN']
+
+def risk_puani(deger, kriter):
     """
-    Sürekli envanter risk skorunu hesaplar - Toplam 97 puan
-    ESKİ KRİTERLER ile
+    Kriter puanı - eşik tablosundan
+    deger skaler ise int, Series / dizi ise aynı boyda int dizi döner
     """
-    detaylar = {}
-    toplam_puan = 0
-    
-    magaza_kodu = str(df['Mağaza Kodu'].iloc[0]) if 'Mağaza Kodu' in df.columns else ''
+    _, tablo, karsilastirma = RISK_PUAN_TABLOSU[kriter]
+    dizi = np.asarray(deger, dtype=float)
+    if karsilastirma == '>=':
+        kosullar = [dizi >= esik for esik, _ in tablo]
+    else:
+        kosullar = [dizi > esik for esik, _ in tablo]
+    puan = np.select(kosullar, [p for _, p in tablo], default=0) if tablo else np.zeros(dizi.shape, dtype=int)
+    return int(puan) if puan.ndim == 0 else puan.astype(int)
+
+def risk_seviyesi(toplam_puan):
+    """Toplam puan → (seviye, emoji)"""
+    if toplam_puan <= 25:
+        return 'normal', '✅'
+    elif toplam_puan <= 50:
+        return 'dikkat', '⚠️'
+    elif toplam_puan <= 75:
+        return 'riskli', '🟠'
+    return 'kritik', '🔴'
+
+def beklenen_sayim_sayisi(gun=None):
+    """Ayın gününe göre beklenen sayım sayısı (her hafta 1, en fazla 4)"""
+    gun = datetime.now().day if gun is None else gun
+    return min((gun // 7) + 1, 4)
+
+def _medyan_var(urun_medianlar):
+    """urun_medianlar dolu mu? (dict veya get_urun_medianlari tablosu)"""
+    if isinstance(urun_medianlar, pd.DataFrame):
+        return not urun_medianlar.empty
+    return bool(urun_medianlar)
+
+def _medyan_serisi(kod, urun_medianlar):
+    """
+    Malzeme kodu → bölge medyanı (yoksa 0)
+    urun_medianlar: {kod: {'median': ...}} dict veya index=malzeme_kodu, 'median' kolonlu tablo
+    """
+    if not _medyan_var(urun_medianlar):
+        return pd.Series(0.0, index=kod.index)
+    if isinstance(urun_medianlar, pd.DataFrame):
+        medyanlar = pd.Series(urun_medianlar['median'].to_numpy(dtype=float), index=urun_medianlar.index.astype(str))
+    else:
+        medyanlar = {str(k): v.get('median', 0) for k, v in urun_medianlar.items()}
+    return pd.to_numeric(kod.map(medyanlar), errors='coerce').fillna(0.0)
+
+def hazirla_risk_frame(df, df_onceki=None, urun_medianlar=None, eslesme=None):
+    """
+    Risk kriterleri için tek hazırlanmış frame (df.index ile hizalı)
+    Sayısal kolonlar bir kez çevrilir, önceki sayım tek merge ile eşleşir;
+    her kriter _k_<kriter> boolean maskesi olarak eklenir. Metin biçimlendirme yapılmaz.
+    """
+    magaza_kodu = str(df['Mağaza Kodu'].iloc[0]) if 'Mağaza Kodu' in df.columns and len(df) else ''
     magaza_adi_col = get_magaza_adi_col(df)
-    magaza_adi = str(df[magaza_adi_col].iloc[0]) if magaza_adi_col else ''
-    
-    # Helper: Satırdan mağaza adı al
-    def get_row_magaza_adi(row):
-        if magaza_adi_col and magaza_adi_col in row.index:
-            return str(row[magaza_adi_col])
-        return magaza_adi
-    
-    # 1. BÖLGE SAPMA (20p)
-    sapma_detay = []
-    if urun_medianlar:
-        for _, row in df.iterrows():
-            kod = str(row.get('Malzeme Kodu', ''))
-            if kod in urun_medianlar:
-                median = urun_medianlar[kod].get('median', 0)
-                if median > 0:
-                    fark = abs(float(row.get('Fark Tutarı', 0) or 0))
-                    fire = abs(float(row.get('Fire Tutarı', 0) or 0))
-                    satis = float(row.get('Satış Hasılatı', 0) or 0)
-                    if satis > 500:
-                        magaza_oran = (fark + fire) / satis * 100
-                        if magaza_oran > median * 1.5:
-                            sapma_detay.append({
-                                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                                'Mağaza Adı': get_row_magaza_adi(row),
-                                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                                'Oran': f"%{magaza_oran:.1f}",
-                                'Median': f"%{median:.1f}",
-                                'Kat': f"{magaza_oran/median:.1f}x"
-                            })
-    cnt = len(sapma_detay)
-    puan = 20 if cnt >= 15 else 15 if cnt >= 10 else 10 if cnt >= 5 else 5 if cnt >= 2 else 0
-    detaylar['bolge_sapma'] = {
-        'puan': puan, 'max': 20,
-        'aciklama': f"{cnt} ürün median üstü" if urun_medianlar else "Bölge verisi gerekli",
-        'detay': sapma_detay
-    }
-    toplam_puan += puan
-    
-    # 2. SATIR İPTALİ (12p)
-    iptal_detay = []
-    if 'İptal Satır Tutarı' in df.columns:
-        for _, row in df.iterrows():
-            iptal = abs(float(row.get('İptal Satır Tutarı', 0) or 0))
-            if iptal > 50:
-                iptal_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'İptal Tutarı': f"{iptal:,.0f} TL"
-                })
-    iptal_tutar = abs(df['İptal Satır Tutarı'].sum()) if 'İptal Satır Tutarı' in df.columns else 0
-    puan = 12 if iptal_tutar > 1500 else 8 if iptal_tutar > 500 else 4 if iptal_tutar > 100 else 0
-    detaylar['satir_iptali'] = {
-        'puan': puan, 'max': 12,
-        'aciklama': f"{iptal_tutar:,.0f} TL iptal",
-        'detay': iptal_detay
-    }
-    toplam_puan += puan
+    magaza_adi = str(df[magaza_adi_col].iloc[0]) if magaza_adi_col and len(df) else ''
     
-    # 3. KRONİK AÇIK (10p) - Envanter sayısı bazlı
-    kronik_acik_detay = []
+    if eslesme is None:
+        eslesme = onceki_sayim_eslestir(df, df_onceki)
     veri_var = df_onceki is not None and not df_onceki.empty
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi <= 1:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-            fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-            if fark_simdi < fark_onceki - 50:  # Daha fazla açık
-                kronik_acik_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Önceki': f"{fark_onceki:,.0f}",
-                    'Şimdi': f"{fark_simdi:,.0f}",
-                    'Durum': 'Açık artıyor'
-                })
-    cnt = len(kronik_acik_detay)
-    puan = 10 if cnt >= 10 else 6 if cnt >= 5 else 3 if cnt >= 2 else 0
-    detaylar['kronik_acik'] = {
-        'puan': puan, 'max': 10,
-        'aciklama': f"{cnt} ürün 2+ sayımda açık" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': kronik_acik_detay
-    }
-    toplam_puan += puan
-    
-    # 4. AİLE ANALİZİ (5p) - TODO
-    detaylar['aile_analizi'] = {
-        'puan': 0, 'max': 5,
-        'aciklama': "Henüz aktif değil",
-        'detay': []
-    }
     
-    # 5. KRONİK FİRE (8p)
-    kronik_fire_detay = []
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi <= 1:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
-            fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
-            if fire_simdi < fire_onceki - 50:  # Daha fazla fire
-                kronik_fire_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Önceki': f"{fire_onceki:,.0f}",
-                    'Şimdi': f"{fire_simdi:,.0f}",
-                    'Durum': 'Fire artıyor'
-                })
-    cnt = len(kronik_fire_detay)
-    puan = 8 if cnt >= 8 else 5 if cnt >= 4 else 2 if cnt >= 2 else 0
-    detaylar['kronik_fire'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} ürün 2+ sayımda fire" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': kronik_fire_detay
-    }
-    toplam_puan += puan
-    
-    # 6. FİRE MANİPÜLASYONU (8p) - Fire var ama açık artıyor
-    fire_manip_detay = []
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi <= 1:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            fark_simdi = float(row.get('Fark Tutarı', 0) or 0)
-            fark_onceki = float(onceki.get('fark_tutari', 0) or 0)
-            fire_simdi = float(row.get('Fire Tutarı', 0) or 0)
-            fire_onceki = float(onceki.get('fire_tutari', 0) or 0)
-            fark_degisim = fark_simdi - fark_onceki
-            fire_degisim = fire_simdi - fire_onceki
-            # Açık arttı (daha negatif) ama fire yazmadı
-            if fark_degisim < -50 and fire_degisim > -10:
-                fire_manip_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Fark Değişim': f"{fark_degisim:,.0f}",
-                    'Fire Değişim': f"{fire_degisim:,.0f}",
-                    'Durum': '🚨 Fire yazmadan açık'
-                })
-    cnt = len(fire_manip_detay)
-    puan = 8 if cnt >= 5 else 5 if cnt >= 3 else 2 if cnt >= 1 else 0
-    detaylar['fire_manipulasyon'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} üründe fire↑ açık↓" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': fire_manip_detay
+    kod = _kolon(df, 'Malzeme Kodu', '').astype(str)
+    fark = _sayisal(df, 'Fark Tutarı')
+    fire = _sayisal(df, 'Fire Tutarı')
+    satis = _sayisal(df, 'Satış Hasılatı')
+    iptal = _sayisal(df, 'İptal Satır Tutarı')
+    miktar = _sayisal(df, 'Sayım Miktarı')
+    urun_adi = _kolon(df, 'Malzeme Tanımı', '').astype(str)
+    env = eslesme['_env_sayisi']
+    onceki_var = eslesme['_onceki_var'] & veri_var
+    
+    frame = pd.DataFrame({
+        '_magaza_kodu': _kolon(df, 'Mağaza Kodu', magaza_kodu),
+        '_magaza_adi': df[magaza_adi_col].astype(str) if magaza_adi_col else magaza_adi,
+        '_urun_adi': urun_adi,
+        '_fark': fark,
+        '_fire': fire,
+        '_iptal': iptal,
+        '_miktar': miktar,
+        '_env_sayisi': env,
+        '_onceki_fark': eslesme['_onceki_fark'],
+        '_onceki_fire': eslesme['_onceki_fire'],
+        '_onceki_sayim': eslesme['_onceki_sayim'],
+    }, index=df.index)
+    
+    # 1. Bölge sapma: (|fark| + |fire|) / satış oranı, ürünün bölge medyanının 1.5 katından fazla
+    medyan = _medyan_serisi(kod, urun_medianlar)
+    oran = (fark.abs() + fire.abs()) / satis.where(satis > 500) * 100
+    frame['_medyan'] = medyan
+    frame['_sapma_oran'] = oran
+    frame['_k_bolge_sapma'] = (medyan > 0) & (oran > medyan * 1.5)
+    
+    # 2. Satır iptali
+    frame['_k_satir_iptali'] = (iptal.abs() > 50) & ('İptal Satır Tutarı' in df.columns)
+    
+    # 3, 5, 6. Önceki sayıma göre açık / fire değişimi
+    fark_degisim = fark - frame['_onceki_fark']
+    fire_degisim = fire - frame['_onceki_fire']
+    frame['_k_kronik_acik'] = onceki_var & (fark_degisim < -50)  # Daha fazla açık
+    frame['_k_kronik_fire'] = onceki_var & (fire_degisim < -50)  # Daha fazla fire
+    frame['_k_fire_manipulasyon'] = onceki_var & (fark_degisim < -50) & (fire_degisim > -10)  # Fire yazmadan açık
+    
+    # 7. Sayılmayan ürün
+    frame['_k_sayilmayan_urun'] = (env < beklenen_sayim_sayisi()) & ('Envanter Sayisi' in df.columns)
+    
+    # 8. Anormal miktar (istisna ürünlerde eşik 200)
+    desen = '|'.join(re.escape(ist) for ist in ANORMAL_ISTISNALAR)
+    istisna = urun_adi.str.upper().str.contains(desen, regex=True)
+    frame['_anormal_esik'] = np.where(istisna, 200, 50)
+    frame['_k_anormal_miktar'] = miktar > frame['_anormal_esik']
+    
+    # 9. Tekrar miktar (önceki sayımla %3 içinde)
+    onceki_miktar = frame['_onceki_sayim']
+    frame['_k_tekrar_miktar'] = (onceki_var & (miktar > 0) & (onceki_miktar > 0) &
+                                 ((miktar - onceki_miktar).abs() / onceki_miktar <= 0.03))
+    
+    # 10. Yuvarlak sayı (5'in katları)
+    frame['_k_yuvarlak_sayi'] = (miktar >= 5) & (miktar % 5 == 0)
+    
+    frame.attrs['veri_var'] = veri_var
+    frame.attrs['medyan_var'] = _medyan_var(urun_medianlar)
+    frame.attrs['iptal_var'] = 'İptal Satır Tutarı' in df.columns
+    frame.attrs['magaza_kodu'] = magaza_kodu
+    frame.attrs['magaza_adi'] = magaza_adi
+    return frame
+
+def risk_detay(frame, kriter):
+    """
+    Kriterin detay satırları (list[dict]) - sadece maskeye giren satırlar biçimlendirilir
+    frame: hazirla_risk_frame sonucu (hesapla_risk_skoru(..., detay=False)['risk_frame'])
+    """
+    maske_kolonu = f'_k_{kriter}'
+    if maske_kolonu not in frame.columns:
+        return []
+    sub = frame[frame[maske_kolonu]]
+    if sub.empty:
+        return []
+    
+    kolonlar = {
+        'Mağaza Kodu': sub['_magaza_kodu'],
+        'Mağaza Adı': sub['_magaza_adi'],
+        'Ürün': sub['_urun_adi'].str[:30],
     }
-    toplam_puan += puan
+    if kriter == 'bolge_sapma':
+        kolonlar.update({
+            'Oran': _fmt(sub['_sapma_oran'], '%{:.1f}'),
+            'Median': _fmt(sub['_medyan'], '%{:.1f}'),
+            'Kat': _fmt(sub['_sapma_oran'] / sub['_medyan'], '{:.1f}x'),
+        })
+    elif kriter == 'satir_iptali':
+        kolonlar['İptal Tutarı'] = _fmt(sub['_iptal'].abs(), '{:,.0f} TL')
+    elif kriter == 'kronik_acik':
+        kolonlar.update({
+            'Önceki': _fmt(sub['_onceki_fark'], '{:,.0f}'),
+            'Şimdi': _fmt(sub['_fark'], '{:,.0f}'),
+            'Durum': 'Açık artıyor',
+        })
+    elif kriter == 'kronik_fire':
+        kolonlar.update({
+            'Önceki': _fmt(sub['_onceki_fire'], '{:,.0f}'),
+            'Şimdi': _fmt(sub['_fire'], '{:,.0f}'),
+            'Durum': 'Fire artıyor',
+        })
+    elif kriter == 'fire_manipulasyon':
+        kolonlar.update({
+            'Fark Değişim': _fmt(sub['_fark'] - sub['_onceki_fark'], '{:,.0f}'),
+            'Fire Değişim': _fmt(sub['_fire'] - sub['_onceki_fire'], '{:,.0f}'),
+            'Durum': '🚨 Fire yazmadan açık',
+        })
+    elif kriter == 'sayilmayan_urun':
+        beklenen = beklenen_sayim_sayisi()
+        kolonlar.update({
+            'Yapılan': sub['_env_sayisi'],
+            'Beklenen': beklenen,
+            'Durum': '⚠️ ' + (beklenen - sub['_env_sayisi']).astype(str) + ' eksik',
+        })
+    elif kriter == 'anormal_miktar':
+        kolonlar.update({
+            'Miktar': _fmt(sub['_miktar'], '{:.0f}'),
+            'Durum': '>' + sub['_anormal_esik'].astype(str) + ' kg/adet',
+        })
+    elif kriter == 'tekrar_miktar':
+        kolonlar.update({
+            'Önceki': _fmt(sub['_onceki_sayim'], '{:.1f}'),
+            'Şimdi': _fmt(sub['_miktar'], '{:.1f}'),
+            'Durum': 'Aynı miktar',
+        })
+    elif kriter == 'yuvarlak_sayi':
+        kolonlar.update({
+            'Miktar': _fmt(sub['_miktar'], '{:.0f}'),
+            'Durum': 'Yuvarlak sayı',
+        })
     
-    # 7. SAYILMAYAN ÜRÜN (8p) - Sayım atlama
-    sayim_detay = []
-    gun = datetime.now().day
-    beklenen_sayim = min((gun // 7) + 1, 4)
-    if 'Envanter Sayisi' in df.columns:
-        for _, row in df.iterrows():
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            if env_sayisi < beklenen_sayim:
-                sayim_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Yapılan': env_sayisi,
-                    'Beklenen': beklenen_sayim,
-                    'Durum': f"⚠️ {beklenen_sayim - env_sayisi} eksik"
-                })
-    cnt = len(sayim_detay)
-    puan = 8 if cnt >= 10 else 5 if cnt >= 5 else 2 if cnt >= 2 else 0
-    detaylar['sayilmayan_urun'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} üründe sayım eksik (beklenen: {beklenen_sayim})",
-        'detay': sayim_detay
-    }
-    toplam_puan += puan
+    return pd.DataFrame(kolonlar, index=sub.index).to_dict('records')
+
+def _risk_aciklama(kriter, deger, frame):
+    """Kriter açıklama metni"""
+    veri_var = frame.attrs.get('veri_var', False)
+    if kriter == 'bolge_sapma':
+        return f"{deger} ürün median üstü" if frame.attrs.get('medyan_var') else "Bölge verisi gerekli"
+    if kriter == 'satir_iptali':
+        return f"{deger:,.0f} TL iptal"
+    if kriter == 'aile_analizi':
+        return "Henüz aktif değil"
+    if kriter in ('kronik_acik', 'kronik_fire', 'fire_manipulasyon', 'tekrar_miktar') and not veri_var:
+        return "⏳ Önceki veri bekleniyor"
+    if kriter == 'kronik_acik':
+        return f"{deger} ürün 2+ sayımda açık"
+    if kriter == 'kronik_fire':
+        return f"{deger} ürün 2+ sayımda fire"
+    if kriter == 'fire_manipulasyon':
+        return f"{deger} üründe fire↑ açık↓"
+    if kriter == 'sayilmayan_urun':
+        return f"{deger} üründe sayım eksik (beklenen: {beklenen_sayim_sayisi()})"
+    if kriter == 'anormal_miktar':
+        return f"{deger} üründe >50 kg/adet"
+    if kriter == 'tekrar_miktar':
+        return f"{deger} ürün aynı miktar"
+    if kriter == 'yuvarlak_sayi':
+        return f"{deger} ürün (%{deger / max(len(frame), 1) * 100:.0f}) yuvarlak"
+    return ''
+
+def hesapla_risk_skoru(df, df_onceki=None, urun_medianlar=None, detay=True):
+    """
+    Sürekli envanter risk skorunu hesaplar - Toplam 97 puan
+    ESKİ KRİTERLER ile
     
-    # 8. ANORMAL MİKTAR (10p)
-    anormal_detay = []
-    istisnalar = ['PATATES', 'SOĞAN', 'SOGAN', 'KARPUZ', 'KAVUN']
-    for _, row in df.iterrows():
-        miktar = row.get('Sayım Miktarı', 0)
-        if pd.isna(miktar):
-            continue
-        urun_adi = str(row.get('Malzeme Tanımı', '')).upper()
-        esik = 200 if any(ist in urun_adi for ist in istisnalar) else 50
-        if miktar > esik:
-            anormal_detay.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                'Mağaza Adı': get_row_magaza_adi(row),
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Miktar': f"{miktar:.0f}",
-                'Durum': f'>{esik} kg/adet'
-            })
-    cnt = len(anormal_detay)
-    puan = 10 if cnt >= 5 else 6 if cnt >= 3 else 3 if cnt >= 1 else 0
-    detaylar['anormal_miktar'] = {
-        'puan': puan, 'max': 10,
-        'aciklama': f"{cnt} üründe >50 kg/adet",
-        'detay': anormal_detay
-    }
-    toplam_puan += puan
-    
-    # 9. TEKRAR MİKTAR (8p)
-    tekrar_detay = []
-    if veri_var:
-        for _, row in df.iterrows():
-            malzeme_kodu = str(row.get('Malzeme Kodu', ''))
-            env_sayisi = int(row.get('Envanter Sayisi', 1) or 1)
-            miktar = row.get('Sayım Miktarı', 0)
-            if env_sayisi <= 1 or pd.isna(miktar) or miktar <= 0:
-                continue
-            onceki = df_onceki[
-                (df_onceki['malzeme_kodu'].astype(str) == malzeme_kodu) & 
-                (df_onceki['envanter_sayisi'] == env_sayisi - 1)
-            ]
-            if onceki.empty:
-                continue
-            onceki = onceki.iloc[0]
-            onceki_miktar = float(onceki.get('sayim_miktari', 0) or 0)
-            if onceki_miktar > 0 and abs(miktar - onceki_miktar) / onceki_miktar <= 0.03:
-                tekrar_detay.append({
-                    'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                    'Mağaza Adı': get_row_magaza_adi(row),
-                    'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                    'Önceki': f"{onceki_miktar:.1f}",
-                    'Şimdi': f"{miktar:.1f}",
-                    'Durum': 'Aynı miktar'
-                })
-    cnt = len(tekrar_detay)
-    puan = 8 if cnt >= 10 else 5 if cnt >= 5 else 2 if cnt >= 2 else 0
-    detaylar['tekrar_miktar'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} ürün aynı miktar" if veri_var else "⏳ Önceki veri bekleniyor",
-        'detay': tekrar_detay
-    }
-    toplam_puan += puan
+    Tüm kriterler tek hazırlanmış frame üzerinde maske olarak hesaplanır.
+    urun_medianlar: get_urun_medianlari(envanter_donemi) tablosu (veya {kod: {'median': ...}} dict)
+    detay=False: detay listeleri boş döner, sadece puanlar hesaplanır;
+    gerektiğinde risk_detay(sonuc['risk_frame'], kriter) ile üretilir.
+    """
+    frame = hazirla_risk_frame(df, df_onceki, urun_medianlar)
     
-    # 10. YUVARLAK SAYI (8p)
-    yuvarlak_detay = []
-    for _, row in df.iterrows():
-        miktar = row.get('Sayım Miktarı', 0)
-        if pd.isna(miktar) or miktar == 0:
-            continue
-        if miktar > 0 and miktar % 5 == 0 and miktar >= 5:
-            yuvarlak_detay.append({
-                'Mağaza Kodu': row.get('Mağaza Kodu', magaza_kodu),
-                'Mağaza Adı': get_row_magaza_adi(row),
-                'Ürün': str(row.get('Malzeme Tanımı', ''))[:30],
-                'Miktar': f"{miktar:.0f}",
-                'Durum': 'Yuvarlak sayı'
-            })
-    cnt = len(yuvarlak_detay)
-    yuvarlak_oran = cnt / max(len(df), 1)
-    puan = 8 if yuvarlak_oran > 0.35 else 5 if yuvarlak_oran > 0.20 else 2 if yuvarlak_oran > 0.10 else 0
-    detaylar['yuvarlak_sayi'] = {
-        'puan': puan, 'max': 8,
-        'aciklama': f"{cnt} ürün (%{yuvarlak_oran*100:.0f}) yuvarlak",
-        'detay': yuvarlak_detay
-    }
-    toplam_puan += puan
+    detaylar = {}
+    toplam_puan = 0
+    for kriter, (max_puan, _, _) in RISK_PUAN_TABLOSU.items():
+        if kriter == 'aile_analizi':
+            deger = 0  # TODO
+        elif kriter == 'satir_iptali':
+            deger = abs(frame['_iptal'].sum()) if frame.attrs['iptal_var'] else 0
+        else:
+            deger = int(frame[f'_k_{kriter}'].sum())
+    
+        # Yuvarlak sayı oran üzerinden puanlanır
+        puan = risk_puani(deger / max(len(frame), 1) if kriter == 'yuvarlak_sayi' else deger, kriter)
+        detaylar[kriter] = {
+            'puan': puan, 'max': max_puan,
+            'aciklama': _risk_aciklama(kriter, deger, frame),
+            'detay': risk_detay(frame, kriter) if detay else []
+        }
+        toplam_puan += puan
     
-    # Seviye belirleme
-    if toplam_puan <= 25:
-        seviye, emoji = 'normal', '✅'
-    elif toplam_puan <= 50:
-        seviye, emoji = 'dikkat', '⚠️'
-    elif toplam_puan <= 75:
-        seviye, emoji = 'riskli', '🟠'
-    else:
-        seviye, emoji = 'kritik', '🔴'
+    seviye, emoji = risk_seviyesi(toplam_puan)
     
-    return {
+    sonuc = {
         'toplam_puan': toplam_puan,
         'max_puan': 97,
         'seviye': seviye,
         'emoji': emoji,
         'detaylar': detaylar,
-        'magaza_kodu': magaza_kodu,
-        'magaza_adi': magaza_adi
+        'magaza_kodu': frame.attrs['magaza_kodu'],
+        'magaza_adi': frame.attrs['magaza_adi']
     }
+    if not detay:
+        sonuc['risk_frame'] = frame
+    return sonuc
+
+def hesapla_bolge_risk_skorlari(df, df_onceki=None, urun_medianlar=None):
+    """
+    Çok mağazalı frame için risk skorları - tüm mağazalar tek çağrıda
+    Kriter sayıları mağaza bazında groupby ile, puanlar eşik tablolarından vektörel hesaplanır.
+    df_onceki: bölgedeki mağazaların önceki kayıtları (magaza_kodu kolonu ile)
+    
+    Dönüş: mağaza × kriter puan matrisi
+        Mağaza Kodu, Mağaza Adı, SM, BS, <kriter puanları>, Toplam, Seviye, Emoji
+        (Toplam'a göre azalan sıralı)
+    """
+    kolonlar = ['Mağaza Kodu', 'Mağaza Adı', 'SM', 'BS'] + list(RISK_PUAN_TABLOSU) + ['Toplam', 'Seviye', 'Emoji']
+    if df is None or len(df) == 0:
+        return pd.DataFrame(columns=kolonlar)
+    
+    frame = hazirla_risk_frame(df, df_onceki, urun_medianlar)
+    gruplar = frame.groupby('_magaza_kodu', sort=False, observed=True)
+    
+    maske_kolonlari = [f'_k_{k}' for k in RISK_MASKE_KRITERLERI]
+    sayilar = gruplar[maske_kolonlari].sum()
+    sayilar.columns = RISK_MASKE_KRITERLERI
+    satir_sayisi = gruplar.size()
+    iptal_tutar = gruplar['_iptal'].sum().abs() if frame.attrs['iptal_var'] else pd.Series(0.0, index=sayilar.index)
+    
+    sonuc = pd.DataFrame({
+        'Mağaza Kodu': sayilar.index,
+        'Mağaza Adı': gruplar['_magaza_adi'].first().to_numpy(),
+    }, index=sayilar.index)
+    sonuc['SM'] = sonuc['Mağaza Kodu'].map(lambda x: get_magaza_bilgi(x)['sm'])
+    sonuc['BS'] = sonuc['Mağaza Kodu'].map(lambda x: get_magaza_bilgi(x)['bs'])
+    
+    for kriter in RISK_PUAN_TABLOSU:
+        if kriter == 'aile_analizi':
+            deger = np.zeros(len(sayilar))  # TODO
+        elif kriter == 'satir_iptali':
+            deger = iptal_tutar
+        elif kriter == 'yuvarlak_sayi':
+            deger = sayilar[kriter] / satir_sayisi.clip(lower=1)
+        else:
+            deger = sayilar[kriter]
+        sonuc[kriter] = risk_puani(deger, kriter)
+    
+    sonuc['Toplam'] = sonuc[list(RISK_PUAN_TABLOSU)].sum(axis=1)
+    seviye = sonuc['Toplam'].map(risk_seviyesi)
+    sonuc['Seviye'] = seviye.str[0]
+    sonuc['Emoji'] = seviye.str[1]
+    
+    return sonuc[kolonlar].sort_values('Toplam', ascending=False, kind='stable').reset_index(drop=True)
+
+# Bölge risk matrisi Supabase'den: detay kolonları → yükleme dosyası kolon adları
+BOLGE_DETAY_KOLONLARI = {
+    'magaza_kodu': 'Mağaza Kodu',
+    'magaza_adi': 'Mağaza Adı',
+    'malzeme_kodu': 'Malzeme Kodu',
+    'malzeme_tanimi': 'Malzeme Tanımı',
+    'envanter_sayisi': 'Envanter Sayisi',
+    'fark_tutari': 'Fark Tutarı',
+    'fire_tutari': 'Fire Tutarı',
+    'iptal_satir_tutari': 'İptal Satır Tutarı',
+    'sayim_miktari': 'Sayım Miktarı',
+    'satis_hasilati': 'Satış Hasılatı',
+}
+
+def get_bolge_surekli_verisi(supabase_client, envanter_donemi):
+    """
+    Dönemin bölge risk girdisi (hesapla_bolge_risk_skorlari için)
+    Dönüş: (df, df_onceki)
+        df: her mağaza-ürünün son sayımı, yükleme dosyası kolon adlarıyla
+        df_onceki: dönemin tüm detay kayıtları (önceki sayım eşleşmesi için)
+    """
+    df_onceki = fetch_surekli_detay(supabase_client, envanter_donemi, ','.join(BOLGE_DETAY_KOLONLARI))
+    if len(df_onceki) == 0:
+        return pd.DataFrame(columns=list(BOLGE_DETAY_KOLONLARI.values())), df_onceki
+    
+    df_onceki['envanter_sayisi'] = pd.to_numeric(df_onceki['envanter_sayisi'], errors='coerce')
+    son = df_onceki.sort_values('envanter_sayisi', kind='stable')
+    son = son.drop_duplicates(subset=['magaza_kodu', 'malzeme_kodu'], keep='last')
+    return son.rename(columns=BOLGE_DETAY_KOLONLARI).reset_index(drop=True), df_onceki
 
 # ==================== ÖZET FONKSİYONLARI ====================
 
 def hesapla_kategori_ozet(df):
     """Kategori bazlı özet hesapla"""
-    ozet = {}
+    kategori = detect_kategori_kolon(df)
+    secili = kategori != 'Diğer'
+    if not secili.any():
+        return {}
     
-    for _, row in df.iterrows():
-        kategori = detect_kategori(row)
-        if kategori == 'Diğer':
-            continue
-        
-        if kategori not in ozet:
-            ozet[kategori] = {'fark': 0, 'fire': 0, 'satis': 0, 'urun_sayisi': 0}
-        
-        ozet[kategori]['fark'] += float(row.get('Fark Tutarı', 0) or 0)
-        ozet[kategori]['fire'] += float(row.get('Fire Tutarı', 0) or 0)
-        ozet[kategori]['satis'] += float(row.get('Satış Hasılatı', 0) or 0)
-        ozet[kategori]['urun_sayisi'] += 1
+    toplam = pd.DataFrame({
+        'fark': _sayisal(df, 'Fark Tutarı'),
+        'fire': _sayisal(df, 'Fire Tutarı'),
+        'satis': _sayisal(df, 'Satış Hasılatı'),
+    })[secili].groupby(kategori[secili], sort=False).agg(['sum', 'size'])
+    
+    ozet = {}
+    for kat, row in toplam.iterrows():
+        ozet[kat] = {
+            'fark': float(row[('fark', 'sum')]),
+            'fire': float(row[('fire', 'sum')]),
+            'satis': float(row[('satis', 'sum')]),
+            'urun_sayisi': int(row[('fark', 'size')])
+        }
     
     # Oran hesapla
     for kat in ozet:
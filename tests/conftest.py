@@ -0,0 +1,5 @@
+# Testler repo kökünden import eder (analysis, database, utils ...)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,153 @@
+# ==================== BATCH UPLOADER TESTS ====================
+# Ağsız stub insert fonksiyonları ile: retry, belirsiz hata, hatalı batch bölme, kalıcı hatada durma
+
+import importlib.util
+import os
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# database/__init__ Streamlit secrets ile Supabase client açar; modülü dosyadan yükle
+_spec = importlib.util.spec_from_file_location('batch_uploader', os.path.join(ROOT, 'database', 'batch_uploader.py'))
+batch_uploader = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(batch_uploader)
+
+
+class HttpHata(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class PgHata(Exception):
+    """PostgREST APIError benzeri: code = SQLSTATE / PGRST kodu"""
+    
+    def __init__(self, code):
+        super().__init__(f"postgres {code}")
+        self.code = code
+
+
+class StubTablo:
+    """Satırları biriktiren insert stub'ı; hatalar sırayla / koşula göre fırlatılır"""
+    
+    def __init__(self, hatalar=None, yazdiktan_sonra=None):
+        self.rows = []
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.hatalar = list(hatalar or [])
+        self.yazdiktan_sonra = yazdiktan_sonra
+    
+    def insert(self, batch):
+        with self.lock:
+            self.calls += 1
+            if self.hatalar:
+                raise self.hatalar.pop(0)
+            if any(r['malzeme_kodu'] == 'HATALI' for r in batch):
+                raise HttpHata(400)
+            self.rows.extend(batch)
+            if self.yazdiktan_sonra:
+                hata, self.yazdiktan_sonra = self.yazdiktan_sonra, None
+                raise hata
+
+
+def _batches(n, batch_size=10, hatali=()):
+    rows = [{'malzeme_kodu': 'HATALI' if i in hatali else str(i)} for i in range(n)]
+    return [rows[i:i + batch_size] for i in range(0, n, batch_size)]
+
+
+def _upload(tablo, batches, **kwargs):
+    return batch_uploader.upload_batches(tablo.insert, batches, concurrency=2, backoff=0, **kwargs)
+
+
+def test_hatali_satir_bolunerek_izole_edilir():
+    tablo = StubTablo()
+    sonuc = _upload(tablo, _batches(100, hatali={13, 57}))
+    
+    assert sonuc['inserted'] == 98
+    assert [r['malzeme_kodu'] for r in sonuc['failed_rows']] == ['HATALI', 'HATALI']
+    assert sonuc['ambiguous'] == 0
+    assert len(tablo.rows) == 98
+
+
+def test_guvenli_gecici_hata_tekrar_denenir():
+    tablo = StubTablo(hatalar=[HttpHata(503), HttpHata(429)])
+    sonuc = _upload(tablo, _batches(10))
+    
+    assert sonuc['inserted'] == 10
+    assert sonuc['retried'] == 20
+    assert len(tablo.rows) == 10
+
+
+def test_belirsiz_timeout_tekrar_gonderilmez():
+    # Sunucu yazdı ama cevap zaman aşımına uğradı
+    tablo = StubTablo(yazdiktan_sonra=TimeoutError('read timed out'))
+    sonuc = _upload(tablo, _batches(10))
+    
+    assert tablo.calls == 1
+    assert len(tablo.rows) == 10  # çift kayıt yok
+    assert sonuc['inserted'] == 0
+    assert sonuc['failed'] == sonuc['ambiguous'] == 10
+
+
+@pytest.mark.parametrize('status', [500, 502, 504])
+def test_belirsiz_5xx_bolunmez(status):
+    tablo = StubTablo(yazdiktan_sonra=HttpHata(status))
+    sonuc = _upload(tablo, _batches(10))
+    
+    assert tablo.calls == 1
+    assert len(tablo.rows) == 10
+    assert sonuc['ambiguous'] == 10
+
+
+def test_idempotent_insert_belirsiz_hatada_tekrar_dener():
+    tablo = StubTablo(hatalar=[TimeoutError('read timed out')])
+    sonuc = _upload(tablo, _batches(10), idempotent=True)
+    
+    assert sonuc['inserted'] == 10
+    assert sonuc['ambiguous'] == 0
+
+
+@pytest.mark.parametrize('hata', [HttpHata(401), HttpHata(403), HttpHata(404), PgHata('42P01')])
+def test_kalici_hata_parca_basina_tek_istek(hata):
+    # Yetki / tablo hatası satıra bağlı değil: bölünmez, yükleme durur
+    tablo = StubTablo(hatalar=[hata] * 100)
+    sonuc = _upload(tablo, _batches(100))
+    
+    gonderilen = [b for b in sonuc['batches'] if b['attempts'] > 0]
+    assert all(b['attempts'] == 1 for b in gonderilen)
+    assert tablo.calls == len(gonderilen) <= 2
+    assert sonuc['inserted'] == 0
+    assert sonuc['failed'] == len(sonuc['failed_rows']) == 100
+    assert sonuc['skipped'] == 100 - 10 * tablo.calls
+    assert sonuc['aborted'] == str(hata)
+
+
+def test_kalici_hata_sonrasi_batch_gonderilmez():
+    tablo = StubTablo(hatalar=[HttpHata(401)])
+    sonuc = batch_uploader.upload_batches(tablo.insert, _batches(100), concurrency=1, backoff=0)
+    
+    assert tablo.calls == 1
+    assert sonuc['skipped'] == 90
+    assert len(tablo.rows) == 0
+
+
+@pytest.mark.parametrize('hata, tur', [
+    (HttpHata(503), 'retry'),
+    (ConnectionRefusedError('connection refused'), 'retry'),
+    (HttpHata(504), 'ambiguous'),
+    (TimeoutError('timed out'), 'ambiguous'),
+    (ConnectionResetError('reset by peer'), 'ambiguous'),
+    (HttpHata(400), 'data'),
+    (HttpHata(409), 'data'),
+    (PgHata('23505'), 'data'),
+    (PgHata('22P02'), 'data'),
+    (ValueError('invalid input syntax'), 'data'),
+    (HttpHata(401), 'fatal'),
+    (HttpHata(404), 'fatal'),
+    (PgHata('42P01'), 'fatal'),
+    (PgHata('PGRST204'), 'fatal'),
+])
+def test_hata_siniflandirma(hata, tur):
+    assert batch_uploader.classify_error(hata) == tur
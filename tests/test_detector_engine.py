@@ -0,0 +1,126 @@
+# ==================== DETECTOR ENGINE TESTS ====================
+
+import pandas as pd
+
+from analysis import (analyze_inventory, run_detectors, create_top_20_risky, generate_executive_summary, prepare_detection_frame, code_text, detect_internal_theft,
+                      detect_chronic_products, detect_chronic_fire, detect_cigarette_shortage,
+                      find_product_families, detect_fire_manipulation, detect_external_theft,
+                      check_kasa_activity_products)
+
+
+def _ham_magaza():
+    # Her satır bir dedektöre düşer: iç hırsızlık, kronik, kronik fire, sigara, fire manip., dış hırs., kasa, aile
+    satirlar = [
+        ('1001', 'KULAKLIK BT X', 'ELEKTRONIK', 250.0, -3, 0, 0, 0, 0, 3),
+        ('1002', 'PEYNIR BEYAZ 500G SUTAS', 'SUT URUNLERI', 90.0, -2, 0, -4, 0, 0, 0),
+        ('1003', 'DOMATES KG', 'MEYVE SEBZE', 20.0, -1, 0, 0, -5, -3, 0),
+        ('1004', 'SIGARA MARKA A', 'SIGARA', 60.0, -4, 0, 0, 0, 0, 0),
+        ('1005', 'EKMEK TAM 350G', 'FIRIN', 10.0, 2, 1, 0, -2, 0, 0),
+        ('1006', 'SAMPUAN 400ML ELIDOR', 'KOZMETIK', 80.0, -5, 0, 0, 0, 0, 0),
+        ('12002256', 'SAKIZ 10TL', 'SEKERLEME', 10.0, -2, 0, 0, 0, 0, 0),
+        ('1008', 'PEYNIR BEYAZ 450G SUTAS', 'SUT URUNLERI', 90.0, 1, 0, 0, 0, 0, 0),
+    ]
+    kolonlar = ['Malzeme Kodu', 'Malzeme Tanımı', 'Mal Grubu Tanımı', 'Satış Fiyatı', 'Fark Miktarı',
+                'Kısmi Envanter Miktarı', 'Önceki Fark Miktarı', 'Fire Miktarı', 'Önceki Fire Miktarı',
+                'İptal Satır Miktarı']
+    df = pd.DataFrame(satirlar, columns=kolonlar)
+    df['Fark Tutarı'] = df['Fark Miktarı'] * df['Satış Fiyatı']
+    df['Fire Tutarı'] = df['Fire Miktarı'] * df['Satış Fiyatı']
+    df['Önceki Fark Tutarı'] = df['Önceki Fark Miktarı'] * df['Satış Fiyatı']
+    df['Önceki Fire Tutarı'] = df['Önceki Fire Miktarı'] * df['Satış Fiyatı']
+    df['Kısmi Envanter Tutarı'] = 0.0
+    df['Mağaza Kodu'] = '5001'
+    return df
+
+
+def _magaza():
+    return analyze_inventory(_ham_magaza())
+
+
+def test_wrappers_match_single_engine_pass():
+    df = _magaza()
+    kasa_kodlari = {'12002256'}
+    sonuc = run_detectors(df, kasa_kodlari)
+    
+    tekil = {
+        'ic_hirsizlik': detect_internal_theft(df),
+        'kronik': detect_chronic_products(df),
+        'kronik_fire': detect_chronic_fire(df),
+        'sigara': detect_cigarette_shortage(df),
+        'aile': find_product_families(prepare_detection_frame(df)),
+        'fire_manipulasyon': detect_fire_manipulation(df),
+        'dis_hirsizlik': detect_external_theft(df),
+    }
+    for ad, beklenen in tekil.items():
+        assert len(sonuc[ad]) > 0, ad
+        pd.testing.assert_frame_equal(sonuc[ad], beklenen, obj=ad)
+    
+    kasa_df, kasa_ozet = check_kasa_activity_products(df, kasa_kodlari)
+    pd.testing.assert_frame_equal(sonuc['kasa'], kasa_df)
+    assert sonuc['kasa_ozet'] == kasa_ozet
+    assert sonuc['ozet']['kasa_sorunlu'] == 1
+    assert sonuc['ozet']['sigara'] == 1
+
+
+def _duz(tablo):
+    # compact: category → object, float32 → float64 (değerler aynı olmalı)
+    tablo = tablo.copy()
+    for col in tablo.columns:
+        if isinstance(tablo[col].dtype, pd.CategoricalDtype):
+            tablo[col] = tablo[col].astype(object)
+        elif tablo[col].dtype == 'float32':
+            tablo[col] = tablo[col].astype('float64')
+    return tablo
+
+
+def test_compact_frame_gives_same_findings():
+    tam = run_detectors(analyze_inventory(_ham_magaza()), {'12002256'})
+    compact_df = analyze_inventory(_ham_magaza(), compact=True)
+    compact = run_detectors(compact_df, {'12002256'})
+    
+    assert compact_df.attrs['bellek']['oran'] > 1
+    assert compact['ozet'] == tam['ozet']
+    assert compact['kasa_ozet'] == tam['kasa_ozet']
+    for ad in ['ic_hirsizlik', 'kronik', 'kronik_fire', 'sigara', 'aile', 'fire_manipulasyon',
+               'dis_hirsizlik', 'kasa']:
+        pd.testing.assert_frame_equal(_duz(compact[ad]), _duz(tam[ad]), check_dtype=False, obj=ad)
+    
+    # Excel raporunun diğer girdileri de aynı
+    sonuclar = []
+    for df, t in [(analyze_inventory(_ham_magaza()), tam), (compact_df, compact)]:
+        kodlar = [set(t[ad]['Malzeme Kodu'].astype(str)) for ad in ['ic_hirsizlik', 'kronik']]
+        yorumlar, grup = generate_executive_summary(df, t['kasa'], t['kasa_ozet'])
+        sonuclar.append((create_top_20_risky(df, kodlar[0], kodlar[1], set()), yorumlar, grup))
+    pd.testing.assert_frame_equal(_duz(sonuclar[1][0]), _duz(sonuclar[0][0]), check_dtype=False)
+    assert sonuclar[1][1] == sonuclar[0][1]
+    pd.testing.assert_frame_equal(_duz(sonuclar[1][2]), _duz(sonuclar[0][2]), check_dtype=False)
+
+
+def test_prepared_frame_rebuilds_kasa_for_new_codes():
+    p = prepare_detection_frame(_magaza(), {'12002256'})
+    assert p['_kasa'].sum() == 1
+    
+    p2 = prepare_detection_frame(p, {'1001', '1002'})
+    assert p2['_kasa'].sum() == 2
+    assert p['_kasa'].sum() == 1
+    
+    kasa_df, _ = check_kasa_activity_products(p, {'1004'})
+    assert kasa_df['Malzeme Kodu'].tolist() == ['1004']
+
+
+def test_kasa_kodu_orijinal_metinle_gosterilir():
+    df = _magaza()
+    df['Malzeme Kodu'] = ['ABC-1', '1002', '1003', '1004', '1005', '1006', '012002256', '1008']
+    p = prepare_detection_frame(df)
+    
+    assert p['_kod'].tolist()[::6] == ['ABC-1', '012002256']
+    assert p['_kod_no'].tolist()[::6] == [-1, 12002256]
+    
+    kasa_df, _ = check_kasa_activity_products(df, {'12002256'})
+    assert kasa_df['Malzeme Kodu'].tolist() == ['012002256']
+
+
+def test_code_text_float_ve_category():
+    assert code_text(pd.Series([12002256.0, 5.0])).tolist() == ['12002256', '5']
+    kodlar = pd.Series(['0012', 'X1', '0012']).astype('category')
+    assert code_text(kodlar).tolist() == ['0012', 'X1', '0012']
@@ -0,0 +1,39 @@
+# ==================== FAMILY ANALYSIS TESTS ====================
+
+import numpy as np
+import pandas as pd
+
+from analysis.family_analysis import find_product_families
+from benchmarks.bench_family_analysis import legacy_find_product_families, make_store
+
+
+def _store(adlar, fark):
+    n = len(adlar)
+    return pd.DataFrame({
+        'Malzeme Kodu': [str(10000000 + i) for i in range(n)],
+        'Malzeme Adı': adlar,
+        'Ürün Grubu': 'TEMEL GIDA',
+        'Fark Miktarı': np.asarray(fark, dtype=float),
+        'Kısmi Envanter Miktarı': 0.0,
+        'Önceki Fark Miktarı': 0.0,
+    })
+
+
+def test_gramajsiz_urunler_aile_olmaz():
+    df = _store(['PIRINC SUT ETI', 'PIRINC SUT KAKAOLU ETI', 'PIRINC SUT SADE ETI'], [-3, 2, 1])
+    assert find_product_families(df).empty
+
+
+def test_gramajsiz_urun_gramajli_aileye_girmez():
+    df = _store(['PIRINC SUT 250G ETI', 'PIRINC SUT 400G ETI', 'PIRINC SUT ETI'], [-3, 2, 5])
+    result = find_product_families(df)
+    
+    assert len(result) == 1
+    assert result.iloc[0]['Ürün Sayısı'] == 2
+    assert result.iloc[0]['Toplam Fark'] == -1
+
+
+def test_eski_algoritma_ile_ayni():
+    df = make_store(1000)
+    pd.testing.assert_frame_equal(legacy_find_product_families(df).reset_index(drop=True),
+                                  find_product_families(df).reset_index(drop=True))
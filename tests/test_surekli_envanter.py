@@ -0,0 +1,284 @@
+# ==================== SÜREKLİ ENVANTER TESTS ====================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import surekli_envanter_module as sem
+from benchmarks.bench_surekli_risk import legacy_hesapla_risk_skoru
+
+
+def _sayim(**kolonlar):
+    df = pd.DataFrame({
+        'Mağaza Kodu': ['5001', '5001'],
+        'Mağaza Adı': ['TEST', 'TEST'],
+        'Malzeme Kodu': ['100001', '100002'],
+        'Malzeme Tanımı': ['PILIC BUT', 'EKMEK'],
+        'Envanter Dönemi': ['202610', '202610'],
+        'Envanter Sayisi': [1, 1],
+        'Fark Tutarı': [-120.5, 40.0],
+        'Fire Tutarı': [-10.0, 0.0],
+        'Satış Hasılatı': [1500.0, 900.0],
+    })
+    for col, values in kolonlar.items():
+        df[col] = values
+    return df
+
+
+def test_detay_kayitlari_bos_deger_null():
+    kayitlar = sem.prepare_detay_kayitlar(_sayim(**{'Fark Tutarı': [np.nan, 40.0]}))
+    
+    assert kayitlar[0]['fark_tutari'] is None
+    assert kayitlar[1]['fark_tutari'] == 40.0
+    # Kolon yoksa 0
+    assert kayitlar[0]['sayim_miktari'] == 0.0
+    assert kayitlar[0]['kategori'] == 'Et-Tavuk'
+
+
+class StubSupabase:
+    """surekli_envanter_detay / surekli_urun_medyan için minimal upsert / insert / delete / sayfalı select stub'ı"""
+    
+    ANAHTAR = {
+        'surekli_envanter_detay': ('magaza_kodu', 'malzeme_kodu', 'envanter_donemi', 'envanter_sayisi'),
+        sem.MEDYAN_TABLO: ('envanter_donemi', 'malzeme_kodu'),
+    }
+    
+    def __init__(self):
+        self.tablolar = {ad: {} for ad in self.ANAHTAR}
+        self.rows = self.tablolar['surekli_envanter_detay']
+    
+    def table(self, name):
+        return StubSorgu(self, name)
+
+
+class StubSorgu:
+    ANAHTAR = StubSupabase.ANAHTAR['surekli_envanter_detay']
+    
+    def __init__(self, db, name):
+        self.rows = db.tablolar[name]
+        self.anahtar = StubSupabase.ANAHTAR[name]
+        self.filtre = {}
+        self.kolonlar = None
+        self.aralik = None
+        self.yazilacak = None
+        self.sil = False
+    
+    def upsert(self, records, on_conflict=None):
+        self.yazilacak = records if isinstance(records, list) else [records]
+        return self
+    
+    insert = upsert
+    
+    def delete(self):
+        self.sil = True
+        return self
+    
+    def select(self, columns):
+        self.kolonlar = None if columns == '*' else columns.split(',')
+        return self
+    
+    def eq(self, col, value):
+        self.filtre[col] = lambda v, value=value: v == value
+        return self
+    
+    def in_(self, col, values):
+        self.filtre[col] = lambda v, values=set(values): v in values
+        return self
+    
+    def order(self, col):
+        return self
+    
+    def range(self, lo, hi):
+        self.aralik = (lo, hi)
+        return self
+    
+    def execute(self):
+        if self.yazilacak is not None:
+            for r in self.yazilacak:
+                self.rows[tuple(r[k] for k in self.anahtar)] = dict(r)
+            return type('Sonuc', (), {'data': self.yazilacak})
+        
+        secili = [k for k, r in sorted(self.rows.items())
+                  if all(kosul(r[c]) for c, kosul in self.filtre.items())]
+        if self.sil:
+            for k in secili:
+                del self.rows[k]
+            return type('Sonuc', (), {'data': []})
+        
+        lo, hi = self.aralik
+        satirlar = [self.rows[k] for k in secili[lo:hi + 1]]
+        return type('Sonuc', (), {'data': [{k: r[k] for k in (self.kolonlar or r)} for r in satirlar]})
+
+
+def _magaza_kayitlari(magaza_kodu, oran_carpani):
+    df = pd.DataFrame({
+        'Mağaza Kodu': magaza_kodu,
+        'Mağaza Adı': 'TEST',
+        'Malzeme Kodu': [str(100000 + i) for i in range(20)],
+        'Malzeme Tanımı': 'PILIC BUT',
+        'Envanter Dönemi': '202610',
+        'Envanter Sayisi': 1,
+        'Fark Tutarı': -10.0 * oran_carpani,
+        'Fire Tutarı': 0.0,
+        'Satış Hasılatı': 1000.0,
+    })
+    return sem.prepare_detay_kayitlar(df)
+
+
+@pytest.fixture
+def medyan_dir(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(sem, 'MEDYAN_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_medyan_donemin_ilk_yuklemesi_tum_magazalari_kapsar(medyan_dir):
+    client = StubSupabase()
+    # Medyan tablosu oluşmadan önce yüklenmiş mağazalar
+    for i, magaza in enumerate(['5001', '5002', '5003']):
+        for r in _magaza_kayitlari(magaza, i + 1):
+            client.rows[tuple(r[k] for k in StubSorgu.ANAHTAR)] = r
+    
+    # Dönemin ilk yüklemesi (kayıtlı oran tablosu yok)
+    sem.save_detay_to_supabase(client, _magaza_kayitlari('5004', 4))
+    tablo = sem.get_urun_medianlari('202610', client)
+    
+    assert len(tablo) == 20
+    assert (tablo['magaza_sayisi'] == 4).all()
+    assert np.allclose(tablo['median'], 2.5)  # oranlar %1, %2, %3, %4
+    
+    # Sonraki yükleme artımlı: aynı mağazanın yeni sayımı eskisinin yerine geçer
+    kayitlar = _magaza_kayitlari('5004', 8)
+    for r in kayitlar:
+        r['envanter_sayisi'] = 2
+    sem.save_detay_to_supabase(client, kayitlar)
+    tablo = sem.get_urun_medianlari('202610', client)
+    
+    assert (tablo['magaza_sayisi'] == 4).all()
+    assert np.allclose(tablo['median'], 2.5)  # %1, %2, %3, %8
+    assert tablo.equals(sem.yenile_urun_medianlari(client, '202610'))
+    assert len(client.tablolar[sem.MEDYAN_TABLO]) == 20
+
+
+def test_medyan_tablosu_supabasede_paylasilir(monkeypatch):
+    # Oran klasörü olmayan sunucu: her yükleme dönemi baştan hesaplar, medyanı Supabase'den okur
+    monkeypatch.setattr(sem, 'MEDYAN_DIR', None)
+    client = StubSupabase()
+    for i, magaza in enumerate(['5001', '5002', '5003']):
+        sem.save_detay_to_supabase(client, _magaza_kayitlari(magaza, i + 1))
+    
+    tablo = sem.get_urun_medianlari('202610', client)
+    assert np.allclose(tablo['median'], 2.0)  # %1, %2, %3
+    assert (tablo['magaza_sayisi'] == 3).all()
+    
+    sem.save_detay_to_supabase(client, _magaza_kayitlari('5004', 8))
+    assert np.allclose(sem.get_urun_medianlari('202610', client)['median'], 2.5)
+    assert sem.get_urun_medianlari('202610') is None
+
+
+def test_medyan_istemcisiz_ilk_yukleme_kismi_tablo_yazmaz(medyan_dir):
+    assert sem.guncelle_urun_medianlari('202610', _magaza_kayitlari('5001', 1)) is None
+    assert sem.get_urun_medianlari('202610') is None
+
+
+def _risk_magazasi():
+    # Her satır bir kritere düşer (kronik açık / fire manipülasyonu gereği örtüşür)
+    satirlar = [
+        # kod, ad, env, sayım, fark, fire, satış, iptal
+        ('A1', 'DOMATES', 1, 3.3, -300.0, 0.0, 1000.0, 0.0),    # bölge sapma (%30 > 1.5 × %10)
+        ('A2', 'EKMEK', 1, 2.2, 0.0, 0.0, 400.0, -200.0),       # satır iptali
+        ('A3', 'PILIC BUT', 2, 4.4, -200.0, 0.0, 800.0, 0.0),   # kronik açık + fire manipülasyonu
+        ('A4', 'SUT', 2, 6.1, 0.0, -100.0, 800.0, 0.0),         # kronik fire
+        ('A5', 'ELMA', 1, 80.5, 0.0, 0.0, 300.0, 0.0),          # anormal miktar
+        ('A6', 'PATATES', 1, 150.5, 0.0, 0.0, 300.0, 0.0),      # istisna: eşik 200
+        ('A7', 'MUZ', 2, 10.2, 0.0, 0.0, 300.0, 0.0),           # tekrar miktar (%2)
+        ('A8', 'SOGAN', 1, 20.0, 0.0, 0.0, 300.0, 0.0),         # yuvarlak sayı
+    ]
+    df = pd.DataFrame(satirlar, columns=['Malzeme Kodu', 'Malzeme Tanımı', 'Envanter Sayisi', 'Sayım Miktarı',
+                                         'Fark Tutarı', 'Fire Tutarı', 'Satış Hasılatı', 'İptal Satır Tutarı'])
+    df.insert(0, 'Mağaza Kodu', '5001')
+    df.insert(1, 'Mağaza Adı', 'TEST')
+    
+    df_onceki = pd.DataFrame({
+        'malzeme_kodu': ['A3', 'A4', 'A7'],
+        'envanter_sayisi': [1, 1, 1],
+        'fark_tutari': [-50.0, 0.0, 0.0],
+        'fire_tutari': [0.0, -20.0, 0.0],
+        'sayim_miktari': [1.0, 1.0, 10.0],
+    })
+    urun_medianlar = {'A1': {'median': 10.0}, 'A2': {'median': 0.0}}
+    return df, df_onceki, urun_medianlar
+
+
+@pytest.mark.parametrize('onceki', [False, True])
+@pytest.mark.parametrize('medyan', [False, True])
+def test_risk_skoru_eski_satir_dongusuyle_ayni(onceki, medyan):
+    df, df_onceki, urun_medianlar = _risk_magazasi()
+    df_onceki = df_onceki if onceki else None
+    urun_medianlar = urun_medianlar if medyan else None
+    
+    eski = legacy_hesapla_risk_skoru(df, df_onceki, urun_medianlar)
+    yeni = sem.hesapla_risk_skoru(df, df_onceki, urun_medianlar)
+    assert yeni == eski
+    
+    # Her kriter fixture'da en az bir kez tetiklenir (önceki / medyan verisi varsa)
+    for kriter in ['satir_iptali', 'anormal_miktar', 'yuvarlak_sayi']:
+        assert eski['detaylar'][kriter]['detay']
+    assert bool(eski['detaylar']['bolge_sapma']['detay']) == medyan
+    for kriter in ['kronik_acik', 'kronik_fire', 'fire_manipulasyon', 'tekrar_miktar']:
+        assert bool(eski['detaylar'][kriter]['detay']) == onceki
+    
+    # detay=False: aynı puanlar, detaylar risk_frame'den talep üzerine
+    puan = sem.hesapla_risk_skoru(df, df_onceki, urun_medianlar, detay=False)
+    assert (puan['toplam_puan'], puan['seviye'], puan['emoji']) == (eski['toplam_puan'], eski['seviye'], eski['emoji'])
+    for kriter, beklenen in eski['detaylar'].items():
+        d = puan['detaylar'][kriter]
+        assert (d['puan'], d['max'], d['aciklama'], d['detay']) == (beklenen['puan'], beklenen['max'],
+                                                                    beklenen['aciklama'], [])
+        assert sem.risk_detay(puan['risk_frame'], kriter) == beklenen['detay']
+
+
+def _bolge():
+    # İki mağaza: 5001 tüm kriterler, 5002 sadece miktar kriterleri ve farklı önceki kayıtlar
+    df1, onceki1, urun_medianlar = _risk_magazasi()
+    df2 = df1.iloc[4:].copy()
+    df2['Mağaza Kodu'] = '5002'
+    df2['Mağaza Adı'] = 'TEST 2'
+    df2['İptal Satır Tutarı'] = 0.0
+    onceki2 = onceki1.assign(sayim_miktari=[1.0, 1.0, 50.0])
+    df = pd.concat([df1, df2], ignore_index=True)
+    df_onceki = pd.concat([onceki1.assign(magaza_kodu='5001'), onceki2.assign(magaza_kodu='5002')],
+                          ignore_index=True)
+    return df, df_onceki, urun_medianlar
+
+
+def test_bolge_risk_magaza_bazli_skorla_ayni():
+    df, df_onceki, urun_medianlar = _bolge()
+    bolge = sem.hesapla_bolge_risk_skorlari(df, df_onceki, urun_medianlar).set_index('Mağaza Kodu')
+    
+    assert sorted(bolge.index) == ['5001', '5002']
+    for magaza in ['5001', '5002']:
+        tekil = sem.hesapla_risk_skoru(df[df['Mağaza Kodu'] == magaza],
+                                       df_onceki[df_onceki['magaza_kodu'] == magaza], urun_medianlar, detay=False)
+        satir = bolge.loc[magaza]
+        assert satir['Toplam'] == tekil['toplam_puan']
+        assert (satir['Seviye'], satir['Emoji']) == (tekil['seviye'], tekil['emoji'])
+        for kriter, d in tekil['detaylar'].items():
+            assert satir[kriter] == d['puan'], (magaza, kriter)
+    assert bolge.loc['5001', 'Toplam'] > bolge.loc['5002', 'Toplam'] > 0
+
+
+def test_bolge_verisi_supabase_kayitlarindan(tmp_path, monkeypatch):
+    monkeypatch.setattr(sem, 'MEDYAN_DIR', str(tmp_path))
+    df, _, _ = _bolge()
+    client = StubSupabase()
+    onceki = df.assign(**{'Envanter Sayisi': 1, 'Fark Tutarı': 0.0, 'Fire Tutarı': 0.0, 'Envanter Dönemi': '202610'})
+    sem.save_detay_to_supabase(client, sem.prepare_detay_kayitlar(onceki))
+    son = df.assign(**{'Envanter Sayisi': 2, 'Envanter Dönemi': '202610'})
+    sem.save_detay_to_supabase(client, sem.prepare_detay_kayitlar(son))
+    
+    df_bolge, df_onceki = sem.get_bolge_surekli_verisi(client, '202610')
+    assert len(df_bolge) == len(df) and (df_bolge['Envanter Sayisi'] == 2).all()
+    
+    beklenen = sem.hesapla_bolge_risk_skorlari(son, pd.DataFrame(sem.prepare_detay_kayitlar(onceki)))
+    pd.testing.assert_frame_equal(sem.hesapla_bolge_risk_skorlari(df_bolge, df_onceki), beklenen)
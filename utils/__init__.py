@@ -7,3 +7,11 @@ from .helpers import (
     is_quantity_similar
 )
 from .data_filters import filter_data
+from .records import to_json_column, frame_to_records, iter_record_chunks
+from .text import (
+    normalize_tr_text,
+    normalize_tr_column,
+    add_normalized_columns,
+    get_normalized,
+    tr_contains
+)
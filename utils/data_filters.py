@@ -5,11 +5,15 @@ import pandas as pd
 
 
 def filter_data(df, satis_muduru=None, donemler=None, magaza_kodu=None):
-    """DataFrame'i filtrele"""
+    """
+    DataFrame'i filtrele
+    Kaynak frame kopyalanmaz (paylaşılan salt-okunur frame ile kullanılır):
+    filtre varsa sadece seçilen satırlar, yoksa veri paylaşan sığ kopya döner
+    """
     if df is None or df.empty:
         return pd.DataFrame()
     
-    filtered = df.copy()
+    filtered = df.copy(deep=False)
     
     if satis_muduru and 'Satış Müdürü' in filtered.columns:
         filtered = filtered[filtered['Satış Müdürü'] == satis_muduru]
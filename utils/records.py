@@ -0,0 +1,68 @@
+# ==================== RECORDS ====================
+# DataFrame → Supabase kayıt dönüşümü (kolon bazlı, satır döngüsü yok)
+
+import pandas as pd
+from pandas.api import types as ptypes
+
+
+def to_json_column(s):
+    """
+    Tek kolonu JSON'a hazır object Series'e çevir
+    - NaN/NaT → None
+    - Tarih → 'YYYY-MM-DD'
+    - numpy int/float/bool → Python int/float/bool
+    """
+    if ptypes.is_datetime64_any_dtype(s):
+        out = s.dt.strftime('%Y-%m-%d').astype(object)
+        return out.where(s.notna(), None)
+    
+    if ptypes.is_bool_dtype(s) or ptypes.is_integer_dtype(s) or ptypes.is_float_dtype(s):
+        # astype(object) numpy skalerleri Python tiplerine kutular
+        return s.astype(object).where(s.notna(), None)
+    
+    # Object kolon: tip karışıksa önce numeric/tarih olarak normalize et
+    kind = pd.api.types.infer_dtype(s, skipna=True)
+    if kind in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+        return to_json_column(pd.to_numeric(s, errors='coerce'))
+    if kind in ('datetime', 'datetime64', 'date'):
+        return to_json_column(pd.to_datetime(s, errors='coerce'))
+    if kind in ('string', 'empty', 'boolean'):
+        return s.astype(object).where(s.notna(), None)
+    
+    return s.map(_json_scalar, na_action='ignore').astype(object).where(s.notna(), None)
+
+
+def _json_scalar(val):
+    """Karışık tipli object kolonlar için tek değer dönüşümü"""
+    if isinstance(val, pd.Timestamp):
+        return val.strftime('%Y-%m-%d')
+    if hasattr(val, 'item'):
+        return val.item()
+    return val
+
+
+def prepare_record_frame(df, col_mapping=None):
+    """
+    Kolonları eşle (varsa col_mapping sırasıyla, sadece mevcut kolonlar)
+    ve her kolonu JSON'a hazır hale getir
+    """
+    if col_mapping:
+        cols = [c for c in col_mapping if c in df.columns]
+        df = df[cols].rename(columns=col_mapping)
+    
+    return pd.DataFrame({col: to_json_column(df[col]) for col in df.columns}, index=df.index)
+
+
+def frame_to_records(df, col_mapping=None):
+    """DataFrame → list[dict] (Supabase insert/upsert için)"""
+    return prepare_record_frame(df, col_mapping).to_dict('records')
+
+
+def iter_record_chunks(df, chunk_size=500, col_mapping=None):
+    """
+    DataFrame'i JSON'a hazır kayıt parçaları olarak üret
+    Dönüşüm bir kez yapılır; dict'ler parça parça oluşturulur (düşük bellek)
+    """
+    prepared = prepare_record_frame(df, col_mapping)
+    for i in range(0, len(prepared), chunk_size):
+        yield prepared.iloc[i:i + chunk_size].to_dict('records')
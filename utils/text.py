@@ -0,0 +1,78 @@
+# ==================== TEXT NORMALIZATION ====================
+# Türkçe metin normalizasyonu - dedektörler ve sürekli envanter için ortak katman
+# Kolonlar categorical'a çevrilir: her farklı metin bir kez normalize edilir
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Büyük harfe çevrildikten sonra uygulanan Türkçe sadeleştirme tablosu
+TR_FOLD_TABLE = str.maketrans({'İ': 'I', 'Ş': 'S', 'Ğ': 'G', 'Ü': 'U', 'Ö': 'O', 'Ç': 'C', 'ı': 'I'})
+
+# Normalize edilip frame üzerinde cache'lenen metin kolonları
+NORMALIZE_COLUMNS = ['Malzeme Tanımı', 'Malzeme Adı', 'Mal Grubu Tanımı', 'Ürün Grubu', 'Ürün Grubu Tanımı', 'Ana Grup']
+
+
+@lru_cache(maxsize=65536)
+def normalize_tr_text(value):
+    """Tek değer: büyük harf + Türkçe karakter sadeleştirme (Sigara ve Tütün → SIGARA VE TUTUN)"""
+    return str(value).upper().translate(TR_FOLD_TABLE)
+
+
+def norm_col(col):
+    """Normalize kolonun frame üzerindeki adı"""
+    return f'_norm_{col}'
+
+
+def normalize_tr_column(s):
+    """
+    Kolonu normalize et → categorical Series
+    Her farklı değer bir kez çevrilir; boş değerler ''
+    """
+    codes, uniques = pd.factorize(s)
+    normalized = np.array([normalize_tr_text(v) for v in uniques] + [''], dtype=object)
+    
+    # Farklı yazımlar aynı metne düşebilir (Sigara / SİGARA) → kategoriler tekilleştirilir
+    categories, inverse = np.unique(normalized, return_inverse=True)
+    return pd.Series(pd.Categorical.from_codes(inverse[codes], categories=categories),
+                     index=s.index, name=s.name)
+
+
+def add_normalized_columns(df, columns=None):
+    """
+    Metin kolonlarının normalize hallerini frame'e ekle (_norm_<kolon>, categorical)
+    Zaten eklenmiş kolonlar tekrar hesaplanmaz; eklenecek kolon yoksa frame aynen döner
+    """
+    columns = NORMALIZE_COLUMNS if columns is None else columns
+    eksik = [c for c in columns if c in df.columns and norm_col(c) not in df.columns]
+    if not eksik:
+        return df
+    
+    df = df.copy(deep=False)
+    for col in eksik:
+        df[norm_col(col)] = normalize_tr_column(df[col])
+    return df
+
+
+def get_normalized(df, col):
+    """Kolonun normalize hali - frame'de cache'lenmişse oradan"""
+    if norm_col(col) in df.columns:
+        return df[norm_col(col)]
+    return normalize_tr_column(df[col])
+
+
+def tr_contains(s, pattern, normalized=False):
+    """
+    Normalize metinde regex araması - sadece kategoriler üzerinde çalışır
+    pattern normalize edilmiş yazımla verilmeli (SIGARA|TUTUN)
+    """
+    if not normalized:
+        s = normalize_tr_column(s)
+    
+    categories = s.cat.categories
+    if len(categories) == 0:
+        return pd.Series(False, index=s.index)
+    
+    found = np.append(np.asarray(categories.str.contains(pattern, regex=True), dtype=bool), False)
+    return pd.Series(found[s.cat.codes.to_numpy()], index=s.index)